@@ -0,0 +1,53 @@
+"""
+Compare two benchmark result files.
+
+    python -m bench.compare bench/results/baseline.json bench/results/candidate.json
+"""
+import json
+import sys
+
+
+def _key(result):
+    return (result["scenario"], result.get("pages"), result["concurrency"])
+
+
+def _change(before: float, after: float) -> str:
+    if not before:
+        return "    n/a"
+    return f"{(after - before) / before * 100:+6.1f}%"
+
+
+def compare(baseline, candidate):
+    rows = []
+    before = {_key(result): result for result in baseline["results"]}
+    for result in candidate["results"]:
+        old = before.get(_key(result))
+        if old is None:
+            continue
+        rows.append((
+            _key(result),
+            _change(old["throughput_rps"], result["throughput_rps"]),
+            _change(old["latency_ms"]["p50"], result["latency_ms"]["p50"]),
+            _change(old["latency_ms"]["p99"], result["latency_ms"]["p99"]),
+            _change(old["peak_rss_mb"], result["peak_rss_mb"]),
+            result["errors"] - old["errors"],
+        ))
+    return rows
+
+
+def main(argv):
+    if len(argv) != 2:
+        print(__doc__)
+        return 2
+    with open(argv[0]) as f:
+        baseline = json.load(f)
+    with open(argv[1]) as f:
+        candidate = json.load(f)
+    print(f"{'scenario':14} {'pages':>5} {'c':>3}  {'req/s':>7}  {'p50':>7}  {'p99':>7}  {'rss':>7}  errors")
+    for (scenario, pages, concurrency), throughput, p50, p99, rss, errors in compare(baseline, candidate):
+        print(f"{scenario:14} {pages or '':>5} {concurrency:>3}  {throughput}  {p50}  {p99}  {rss}  {errors:+d}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
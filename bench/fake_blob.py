@@ -0,0 +1,207 @@
+"""
+In-process stand-ins for the Azure Blob Storage service clients.
+
+FakeBlobServiceClient and FakeAsyncBlobServiceClient implement the part of
+the azure-storage-blob API the app uses, on top of one in-memory
+FakeBlobStore, and raise the SDK's own exceptions. Every request can be
+given a fixed latency to stand in for the network.
+"""
+import asyncio
+import datetime
+import hashlib
+import threading
+import time
+from types import SimpleNamespace
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError, ResourceNotModifiedError
+
+
+class FakeBlobStore:
+    def __init__(self) -> None:
+        self.containers = {}
+        self.requests = 0
+        self.bytes_downloaded = 0
+        self._lock = threading.Lock()
+
+    def put(self, container: str, name: str, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        etag = '"0x' + hashlib.md5(data).hexdigest()[:16].upper() + '"'
+        blob = SimpleNamespace(
+            name=name,
+            data=bytes(data),
+            etag=etag,
+            last_modified=datetime.datetime.now(datetime.timezone.utc),
+            size=len(data),
+        )
+        with self._lock:
+            self.requests += 1
+            self.containers.setdefault(container, {})[name] = blob
+        return blob
+
+    def get(self, container: str, name: str):
+        with self._lock:
+            self.requests += 1
+            blob = self.containers.get(container, {}).get(name)
+        if blob is None:
+            raise ResourceNotFoundError(f"The specified blob does not exist: {container}/{name}")
+        return blob
+
+    def download(self, container: str, name: str, offset=None, length=None, etag=None, match_condition=None):
+        blob = self.get(container, name)
+        if match_condition == MatchConditions.IfModified and etag == blob.etag:
+            raise ResourceNotModifiedError("The condition specified using HTTP conditional header(s) is not met.")
+        start = offset or 0
+        end = blob.size if length is None else min(start + length, blob.size)
+        data = blob.data[start:end]
+        with self._lock:
+            self.bytes_downloaded += len(data)
+        return SimpleNamespace(data=data, properties=SimpleNamespace(etag=blob.etag, size=blob.size))
+
+    def delete(self, container: str, name: str):
+        with self._lock:
+            self.requests += 1
+            if self.containers.get(container, {}).pop(name, None) is None:
+                raise ResourceNotFoundError(f"The specified blob does not exist: {container}/{name}")
+
+    def list(self, container: str, starts_with=None):
+        with self._lock:
+            self.requests += 1
+            blobs = list(self.containers.get(container, {}).values())
+        return sorted(
+            (blob for blob in blobs if not starts_with or blob.name.startswith(starts_with)),
+            key=lambda blob: blob.name,
+        )
+
+    def create_container(self, container: str):
+        with self._lock:
+            if container in self.containers:
+                raise ResourceExistsError(f"The specified container already exists: {container}")
+            self.containers[container] = {}
+
+
+class _Download:
+    def __init__(self, result) -> None:
+        self._data = result.data
+        self.properties = result.properties
+
+    def readall(self):
+        return self._data
+
+
+class _AsyncDownload(_Download):
+    async def readall(self):
+        return self._data
+
+
+def _properties(blob):
+    return SimpleNamespace(name=blob.name, etag=blob.etag, last_modified=blob.last_modified, size=blob.size)
+
+
+class FakeBlobClient:
+    def __init__(self, service, container: str, blob: str) -> None:
+        self.service = service
+        self.container = container
+        self.blob = blob
+
+    def download_blob(self, offset=None, length=None, etag=None, match_condition=None, **kwargs):
+        self.service.wait()
+        return _Download(self.service.store.download(self.container, self.blob, offset, length, etag, match_condition))
+
+    def upload_blob(self, data, overwrite=False, **kwargs):
+        self.service.wait()
+        blob = self.service.store.put(self.container, self.blob, data)
+        return {"etag": blob.etag, "last_modified": blob.last_modified}
+
+
+class FakeContainerClient:
+    def __init__(self, service, container: str) -> None:
+        self.service = service
+        self.container = container
+
+    def download_blob(self, blob, **kwargs):
+        return FakeBlobClient(self.service, self.container, blob).download_blob(**kwargs)
+
+    def list_blob_names(self, name_starts_with=None, **kwargs):
+        self.service.wait()
+        return iter([blob.name for blob in self.service.store.list(self.container, name_starts_with)])
+
+    def list_blobs(self, name_starts_with=None, **kwargs):
+        self.service.wait()
+        return iter([_properties(blob) for blob in self.service.store.list(self.container, name_starts_with)])
+
+    def create_container(self, **kwargs):
+        self.service.wait()
+        self.service.store.create_container(self.container)
+
+    def delete_blob(self, blob, **kwargs):
+        self.service.wait()
+        self.service.store.delete(self.container, blob)
+
+
+class FakeBlobServiceClient:
+    def __init__(self, store: FakeBlobStore, latency: float = 0.0) -> None:
+        self.store = store
+        self.latency = latency
+
+    def wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get_container_client(self, container):
+        return FakeContainerClient(self, container)
+
+    def get_blob_client(self, container, blob):
+        return FakeBlobClient(self, container, blob)
+
+    def close(self):
+        pass
+
+
+class FakeAsyncBlobClient(FakeBlobClient):
+    async def download_blob(self, offset=None, length=None, etag=None, match_condition=None, **kwargs):
+        await self.service.wait()
+        return _AsyncDownload(self.service.store.download(self.container, self.blob, offset, length, etag, match_condition))
+
+    async def upload_blob(self, data, overwrite=False, **kwargs):
+        await self.service.wait()
+        blob = self.service.store.put(self.container, self.blob, data)
+        return {"etag": blob.etag, "last_modified": blob.last_modified}
+
+
+class FakeAsyncContainerClient(FakeContainerClient):
+    async def download_blob(self, blob, **kwargs):
+        return await FakeAsyncBlobClient(self.service, self.container, blob).download_blob(**kwargs)
+
+    async def list_blob_names(self, name_starts_with=None, **kwargs):
+        await self.service.wait()
+        for blob in self.service.store.list(self.container, name_starts_with):
+            yield blob.name
+
+    async def list_blobs(self, name_starts_with=None, **kwargs):
+        await self.service.wait()
+        for blob in self.service.store.list(self.container, name_starts_with):
+            yield _properties(blob)
+
+    async def create_container(self, **kwargs):
+        await self.service.wait()
+        self.service.store.create_container(self.container)
+
+    async def delete_blob(self, blob, **kwargs):
+        await self.service.wait()
+        self.service.store.delete(self.container, blob)
+
+
+class FakeAsyncBlobServiceClient(FakeBlobServiceClient):
+    async def wait(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def get_container_client(self, container):
+        return FakeAsyncContainerClient(self, container)
+
+    def get_blob_client(self, container, blob):
+        return FakeAsyncBlobClient(self, container, blob)
+
+    async def close(self):
+        pass
@@ -0,0 +1,118 @@
+"""
+Local stand-in for an Azure OpenAI chat completions deployment.
+
+Serves POST /openai/deployments/{deployment}/chat/completions on
+127.0.0.1, with a configurable latency (plus a per-output-token delay) and
+a share of requests answered with 429 and a retry-after-ms header, so the
+completion dispatcher's backoff and budgets run as they would against
+Azure. JSON-mode requests get a small {columns, response} table; streamed
+requests get SSE chunks and a final usage chunk.
+"""
+import asyncio
+import json
+import random
+import time
+from aiohttp import web
+
+COLUMNS = [
+    {"title": "Index", "dataIndex": "index", "key": "1"},
+    {"title": "Address", "dataIndex": "address", "key": "2"},
+    {"title": "Status", "dataIndex": "status", "key": "3"},
+]
+
+
+def _prompt_tokens(messages):
+    return sum(len(str(message.get("content", ""))) for message in messages) // 4 + 4 * len(messages)
+
+
+def _answer(body, rng):
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        rows = [
+            {
+                "index": i + 1,
+                "address": f"{rng.randint(1, 9999)} Market St",
+                "city": "San Francisco",
+                "state": "CA",
+                "zipcode": "94110",
+                "party": f"Applicant {rng.randint(1, 500)}",
+                "status": rng.choice(["APPROVED", "DENIED", "PENDING"]),
+                "remarks": "",
+                "summary": "Synthetic agenda item.",
+            }
+            for i in range(rng.randint(2, 6))
+        ]
+        return json.dumps({"columns": COLUMNS, "response": rows})
+    return "The commission approved most items on the agenda. " * 4
+
+
+class FakeOpenAIServer:
+    def __init__(self, latency: float = 0.5, per_token: float = 0.0, rate_429: float = 0.0, retry_after_ms: int = 500, seed: int = 0) -> None:
+        self.latency = latency
+        self.per_token = per_token
+        self.rate_429 = rate_429
+        self.retry_after_ms = retry_after_ms
+        self.rng = random.Random(seed)
+        self.stats = {"requests": 0, "throttled": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        self.port = None
+        self._runner = None
+
+    @property
+    def api_base(self) -> str:
+        return f"http://127.0.0.1:{self.port}/"
+
+    async def start(self):
+        app = web.Application(client_max_size=256 * 1024 * 1024)
+        app.router.add_post("/openai/deployments/{deployment}/chat/completions", self.completions)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def completions(self, request):
+        body = await request.json()
+        self.stats["requests"] += 1
+        if self.rng.random() < self.rate_429:
+            self.stats["throttled"] += 1
+            return web.json_response(
+                {"error": {"code": "429", "message": "Requests to the deployment have exceeded the rate limit."}},
+                status=429,
+                headers={"retry-after-ms": str(self.retry_after_ms), "retry-after": str(max(1, self.retry_after_ms // 1000))},
+            )
+        content = _answer(body, self.rng)
+        usage = {
+            "prompt_tokens": _prompt_tokens(body.get("messages", [])),
+            "completion_tokens": len(content) // 4,
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        self.stats["prompt_tokens"] += usage["prompt_tokens"]
+        self.stats["completion_tokens"] += usage["completion_tokens"]
+        await asyncio.sleep(self.latency)
+        base = {"id": f"chatcmpl-{self.stats['requests']}", "created": int(time.time()), "model": "gpt-4o-mini"}
+        if not body.get("stream"):
+            await asyncio.sleep(self.per_token * usage["completion_tokens"])
+            return web.json_response({
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                "usage": usage,
+            })
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        words = content.split(' ')
+        for i, word in enumerate(words):
+            delta = word if i == len(words) - 1 else word + ' '
+            chunk = {**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]}
+            await response.write(f'data: {json.dumps(chunk)}\n\n'.encode('utf-8'))
+            await asyncio.sleep(self.per_token * max(1, len(delta) // 4))
+        final = {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}
+        await response.write(f'data: {json.dumps(final)}\n\n'.encode('utf-8'))
+        await response.write(b'data: [DONE]\n\n')
+        await response.write_eof()
+        return response
@@ -0,0 +1,317 @@
+"""
+Offline benchmark of the API.
+
+Runs the real FastAPI app in-process (through httpx's ASGI transport)
+against a FakeBlobStore and a local fake Azure OpenAI deployment, and
+measures throughput, p50/p99 latency and peak RSS (this process plus the
+PDF workers) per scenario and concurrency level. Results are written as
+JSON so runs can be compared with bench/compare.py.
+
+    python -m bench.run --concurrency 1,4,16 --pages 5,50 --llm-429-rate 0.05
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+SCENARIOS = ("wipplaces", "extract_text", "chat_explore", "wipindex_all")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=','.join(SCENARIOS), help="Comma separated subset of " + ', '.join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,4,16", help="Concurrency levels")
+    parser.add_argument("--requests", type=int, default=32, help="Requests per scenario and level")
+    parser.add_argument("--pages", default="5,50", help="Page counts of the PDFs uploaded to /extract_text")
+    parser.add_argument("--places", type=int, default=2)
+    parser.add_argument("--departments", type=int, default=2)
+    parser.add_argument("--meetings", type=int, default=12, help="Meetings per place and department")
+    parser.add_argument("--source-pages", type=int, default=5, help="Pages of each seeded source PDF")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds per completion")
+    parser.add_argument("--llm-per-token", type=float, default=0.0, help="Extra seconds per completion token")
+    parser.add_argument("--llm-429-rate", type=float, default=0.0, help="Share of completions answered with 429")
+    parser.add_argument("--llm-retry-after-ms", type=int, default=500)
+    parser.add_argument("--blob-latency", type=float, default=0.01, help="Seconds per blob request")
+    parser.add_argument("--tpm", type=int, default=0, help="WJ_OPENAI_TPM for the app under test")
+    parser.add_argument("--rpm", type=int, default=0, help="WJ_OPENAI_RPM for the app under test")
+    parser.add_argument("--quick", action="store_true", help="Small run for CI smoke checks")
+    parser.add_argument("--output", default=None, help="Result file (default bench/results/<timestamp>.json)")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.concurrency = "1,4"
+        args.requests = 8
+        args.pages = "5"
+        args.meetings = 4
+        args.llm_latency = 0.05
+    args.scenarios = [name for name in args.scenarios.split(',') if name]
+    args.concurrency = [int(level) for level in args.concurrency.split(',')]
+    args.pages = [int(pages) for pages in args.pages.split(',')]
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"Unknown scenario {name}")
+    return args
+
+
+def configure_environment(args, api_base: str, workdir: str):
+    # Must run before the app is imported: clients are built at import time
+    os.environ.update({
+        "WJ_OPENAI_API_BASE": api_base,
+        "WJ_OPENAI_API_KEY": "bench",
+        "GPT4oMiniV_API_VERSION": "2024-08-01-preview",
+        "WJ_DEPLOYMENT_NAME_4omini": "gpt-4o-mini",
+        "WJ_OPENAI_TPM": str(args.tpm),
+        "WJ_OPENAI_RPM": str(args.rpm),
+        "WJ_BLOB_CONNECTION_STRING": "UseDevelopmentStorage=true",
+        # Every request reaches the fake deployment
+        "WJ_RESPONSE_CACHE_PATH": "",
+        "WJ_CACHE_BACKEND": "local",
+        "WJ_JOBS_PATH": os.path.join(workdir, "jobs.sqlite3"),
+        "WJ_RECORDS_PATH": os.path.join(workdir, "records.sqlite3"),
+        "WJ_INDEX_SNAPSHOT_PATH": os.path.join(workdir, "index_snapshot.json"),
+        "WJ_PLACES_TTL": "3600",
+    })
+
+
+def load_app(store, blob_latency: float):
+    from bench.fake_blob import FakeBlobServiceClient, FakeAsyncBlobServiceClient
+    from src.client_models.blobstorage_client import BlobStorageClient, AsyncBlobStorageClient
+    import src.connectors.clients as clients
+    clients.blobstorage_client = BlobStorageClient(service_client=FakeBlobServiceClient(store, blob_latency))
+    clients.async_blobstorage_client = AsyncBlobStorageClient(service_client=FakeAsyncBlobServiceClient(store, blob_latency))
+    import src.api.main as main
+    return main
+
+
+def _rss_kb(pid) -> int:
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+class RssSampler:
+    """Peak resident memory of this process plus its children (the PDF pool), sampled every interval."""
+    def __init__(self, interval: float = 0.05) -> None:
+        self.interval = interval
+        self.peak_kb = 0
+        self._task = None
+
+    def sample(self):
+        pids = [os.getpid()] + [child.pid for child in multiprocessing.active_children()]
+        self.peak_kb = max(self.peak_kb, sum(_rss_kb(pid) for pid in pids))
+
+    async def _run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self):
+        self.peak_kb = 0
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def __exit__(self, *exc_info):
+        self._task.cancel()
+        self.sample()
+        if not self.peak_kb:
+            # No /proc: fall back to the lifetime peak of this process
+            self.peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return False
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+async def run_level(name: str, call, concurrency: int, total: int, **info):
+    """
+    Issue total calls of call(i) with at most concurrency in flight. A call
+    that returns a number of seconds is timed by that instead of by the
+    request's wall time.
+    """
+    latencies = []
+    errors = []
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                seconds = await call(i)
+                latencies.append(seconds if seconds is not None else time.perf_counter() - start)
+            except Exception as e:
+                errors.append(f'{type(e).__name__}: {e}')
+
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        wall = time.perf_counter() - started
+    result = {
+        "scenario": name,
+        **info,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:5],
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 3) if wall else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 1),
+            "p99": round(percentile(latencies, 0.99) * 1000, 1),
+            "mean": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0.0,
+            "max": round(max(latencies) * 1000, 1) if latencies else 0.0,
+        },
+        "peak_rss_mb": round(rss.peak_kb / 1024, 1),
+    }
+    print(f"{name:14} {json.dumps(info) if info else '':14} c={concurrency:<3} "
+          f"{result['throughput_rps']:8.2f} req/s  p50 {result['latency_ms']['p50']:8.1f} ms  "
+          f"p99 {result['latency_ms']['p99']:8.1f} ms  rss {result['peak_rss_mb']:7.1f} MB  errors {len(errors)}")
+    return result
+
+
+def check(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f'{response.request.url.path} returned {response.status_code}: {response.text[:200]}')
+    return response
+
+
+async def wait_for_job(client, job_id: str, poll: float = 0.05):
+    while True:
+        status = check(await client.get(f'/task-status/{job_id}')).json()["status"]
+        if status["status"] in ("done", "failed", "cancelled"):
+            if status["status"] != "done":
+                raise RuntimeError(f'Job {job_id} {status["status"]}: {status["error"]}')
+            return status
+        await asyncio.sleep(poll)
+
+
+async def run_scenarios(args, client, seeded):
+    from bench.synthetic import make_minutes_pdf
+    results = []
+    for name in args.scenarios:
+        for concurrency in args.concurrency:
+            if name == "wipplaces":
+                async def call(i):
+                    check(await client.get("/wipplaces"))
+                results.append(await run_level(name, call, concurrency, args.requests))
+            elif name == "extract_text":
+                for pages in args.pages:
+                    # Distinct documents, so completions are not coalesced
+                    pdfs = [make_minutes_pdf(pages, seed=1000 * pages + i) for i in range(args.requests)]
+
+                    async def call(i, pdfs=pdfs, pages=pages):
+                        files = {"file": (f"bench_{pages}p_{concurrency}_{i}.pdf", pdfs[i], "application/pdf")}
+                        check(await client.post("/extract_text", files=files))
+                    results.append(await run_level(name, call, concurrency, args.requests, pages=pages))
+            elif name == "chat_explore":
+                async def call(i):
+                    options = {
+                        "places": [seeded["places"][i % len(seeded["places"])]],
+                        "departments": seeded["departments"],
+                        "time": seeded["dates"][0][:4],
+                    }
+                    plan = check(await client.post("/chat_explore", files={"options": (None, json.dumps(options))})).json()
+                    for batch in plan["plan"]:
+                        await wait_for_job(client, batch["job_id"])
+                        check(await client.post("/chat", data={
+                            "key": batch["batch_id"],
+                            "question": f"Which appeals were denied? ({i})",
+                            "is_table": "false",
+                        }))
+                results.append(await run_level(name, call, concurrency, args.requests))
+            elif name == "wipindex_all":
+                # Whole-place rebuilds are long; a few per level is enough.
+                # Timed by the job's own timestamps, so time spent queued
+                # behind another rebuild and the wait= polling are left out
+                async def call(i):
+                    job = check(await client.post("/wipindex/all", data={
+                        "place_name": seeded["places"][i % len(seeded["places"])],
+                        "wait": "true",
+                        "force": "true",
+                    })).json()
+                    if job["status"] != "done":
+                        raise RuntimeError(f'Job {job["job_id"]} {job["status"]}: {job["error"]}')
+                    return job["finished"] - job["started"]
+                results.append(await run_level(name, call, concurrency, max(concurrency, min(args.requests, 4))))
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args):
+    import httpx
+    from bench.fake_blob import FakeBlobStore
+    from bench.fake_openai import FakeOpenAIServer
+    from bench.synthetic import seed_store
+
+    llm = await FakeOpenAIServer(
+        latency=args.llm_latency,
+        per_token=args.llm_per_token,
+        rate_429=args.llm_429_rate,
+        retry_after_ms=args.llm_retry_after_ms,
+    ).start()
+    workdir = tempfile.mkdtemp(prefix="wj-bench-")
+    configure_environment(args, llm.api_base, workdir)
+    store = FakeBlobStore()
+    seeded = seed_store(store, args.places, args.departments, args.meetings, args.source_pages)
+    app_module = load_app(store, args.blob_latency)
+
+    await app_module.startup()
+    manager = app_module.azure_manager
+    while not app_module.index_ready():
+        await asyncio.sleep(0.05)
+    try:
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            results = await run_scenarios(args, client, seeded)
+    finally:
+        await app_module.shutdown()
+        await llm.stop()
+
+    report = {
+        "started": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "fake_openai": llm.stats,
+        "fake_blob": {"requests": store.requests, "bytes_downloaded": store.bytes_downloaded},
+        "dispatcher": manager.chat_client.dispatcher.stats,
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        os.path.dirname(__file__), "results", datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {output}")
+    return report
+
+
+if __name__ == "__main__":
+    report = asyncio.run(main(parse_args()))
+    sys.exit(1 if any(result["errors"] for result in report["results"]) else 0)
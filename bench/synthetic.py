@@ -0,0 +1,121 @@
+"""
+Synthetic meeting minutes: text, PDFs and a seeded blob store.
+
+The PDFs are written by hand (Helvetica text, one content stream per page)
+so the benchmark needs nothing beyond the app's own dependencies, and
+pypdf extracts them the same way it does real minutes.
+"""
+import datetime
+import json
+import random
+from src.utils.minutes_format import encode_minutes_index
+
+STREETS = ["Market St", "Mission St", "Valencia St", "Folsom St", "Castro St", "Divisadero St", "Geary Blvd"]
+OUTCOMES = ["APPROVED", "DENIED", "CONTINUED to a future hearing", "APPROVED with conditions"]
+LINES_PER_PAGE = 50
+
+
+def minutes_lines(pages: int, seed: int = 0):
+    rng = random.Random(seed)
+    lines = ["CITY PLANNING COMMISSION", "MINUTES OF THE REGULAR MEETING", ""]
+    item = 1
+    while len(lines) < pages * LINES_PER_PAGE:
+        address = f"{rng.randint(10, 4999)} {rng.choice(STREETS)}"
+        lines.append(f"{item}. {rng.randint(2020, 2024)}-{rng.randint(1000, 9999)}CUA  {address}, San Francisco, CA 941{rng.randint(10, 34)}")
+        lines.append(f"Request for Conditional Use Authorization by Applicant {rng.randint(1, 500)} LLC to")
+        lines.append("establish a new use in the existing building within the Neighborhood Commercial District.")
+        for _ in range(rng.randint(3, 8)):
+            lines.append(rng.choice([
+                "SPEAKERS: Members of the public spoke in support of the project.",
+                "SPEAKERS: Neighbors raised concerns about parking and noise.",
+                "The project sponsor described the proposed hours of operation.",
+                "Commissioners asked about the community outreach that was done.",
+                "Staff recommended approval with the standard conditions.",
+            ]))
+        lines.append(f"ACTION: {rng.choice(OUTCOMES)}  AYES: {rng.randint(3, 7)}  NAYS: {rng.randint(0, 2)}")
+        lines.append("")
+        item += 1
+    return lines[:pages * LINES_PER_PAGE]
+
+
+def minutes_text(pages: int, seed: int = 0) -> str:
+    return '\n'.join(minutes_lines(pages, seed))
+
+
+def _escape(line: str) -> str:
+    return line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def make_minutes_pdf(pages: int, seed: int = 0) -> bytes:
+    lines = minutes_lines(pages, seed)
+    objects = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(b'')
+    page_tree = add(b'')
+    font = add(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+    kids = []
+    for page in range(pages):
+        text = lines[page * LINES_PER_PAGE:(page + 1) * LINES_PER_PAGE]
+        stream = 'BT /F1 10 Tf 12 TL 50 760 Td\n' + '\n'.join(f'({_escape(line)}) Tj T*' for line in text) + '\nET'
+        stream = stream.encode('latin-1', 'replace')
+        contents = add(b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+        kids.append(add(
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>'
+            % (page_tree, font, contents)
+        ))
+    objects[catalog - 1] = b'<< /Type /Catalog /Pages %d 0 R >>' % page_tree
+    objects[page_tree - 1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(b'%d 0 R' % kid for kid in kids), len(kids))
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for offset in offsets:
+        out += b'%010d 00000 n \n' % offset
+    out += b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, catalog, xref)
+    return bytes(out)
+
+
+def meeting_dates(count: int, start: datetime.date = datetime.date(2024, 1, 4)):
+    return [(start + datetime.timedelta(days=14 * i)).isoformat() for i in range(count)]
+
+
+def seed_store(store, places: int = 2, departments: int = 2, meetings: int = 12, pages: int = 5):
+    """
+    Fill a FakeBlobStore the way production looks: places metadata and
+    source PDFs in wipjar-pdfs, and a packed minutes index per meeting in
+    wipjar-minutes-index.
+
+    Returns:
+        dict: {"places": [...], "departments": [...], "dates": [...]}.
+    """
+    place_names = [f"Place{i + 1}" for i in range(places)]
+    department_names = [f"Planning Commission {i + 1}" for i in range(departments)]
+    dates = meeting_dates(meetings)
+    store.put('wipjar-pdfs', 'metadata.json', json.dumps({"places": place_names}))
+    store.create_container('test-index')
+    seed = 0
+    for place in place_names:
+        store.put('wipjar-pdfs', f'{place}/metadata.json', json.dumps({
+            "departments": [{"name": department} for department in department_names],
+        }))
+        for department in department_names:
+            for date in dates:
+                seed += 1
+                filename = f'{date}_Regular_Meeting.pdf'
+                store.put('wipjar-pdfs', f'{place}/{department}/{filename}', make_minutes_pdf(pages, seed))
+                section = f'{filename} \n' + minutes_text(pages, seed)
+                tokens = len(section) // 4
+                store.put(
+                    'wipjar-minutes-index',
+                    f'{place}/{department}/{date}_{tokens}.txt',
+                    encode_minutes_index([(filename, section, tokens)]),
+                )
+    return {"places": place_names, "departments": department_names, "dates": dates}
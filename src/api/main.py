@@ -1,18 +1,18 @@
 import os
-import tempfile
 from uuid import uuid4
 import asyncio
-import re 
+import hashlib
 import json
+import time
+from contextlib import aclosing
 import aiofiles
 from dotenv import load_dotenv
 load_dotenv()
 
-from fastapi import FastAPI, File, UploadFile, Depends, BackgroundTasks, Form
-from fastapi.responses import JSONResponse, Response, PlainTextResponse
+from fastapi import FastAPI, File, Depends, BackgroundTasks, Form, Request
+from fastapi.responses import JSONResponse, Response, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-
-from pypdf import PdfReader
+from starlette.routing import Match
 
 from src.connectors.managers import (
     AzureManager
@@ -20,27 +20,148 @@ from src.connectors.managers import (
 from src.store.cache import (
     SimpleCache, CacheData, background_clear_cache
 )
+from src.store.cache_backends import LocalCacheBackend
+from src.store.conversations import ConversationStore
+from src.store.index_snapshot import read_snapshot, write_snapshot
+from src.store.records import RecordsStore, rows_from_response
+from src.connectors.index_builder import IndexJob
+from src.jobs.store import JobStore
+from src.jobs.queue import JobQueue
+from src.utils.sse import sse_event, SSE_HEADERS
+from src.utils.retrieval import BM25Index, render_chunks
+from src.utils.batching import plan_batches
+from src.utils.meeting_dates import meeting_date_from_name, normalize_meeting_date
+from src.utils.uploads import receive_upload, receive_uploads, UploadTooLarge
+from src.utils.minutes_format import select_dates
+from src.utils.metrics import REGISTRY, HTTP_REQUEST_SECONDS, current_endpoint
 
 app = FastAPI()
 
 azure_manager = AzureManager()
-PDF_CACHE = SimpleCache()
-CONVERSATION_CACHE = {}
+PDF_CACHE = SimpleCache(
+    "pdf",
+    max_entries=int(os.getenv("WJ_PDF_CACHE_MAX_ENTRIES", "1000")),
+    max_bytes=int(os.getenv("WJ_PDF_CACHE_MAX_MB", "1024")) * 1024 * 1024,
+)
+# A session holds up to a whole batch of context plus its turns
+CONVERSATION_CACHE = SimpleCache(
+    "conversations",
+    max_entries=int(os.getenv("WJ_CHAT_SESSION_MAX_ENTRIES", "500")),
+    max_bytes=int(os.getenv("WJ_CHAT_SESSION_MAX_MB", "256")) * 1024 * 1024,
+)
 ENCOUNTER_SUMMARY_CACHE = {}
 INDEX_CACHE = {}
+# Where INDEX_CACHE was loaded from ("snapshot" or "live") and when
+INDEX_STATE = {"source": None, "loaded_at": None}
+INDEX_SNAPSHOT_PATH = os.getenv("WJ_INDEX_SNAPSHOT_PATH", "data/index_snapshot.json")
+# BM25 indexes over loaded batches, kept next to PDF_CACHE entries
+RETRIEVAL_CACHE = SimpleCache(
+    "retrieval",
+    backend=LocalCacheBackend(max_entries=int(os.getenv("WJ_PDF_CACHE_MAX_ENTRIES", "1000"))),
+)
+# Durable jobs shared by every worker process on the host
+JOBS = JobQueue(
+    JobStore(os.getenv("WJ_JOBS_PATH", "data/jobs.sqlite3")),
+    workers=int(os.getenv("WJ_JOB_WORKERS", "4")),
+)
+JOB_RETENTION_SECONDS = 60 * 60 * 24 * 7
+# Rows extracted by /extract_text, queried by /records
+RECORDS = RecordsStore(os.getenv("WJ_RECORDS_PATH", "data/records.sqlite3"))
+
+CHAT_CONTEXT_TOKENS = int(os.getenv("WJ_CHAT_CONTEXT_TOKENS", "16000"))
+CHAT_TOP_K = int(os.getenv("WJ_CHAT_TOP_K", "40"))
+# /chat sessions, one per batch id, keep this many tokens of earlier turns
+CONVERSATIONS = ConversationStore(
+    CONVERSATION_CACHE,
+    azure_manager.tokenizer.count_batch,
+    history_tokens=int(os.getenv("WJ_CHAT_HISTORY_TOKENS", "4000")),
+    ttl_seconds=int(os.getenv("WJ_CHAT_SESSION_TTL", str(60 * 60 * 4))),
+)
+EXPLORE_BATCH_TOKENS = int(os.getenv("WJ_EXPLORE_BATCH_TOKENS", "100000"))
+# Uploads above UPLOAD_SPOOL_BYTES are spooled to a temporary file
+UPLOAD_SPOOL_BYTES = int(os.getenv("WJ_UPLOAD_SPOOL_MB", "8")) * 1024 * 1024
+UPLOAD_MAX_BYTES = int(os.getenv("WJ_UPLOAD_MAX_MB", "200")) * 1024 * 1024
+UPLOAD_BATCH_MAX_BYTES = int(os.getenv("WJ_UPLOAD_BATCH_MAX_MB", "1024")) * 1024 * 1024
+UPLOAD_BATCH_MAX_FILES = int(os.getenv("WJ_UPLOAD_BATCH_MAX_FILES", "50"))
+# Files being extracted and summarized at once, across all batch uploads
+EXTRACT_SLOTS = asyncio.Semaphore(int(os.getenv("WJ_EXTRACT_CONCURRENCY", "8")))
 
 def get_index_cache():
     return INDEX_CACHE
 
+def index_ready():
+    prefix_index = azure_manager.prefix_index
+    return INDEX_STATE["source"] is not None and all(prefix_index.loaded(name) for name in prefix_index.containers)
+
+async def warm_index():
+    """
+    Load the indexes from blob storage, save them as the next snapshot,
+    then keep the prefix index fresh.
+    """
+    global INDEX_CACHE
+    prefix_index = azure_manager.prefix_index
+    try:
+        await asyncio.to_thread(azure_manager.warm_up)
+    except Exception as e:
+        print('Error warming up clients', e)
+    full_index, complete = await asyncio.gather(azure_manager.get_full_index_async(), prefix_index.load_all())
+    # An empty listing is more likely a failed read than an emptied container
+    if full_index or not INDEX_CACHE:
+        INDEX_CACHE = full_index
+    INDEX_STATE.update(source="live", loaded_at=time.time())
+    print(f'Index warm: {len(INDEX_CACHE)} entries')
+    if complete:
+        try:
+            await asyncio.to_thread(write_snapshot, INDEX_SNAPSHOT_PATH, INDEX_CACHE, prefix_index.snapshot())
+        except OSError as e:
+            print('Error writing index snapshot', e)
+    await prefix_index.run(load_first=False)
+
 @app.on_event("startup")
 async def startup():
     print("Startup Activities")
     '''
-    Load index
+    Load index from the last snapshot; warm_index refreshes it from blob
+    storage in the background, so requests are served right away
     '''
     global INDEX_CACHE 
-    INDEX_CACHE = azure_manager.get_full_index()
-
+    snapshot = await asyncio.to_thread(read_snapshot, INDEX_SNAPSHOT_PATH)
+    if snapshot is not None:
+        INDEX_CACHE = snapshot["full_index"]
+        azure_manager.prefix_index.restore(snapshot["prefix_index"])
+        INDEX_STATE.update(source="snapshot", loaded_at=snapshot["saved_at"])
+    app.state.prefix_index_task = asyncio.create_task(warm_index())
+    await asyncio.to_thread(JOBS.store.prune, JOB_RETENTION_SECONDS)
+    await JOBS.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.prefix_index_task.cancel()
+    # Running jobs go back in the queue for the next process
+    await JOBS.stop()
+    await azure_manager.close()
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness: the indexes are loaded, from the snapshot or from blob
+    storage. 503 until then.
+    """
+    status = {
+        "ready": index_ready(),
+        "index": INDEX_STATE["source"],
+        "index_loaded_at": INDEX_STATE["loaded_at"],
+        "prefix_index": {
+            name: azure_manager.prefix_index.loaded(name)
+            for name in azure_manager.prefix_index.containers
+        },
+    }
+    return JSONResponse(content=status, status_code=200 if status["ready"] else 503)
 
 def get_conversation_cache():
     return CONVERSATION_CACHE
@@ -57,66 +178,168 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def route_template(scope):
+    # Label by route template so /task-status/{task_id} is one series
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    route = route_template(request.scope)
+    token = current_endpoint.set(route)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method, route=route, status=status)
+        current_endpoint.reset(token)
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/hello")
 def hello():
     return {"message": "Hello from the NEW WIPJAR backend!"}
 
+async def summarize_upload(file, meeting_date: str = None):
+    """
+    Extract and summarize one received upload, cache it in PDF_CACHE and
+    store its rows for /records under meeting_date, or the file name's date.
+
+    Returns:
+        dict: {usage, key, response}.
+    """
+    if ".txt" in file.filename:
+        suffix=".txt"
+    else :
+        suffix = ".pdf"
+    pages = await azure_manager.extract_upload_pages_async(file, suffix)
+    text = '\n'.join(pages)
+    data = await azure_manager.get_file_summary(text, pages)
+    data["key"] = file.filename
+    await PDF_CACHE.aset(file.filename, data, 60 * 60 * 24)
+    print("Setting cache for: ", file.filename)
+    try:
+        stored = await RECORDS.areplace(
+            file.filename,
+            rows_from_response(data["response"]),
+            file.fields.get("place"),
+            file.fields.get("department"),
+            meeting_date or meeting_date_from_name(file.filename),
+        )
+        print(f'Stored {stored} records for {file.filename}')
+    except Exception as e:
+        print("Storing records failed", e)
+    print(data["key"])
+    return {
+        "usage": data["usage"],
+        "key": data["key"],
+        "response": data["response"]
+    }
+
 @app.post("/extract_text", response_class=JSONResponse)
-async def extract_text(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
-    print(file)
+async def extract_text(request: Request, background_tasks: BackgroundTasks):
+    """
+    Summarize an uploaded .pdf or .txt (multipart field `file`). The body is
+    streamed into a spooled buffer, so memory per request stays bounded;
+    files over WJ_UPLOAD_MAX_MB are rejected with a 413.
+
+    The extracted rows are also stored for /records, keyed by the optional
+    `place`, `department` and `date` form fields (date, YYYY-MM-DD, defaults
+    to the file name's `{date}_` prefix).
+    """
+    try:
+        file = await receive_upload(request, "file", UPLOAD_SPOOL_BYTES, UPLOAD_MAX_BYTES)
+    except UploadTooLarge as e:
+        return PlainTextResponse(content=str(e), status_code=413)
+    except ValueError as e:
+        return PlainTextResponse(content=str(e), status_code=400)
     try:
-        if ".txt" in file.filename:
-            suffix=".txt"
-        else :
-            suffix = ".pdf"        # Create a temporary file to save the uploaded PDF
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_file_path = temp_file.name
-        if suffix == ".txt":
-            text = content.decode('utf-8')
-        else : 
-            reader = PdfReader(temp_file_path)
-            # reader = None
-            number_of_pages = len(reader.pages)
-            content = []
-            print(number_of_pages)
-            for page in reader.pages:
-                pgcontent = page.extract_text()
-                content.append(pgcontent)
-            text = '\n'.join(content)
-        # Extract text from the PDF using textract
-            # text = textract.process(temp_file_path, method='pdfminer').decode('utf-8')
-            os.unlink(temp_file_path)
-
-        # Remove the temporary file
-        text = text.replace('\n\n\n', '\n')
-        text = text.replace('\n\n', '\n')
-        text = text.replace('\n \n', '\n')
-        data = azure_manager.get_file_summary(text)
-        data["key"] = file.filename
-        PDF_CACHE.set(file.filename, data, 60 * 60 * 24)
-        print("Setting cache for: ", file.filename)
+        meeting_date = normalize_meeting_date(file.fields.get("date"))
+    except ValueError as e:
+        file.close()
+        return PlainTextResponse(content=str(e), status_code=400)
+    print(file.filename, file.size)
+    try:
+        response = await summarize_upload(file, meeting_date)
         background_tasks.add_task(background_clear_cache, PDF_CACHE)
-        response = {
-            "usage": data["usage"],
-            "key": data["key"],
-            "response": data["response"]
-        }
-        print(data["key"])
         return response
     except Exception as e:
         print(e)
         return PlainTextResponse(content=f"An error occurred: {str(e)}", status_code=500)
-    
+    finally:
+        file.close()
+
+@app.post("/extract_text/batch")
+async def extract_text_batch(request: Request, background_tasks: BackgroundTasks):
+    """
+    Summarize many uploaded .pdf or .txt files (repeated multipart field
+    `files`, at most WJ_UPLOAD_BATCH_MAX_FILES and WJ_UPLOAD_BATCH_MAX_MB in
+    total) concurrently, sharing WJ_EXTRACT_CONCURRENCY slots with every
+    other batch. The `place`, `department` and `date` form fields apply to
+    all files, as for /extract_text.
+
+    The response is NDJSON with one line per file, sent as soon as that file
+    is done: {key, usage, response}, or {key, error} if it failed.
+    """
+    try:
+        files = await receive_uploads(
+            request, "files", UPLOAD_SPOOL_BYTES, UPLOAD_MAX_BYTES,
+            max_total_bytes=UPLOAD_BATCH_MAX_BYTES, max_files=UPLOAD_BATCH_MAX_FILES,
+        )
+    except UploadTooLarge as e:
+        return PlainTextResponse(content=str(e), status_code=413)
+    except ValueError as e:
+        return PlainTextResponse(content=str(e), status_code=400)
+    try:
+        # The form fields are shared by every file
+        meeting_date = normalize_meeting_date(files[0].fields.get("date"))
+    except ValueError as e:
+        for file in files:
+            file.close()
+        return PlainTextResponse(content=str(e), status_code=400)
+    print(f'Batch of {len(files)} files, {sum(file.size for file in files)} bytes')
+
+    async def extract(file):
+        try:
+            async with EXTRACT_SLOTS:
+                return await summarize_upload(file, meeting_date)
+        except Exception as e:
+            print(f'Extracting {file.filename} failed', e)
+            return {"key": file.filename, "error": str(e)}
+
+    async def results():
+        tasks = [asyncio.create_task(extract(file)) for file in files]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done, default=str) + "\n"
+        finally:
+            # The client went away, or every file is done
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for file in files:
+                file.close()
+
+    background_tasks.add_task(background_clear_cache, PDF_CACHE)
+    return StreamingResponse(results(), media_type="application/x-ndjson")
 
 @app.get("/wipplaces")
-def get_places():
-    places = azure_manager.get_places()
-    if places is not None:
-        return {"success": True, "places": places}
-    else :
+async def get_places(request: Request):
+    places, etag = await azure_manager.get_places_cached()
+    if places is None:
         return {"success": False}
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse({"success": True, "places": places}, headers=headers)
 
 @app.post("/wipindex")
 async def create_index(place:str = Form(...), department:str = Form(...), date:str = Form(...)):
@@ -124,122 +347,295 @@ async def create_index(place:str = Form(...), department:str = Form(...), date:s
     return response
 
 @app.post("/wipindex/all")
-async def create_index(place_name:str = Form(...)):
-    places = azure_manager.get_places()
-    departments = []
-    task_statuses = {}
-
-    for place in places:
-        if place["name"] == place_name:
-            departments = place["info"]["departments"]
-            break
-    
-    tasks = []
-
-    for department in departments:
-        dept = department["name"]
-        blobs = azure_manager.get_directories(starts_with=f'{place_name}/{dept}')
-        for blob_name in blobs:
-            if '.json' in blob_name:
-                continue
-            filename = blob_name.split('/')[2]
-            datestr = filename.split('_')[0]
-
-            tasks.append(azure_manager.write_pdf_as_index(place_name, dept, datestr, task_statuses))
-            # Start the task in a new thread
-            # thread = threading.Thread(target=azure_manager.write_pdf_as_index, args=(place_name, dept, datestr, task_statuses))
-            # thread.start()
-    await asyncio.gather(*tasks)
-
-    return task_statuses
-
+async def create_index(place_name:str = Form(...), wait:bool = Form(False), dry_run:bool = Form(False), force:bool = Form(False)):
+    """
+    Re-index a place as a background job. Only date prefixes whose source
+    blobs were added, changed or deleted since the last run are rebuilt
+    (force=true rebuilds everything). dry_run=true returns that plan without
+    building. Progress is available from /task-status/{job_id}; pass
+    wait=true to block until the run has finished.
+    """
+    if dry_run:
+        try:
+            return await azure_manager.index_builder.plan_place(place_name, force)
+        except ValueError as e:
+            return PlainTextResponse(content=str(e), status_code=404)
+        except IOError as e:
+            return PlainTextResponse(content=str(e), status_code=503)
+    job_id = await JOBS.submit("index_place", {"place": place_name, "force": force})
+    job = await (JOBS.wait(job_id) if wait else JOBS.get(job_id))
+    return job_status(job)
+
+
+@app.get("/records")
+async def get_records(
+    place: str = None,
+    department: str = None,
+    zipcode: str = None,
+    status: str = None,
+    party: str = None,
+    since: str = None,
+    until: str = None,
+    source: str = None,
+    limit: int = 100,
+    offset: int = 0,
+):
+    """
+    Query the rows extracted from uploaded minutes, newest meetings first.
+    status matches exactly (APPROVED, DENIED, PENDING), party as a
+    substring; since/until take ISO dates or prefixes such as 2024.
+    """
+    return await RECORDS.aquery(
+        place=place, department=department, zipcode=zipcode, status=status, party=party,
+        since=since, until=until, source=source,
+        limit=max(1, min(limit, 500)), offset=max(offset, 0),
+    )
 
 @app.get("/cache")
 async def get_cache(background_tasks: BackgroundTasks, key:str = Form(...)):
-    value = PDF_CACHE.get(key)
+    value = await PDF_CACHE.aget(key)
     background_tasks.add_task(background_clear_cache, PDF_CACHE)
     return {"key": key, "value": value}
 
+@app.get("/cache/stats")
+async def get_cache_stats():
+    return {"pdf_cache": PDF_CACHE.stats(), "retrieval_cache": RETRIEVAL_CACHE.stats()}
+
 @app.post("/cache/{key}")
 async def set_cache(key: str, data: CacheData, background_tasks: BackgroundTasks):
-    PDF_CACHE.set(key, data.value, data.ttl_seconds)
+    await PDF_CACHE.aset(key, data.value, data.ttl_seconds)
     background_tasks.add_task(background_clear_cache, PDF_CACHE)
     return {"message": "Cache set successfully"}
 
 
-def load_file_task(batch_id: str, blob_batch):
-    # Simulate a long-running task
+async def load_file_task(batch_id: str, blob_batch, since: str = None, until: str = None):
     data = {}
     data["key"] = batch_id
     data["status"] = "LOADING"
-    PDF_CACHE.set(batch_id, data, 60 * 60 * 24) 
-    text = ''
-    for blob in blob_batch:
-        print(blob)
-        try:
-            text += azure_manager.read_txt_pdf_blob(blob, 'wipjar-minutes-index')
-        except Exception as e:
-            print(e, blob)
-        text += '\n'
-    data["text"] = text
+    await PDF_CACHE.aset(batch_id, data, 60 * 60 * 24) 
+    # Blobs are downloaded concurrently; the text keeps the batch order
+    texts = {}
+    # A date range only fetches the matching meetings of each index
+    select = select_dates(since, until) if since or until else None
+    try:
+        async for blob, text in azure_manager.read_minutes_indexes(blob_batch, select=select):
+            texts[blob] = text
+    except Exception as e:
+        print(e, blob_batch)
+    data["text"] = ''.join(texts.get(blob, '') + '\n' for blob in blob_batch)
     data["status"] = "LOADED"
-    PDF_CACHE.set(batch_id, data, 60 * 60 * 24) 
+    await PDF_CACHE.aset(batch_id, data, 60 * 60 * 24) 
+
+async def explore_load_job(ctx, batch_id: str, blob_batch, since: str = None, until: str = None):
+    await load_file_task(batch_id, blob_batch, since, until)
+    return {"key": batch_id, "documents": len(blob_batch)}
 
-def load_files_in_background(background_tasks: BackgroundTasks, blob_batches):
+async def load_files_in_background(blob_batches, since: str = None, until: str = None):
     batch_ids = []
+    job_ids = []
     for blob_batch in blob_batches:
         batch_id = str(uuid4()) 
-        background_tasks.add_task(load_file_task, batch_id, blob_batch)
+        await PDF_CACHE.aset(batch_id, {"key": batch_id, "status": "LOADING"}, 60 * 60 * 24)
+        job_ids.append(await JOBS.submit(
+            "explore_load", {"batch_id": batch_id, "blob_batch": blob_batch, "since": since, "until": until}
+        ))
         batch_ids.append(batch_id)
-    return batch_ids
+    return batch_ids, job_ids
 
-task_statuses = {}
-
-async def write_file_task(task_id: str, filename: str, content: str):
-    try:
-        # Simulate a long-running task
-        await asyncio.sleep(10)
-        # Write the file
-        async with aiofiles.open(filename, 'w') as f:
-            await f.write(content)
-        # Update task status
-        task_statuses[task_id] = f"File {filename} has been written."
-    except Exception as e:
-        task_statuses[task_id] = f"Error: {str(e)}"
+async def write_file_task(ctx, filename: str, content: str):
+    # Simulate a long-running task
+    await asyncio.sleep(10)
+    # Write the file
+    async with aiofiles.open(filename, 'w') as f:
+        await f.write(content)
+    return f"File {filename} has been written."
+
+async def index_place_job(ctx, place: str, force: bool = False):
+    job = IndexJob(place, publish=ctx.progress, job_id=ctx.id)
+    await azure_manager.index_builder.locked_build_place(place, job, force)
+    if job.status == "failed":
+        raise RuntimeError(f"Index build of {place} failed")
+    return job.to_dict()
+
+# Interactive explore loads are claimed ahead of bulk re-indexing, which
+# runs one place at a time per process
+# Loads write to PDF_CACHE; unless that cache is shared they must run in the worker that serves /chat
+JOBS.register(
+    "explore_load",
+    explore_load_job,
+    priority=0,
+    max_concurrency=int(os.getenv("WJ_JOB_EXPLORE_CONCURRENCY", "4")),
+    local=os.getenv("WJ_CACHE_BACKEND", "local") == "local",
+)
+JOBS.register("write_file", write_file_task, priority=5, max_concurrency=2)
+JOBS.register("index_place", index_place_job, priority=10, max_concurrency=int(os.getenv("WJ_JOB_INDEX_CONCURRENCY", "1")))
+
+def job_status(job):
+    if job is None:
+        return None
+    return {
+        "job_id": job["id"],
+        "type": job["type"],
+        "status": job["status"],
+        "priority": job["priority"],
+        "attempts": job["attempts"],
+        "progress": job["progress"],
+        "result": job["result"],
+        "error": job["error"],
+        "created": job["created"],
+        "started": job["started"],
+        "finished": job["finished"],
+    }
 
 @app.post("/schedule-task")
 async def schedule_task(filename: str, content: str):
-    task_id = str(uuid4())
-    task_statuses[task_id] = "Task is pending..."
-    
-    # Start the task in a new thread
-    asyncio.create_task(write_file_task(task_id, filename, content))
-    
+    task_id = await JOBS.submit("write_file", {"filename": filename, "content": content})
     return {"message": "Task scheduled successfully", "task_id": task_id}
 
 @app.get("/task-status/{task_id}")
 async def get_task_status(task_id: str):
-    status = task_statuses.get(task_id, "Task not found")
+    status = job_status(await JOBS.get(task_id))
+    if status is None:
+        status = "Task not found"
+    return {"task_id": task_id, "status": status}
+
+@app.delete("/task-status/{task_id}")
+async def cancel_task(task_id: str):
+    """
+    Cancel a job. Queued jobs are cancelled right away; a running job is
+    cancelled by the process running it (within a heartbeat interval).
+    """
+    status = await JOBS.cancel(task_id)
+    if status is None:
+        return PlainTextResponse(content=f"Task {task_id} not found", status_code=404)
     return {"task_id": task_id, "status": status}
 
 @app.get("/tasks")
-async def get_tasks():
-    return task_statuses
+async def get_tasks(limit: int = 100, status: str = None):
+    return [job_status(job) for job in await JOBS.list(limit, status)]
+
+def build_retrieval_index(text: str):
+    return BM25Index.from_text(text, count_tokens_batch=azure_manager.tokenizer.count_batch)
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+async def get_chat_chunks(key: str, text: str, digest: str, question: str):
+    """
+    Return the top ranked chunks of a loaded batch for the question, or None
+    when the whole text fits in CHAT_CONTEXT_TOKENS and is sent as is.
+    """
+    # Keyed by the text, not the batch key, so reloading a key with other
+    # files never ranks the chunks of the old text
+    index = RETRIEVAL_CACHE.get(digest)
+    if index is None:
+        index = await asyncio.to_thread(build_retrieval_index, text)
+        # The index holds the chunk texts plus term counters, roughly 3x the text
+        RETRIEVAL_CACHE.set(digest, index, 60 * 60 * 24, size=3 * len(text))
+    if index.total_tokens <= CHAT_CONTEXT_TOKENS:
+        return None
+    chunks = index.select(question, CHAT_CONTEXT_TOKENS, CHAT_TOP_K)
+    print(f'Selected {len(chunks)} of {len(index.chunks)} chunks for {key}')
+    return chunks
+
+async def get_chat_session(key: str, question: str, full_context: bool = False, new_session: bool = False):
+    """
+    Return (session, excerpts) for a question on a loaded batch, starting a
+    session when there is none; session is None when the batch is not
+    loaded.
+
+    Retrieval runs for every question. The chunks of the session's first
+    question are pinned as its context, the stable prefix every follow-up
+    shares; excerpts holds the chunks ranked for this question that are not
+    in it (None if there are none), and is sent after the earlier turns.
+    A session on a key whose text has since been reloaded is started over.
+    """
+    file_data = await PDF_CACHE.aget(key)
+    if file_data is None or "text" not in file_data:
+        return None, None
+    text = file_data["text"]
+    digest = await asyncio.to_thread(text_digest, text)
+    session = None if new_session else await CONVERSATIONS.aget(key)
+    if session is not None and session.get("digest") != digest:
+        session = None
+    chunks = None if full_context else await get_chat_chunks(key, text, digest, question)
+    if chunks is None:
+        if session is None:
+            return await CONVERSATIONS.astart(key, text, digest=digest), None
+        # Switching to the whole text keeps the earlier turns
+        session["context"] = text
+        session["positions"] = None
+        return session, None
+    if session is None:
+        return await CONVERSATIONS.astart(key, render_chunks(chunks), [chunk.position for chunk in chunks], digest), None
+    if session.get("positions") is None:
+        # The whole text is already pinned
+        return session, None
+    pinned = set(session["positions"])
+    excerpts = [chunk for chunk in chunks if chunk.position not in pinned]
+    return session, render_chunks(excerpts) if excerpts else None
 
 @app.post("/chat")
-async def ask(background_tasks: BackgroundTasks, key:str = Form(...), question:str = Form(...), is_table:bool = Form(...)):
-    file_data = PDF_CACHE.get(key)
-    text = file_data["text"]
-    # print(key, is_table, question, text)
+async def ask(background_tasks: BackgroundTasks, key:str = Form(...), question:str = Form(...), is_table:bool = Form(...), full_context:bool = Form(False), new_session:bool = Form(False)):
+    """
+    Answer a question about a loaded batch. Questions on the same key are
+    one conversation: earlier turns are sent along (within
+    WJ_CHAT_HISTORY_TOKENS) until new_session is set or the session is
+    deleted.
+    """
+    session, excerpts = await get_chat_session(key, question, full_context, new_session)
+    if session is None:
+        return PlainTextResponse(content=f"No loaded text for key {key}", status_code=404)
     print(question)
-    response = azure_manager.get_answer_from_pdf(text, question, is_table)
+    response = await azure_manager.get_answer_from_pdf(session["context"], question, is_table, session, excerpts)
+    session = await CONVERSATIONS.aappend(session, question, response["response"], is_table)
+    response["turn"] = session["turn_count"]
     background_tasks.add_task(background_clear_cache, PDF_CACHE)
+    background_tasks.add_task(background_clear_cache, CONVERSATION_CACHE)
     return response
-    # return f"Received {key} and {is_table}"
+
+
+@app.post("/chat/stream")
+async def ask_stream(background_tasks: BackgroundTasks, key:str = Form(...), question:str = Form(...), is_table:bool = Form(...), full_context:bool = Form(False), new_session:bool = Form(False)):
+    """
+    Same as /chat, but the answer is sent as Server-Sent Events: one `token`
+    event per content delta and a final `usage` event.
+    """
+    session, excerpts = await get_chat_session(key, question, full_context, new_session)
+    if session is None:
+        return PlainTextResponse(content=f"No loaded text for key {key}", status_code=404)
+    print(question)
+
+    async def events():
+        tokens = []
+        try:
+            # A client that disconnects cancels this generator; aclosing
+            # closes the completion stream with it
+            async with aclosing(azure_manager.stream_answer_from_pdf(session["context"], question, is_table, session, excerpts)) as answer:
+                async for event in answer:
+                    if "token" in event:
+                        tokens.append(event["token"])
+                        yield sse_event({"text": event["token"]}, event="token")
+                    else:
+                        await CONVERSATIONS.aappend(session, question, ''.join(tokens).strip(), is_table)
+                        yield sse_event({"usage": event["usage"]}, event="usage")
+        except Exception as e:
+            print(e)
+            yield sse_event({"message": str(e)}, event="error")
+
+    background_tasks.add_task(background_clear_cache, PDF_CACHE)
+    background_tasks.add_task(background_clear_cache, CONVERSATION_CACHE)
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.delete("/chat/{key}")
+async def end_chat(key: str):
+    """Forget the conversation on a batch; the next question starts over."""
+    await CONVERSATIONS.adelete(key)
+    return {"key": key, "message": "Conversation cleared"}
 
 
 @app.post("/chat_explore", response_class=JSONResponse)
-def explore_chat(background_tasks: BackgroundTasks, options = File(...)):
+async def explore_chat(options = File(...)):
     print(options)
     blobs = []
     prefixes = []
@@ -248,29 +644,15 @@ def explore_chat(background_tasks: BackgroundTasks, options = File(...)):
         for department in selected_options["departments"]:
             prefixes.append(f'{place}/{department}/{selected_options["time"]}')
     for prefix in prefixes:
-        blobs.extend(azure_manager.get_directories(prefix, 'wipjar-minutes-index'))
+        blobs.extend(await asyncio.to_thread(azure_manager.get_index_entries, prefix))
     
-    blob_batches = []
-    print(blobs)
-    blobs_to_process = []
-    total_tokens = 0
-    for blob in blobs:
-        match = re.search(r'(.*)_(\d+)\.txt$', blob)
-        if match:
-            tokens = int(match.group(2))
-            total_tokens += tokens
-            print(total_tokens)
-            blobs_to_process.append(blob)
-            if total_tokens + tokens > 100000:
-                print('--->', total_tokens)
-                blob_batches.append(blobs_to_process)
-                blobs_to_process = []
-                total_tokens = 0
-            else :
-                total_tokens += tokens
-
-    if blobs_to_process:
-        blob_batches.append(blobs_to_process)
-    print(blob_batches) 
-    batch_ids = load_files_in_background(background_tasks, blob_batches)
-    return {"success": True, "data": batch_ids}
+    documents = [entry for entry in blobs if entry["tokens"] is not None]
+    plan = plan_batches(documents, EXPLORE_BATCH_TOKENS, selected_options.get("chronological", False))
+    blob_batches = [batch["members"] for batch in plan]
+    batch_ids, job_ids = await load_files_in_background(
+        blob_batches, selected_options.get("since"), selected_options.get("until")
+    )
+    for batch_id, job_id, batch in zip(batch_ids, job_ids, plan):
+        batch["batch_id"] = batch_id
+        batch["job_id"] = job_id
+    return {"success": True, "data": batch_ids, "plan": plan}
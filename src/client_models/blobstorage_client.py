@@ -1,50 +1,79 @@
 """
 This module handles interactions with Azure Blob Storage.
 """
+import asyncio
 import logging
 import base64
 import json
 import random
 import string
-from azure.core.exceptions import ResourceNotFoundError
-from azure.storage.blob import BlobServiceClient, BlobClient
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError, ResourceNotModifiedError
+from src.utils.minutes_format import encode_minutes_index
+from src.utils.metrics import BLOB_BYTES, stage
 
 from typing import TypedDict
 
+def connection_string(access_key: str) -> str:
+    return f"DefaultEndpointsProtocol=https;AccountName=filestoragewipjarai;AccountKey={access_key};EndpointSuffix=core.windows.net"
+
+def add_index_entry(index_content, blob_name, filecontent):
+    try:
+        test_data = json.loads(filecontent)
+        index_content[test_data["test_alias"]] = {
+            "test_name": test_data["test_name"],
+            "test_alias": test_data["test_alias"],
+            "status": test_data["status"]
+        }
+    except json.JSONDecodeError as e:
+        logging.error(f"Error parsing file content: {blob_name}, {e}")
+        logging.debug(filecontent)
+
 class BlobStorageClient:
     """
     Manages interactions with Azure Blob Storage.
     """
-    def __init__(self, access_key: str) -> None:
+    def __init__(self, access_key: str = None, conn_str: str = None, service_client=None) -> None:
         """
         Initialize the BlobStorageClient with the necessary connection string.
+        The service client (and the storage SDK import) is created on first use.
 
         Args:
-            connection_string (str): The connection string for Azure Blob Storage.
+            access_key (str): The storage account key.
+            conn_str (str): A full connection string (e.g. for Azurite), used instead of access_key.
+            service_client: A ready BlobServiceClient (or a stand-in), used as is.
         """
-        self.blobstorage_client = BlobServiceClient.from_connection_string(f"DefaultEndpointsProtocol=https;AccountName=filestoragewipjarai;AccountKey={access_key};EndpointSuffix=core.windows.net")
+        self.access_key = access_key
+        self.conn_str = conn_str
+        self._service_client = service_client
+
+    @property
+    def blobstorage_client(self):
+        if self._service_client is None:
+            from azure.storage.blob import BlobServiceClient
+            self._service_client = BlobServiceClient.from_connection_string(
+                self.conn_str or connection_string(self.access_key)
+            )
+        return self._service_client
 
 
     def read_file(self, container_name, blob_name):
         """
-        Download a blob from Azure Blob Storage to a local file.
+        Download a blob from Azure Blob Storage as text.
 
         Args:
             container_name (str): The name of the container.
             blob_name (str): The name of the blob.
-            file_path (str): The local file path to save the blob.
 
         Returns:
-            Optional[str]: The file path if successful, None otherwise.
+            Union[str, bool]: The blob text, or False if the blob does not exist.
         """
         blob_client = self.blobstorage_client.get_blob_client(container=container_name, blob=blob_name)
-        if blob_client.exists():
-            download_stream = blob_client.download_blob()
-            content = download_stream.readall()
-            text_content = content.decode('utf-8')
-            return text_content
-        else:
+        try:
+            # One request; a missing blob surfaces as ResourceNotFoundError
+            content = blob_client.download_blob().readall()
+        except ResourceNotFoundError:
             return False
+        return content.decode('utf-8')
 
     def get_full_index(self):
         '''
@@ -64,10 +93,12 @@ class BlobStorageClient:
         container_client = self.blobstorage_client.get_container_client(container_name)
         try:
             container_client.create_container()
-        except ResourceNotFoundError:
+        except ResourceExistsError:
             pass # Container already exists
 
-    def read_all_files(self, container_name, index_content={}):
+    def read_all_files(self, container_name, index_content=None):
+        if index_content is None:
+            index_content = {}
         try:
             self.create_container_if_not_exists(container_name)
             container_client = self.blobstorage_client.get_container_client(container_name)
@@ -76,16 +107,7 @@ class BlobStorageClient:
                 filecontent = self.read_file(container_name, blob_name)
                 if not filecontent:
                     continue
-                try:
-                    test_data = json.loads(filecontent)
-                    index_content[test_data["test_alias"]] = {
-                        "test_name": test_data["test_name"],
-                        "test_alias": test_data["test_alias"],
-                        "status": test_data["status"]
-                    }
-                except json.JSONDecodeError as e:
-                    logging.error(f"Error parsing file content: {blob_name}, {e}")
-                    logging.debug(filecontent)
+                add_index_entry(index_content, blob_name, filecontent)
         except ResourceNotFoundError as e:
             logging.error(f"Container '{container_name}' not found: {e}")
         except Exception as e:
@@ -104,16 +126,9 @@ class BlobStorageClient:
             list: A list of directory names.
         """
         container_client = self.blobstorage_client.get_container_client(container=container_name)
-        blob_list = container_client.list_blob_names(name_starts_with=starts_with)
-        blob_names = []
-        for blob in blob_list:
-            blob_names.append(blob)
-            print("\t" + blob)
-        return blob_names
-
-    def save_minutes_index(self, container_name, blob_name, content):
-        blob_client = self.blobstorage_client.get_blob_client(container=container_name, blob=blob_name)
-        blob_client.upload_blob(json.dumps(content), overwrite=True)
+        with stage("blob_list"):
+            blob_list = container_client.list_blob_names(name_starts_with=starts_with)
+            return list(blob_list)
 
     def get_blob_content(self, container_name, blob_name):
         """
@@ -128,7 +143,209 @@ class BlobStorageClient:
         """        
         container_client = self.blobstorage_client.get_container_client(container=container_name)
         try :
-            return container_client.download_blob(blob_name).readall()
+            with stage("blob_download"):
+                content = container_client.download_blob(blob_name).readall()
+            BLOB_BYTES.inc(len(content), container=container_name)
+            return content
         except ResourceNotFoundError:
             print(f'File {blob_name} not found in container {container_name}')
-            return None 
\ No newline at end of file
+            return None
+
+
+class AsyncBlobStorageClient:
+    """
+    Async counterpart of BlobStorageClient.
+
+    All requests share one aiohttp connection pool of max_connections
+    connections. Reads are a single download request; a missing blob is
+    reported by the service as not-found instead of a separate exists() call.
+    """
+    def __init__(self, access_key: str = None, max_connections: int = 64, conn_str: str = None, service_client=None) -> None:
+        self.access_key = access_key
+        self.conn_str = conn_str
+        self.max_connections = max_connections
+        self._service_client = service_client
+
+    @property
+    def blobstorage_client(self):
+        # Built on first use: the aiohttp session must be created inside the running loop
+        if self._service_client is None:
+            import aiohttp
+            from azure.core.pipeline.transport import AioHttpTransport
+            from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.max_connections)
+            )
+            self._service_client = AsyncBlobServiceClient.from_connection_string(
+                self.conn_str or connection_string(self.access_key),
+                transport=AioHttpTransport(session=session, session_owner=True),
+            )
+        return self._service_client
+
+    async def get_blob_content(self, container_name, blob_name):
+        """
+        Returns:
+            bytes: The content of the blob, or None if it does not exist.
+        """
+        blob_client = self.blobstorage_client.get_blob_client(container=container_name, blob=blob_name)
+        try:
+            with stage("blob_download"):
+                download_stream = await blob_client.download_blob()
+                content = await download_stream.readall()
+            BLOB_BYTES.inc(len(content), container=container_name)
+            return content
+        except ResourceNotFoundError:
+            return None
+
+    async def get_blob_if_modified(self, container_name, blob_name, etag=None):
+        """
+        Conditional download (If-None-Match) of a blob.
+
+        Returns:
+            tuple: (content, etag). content is None when the blob still has the
+            given etag, or when it does not exist (etag is then None too).
+        """
+        blob_client = self.blobstorage_client.get_blob_client(container=container_name, blob=blob_name)
+        try:
+            with stage("blob_download"):
+                if etag is None:
+                    download_stream = await blob_client.download_blob()
+                else:
+                    from azure.core import MatchConditions
+                    download_stream = await blob_client.download_blob(etag=etag, match_condition=MatchConditions.IfModified)
+                content = await download_stream.readall()
+            BLOB_BYTES.inc(len(content), container=container_name)
+            return content, download_stream.properties.etag
+        except ResourceNotModifiedError:
+            return None, etag
+        except ResourceNotFoundError:
+            return None, None
+
+    async def read_file(self, container_name, blob_name):
+        content = await self.get_blob_content(container_name, blob_name)
+        if content is None:
+            return False
+        return content.decode('utf-8')
+
+    async def read_many(self, container_name, blob_names, concurrency: int = 16):
+        """
+        Download many blobs concurrently and yield them as they finish.
+
+        Args:
+            container_name (str): The name of the container.
+            blob_names (list): The blobs to read.
+            concurrency (int): Maximum downloads in flight.
+
+        Yields:
+            tuple: (blob_name, content bytes or None if the blob does not exist),
+            in completion order.
+        """
+        slots = asyncio.Semaphore(concurrency)
+
+        async def read(blob_name):
+            async with slots:
+                return blob_name, await self.get_blob_content(container_name, blob_name)
+
+        tasks = [asyncio.create_task(read(blob_name)) for blob_name in blob_names]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def list_blob_names(self, container_name, starts_with=None):
+        container_client = self.blobstorage_client.get_container_client(container_name)
+        with stage("blob_list"):
+            return [name async for name in container_client.list_blob_names(name_starts_with=starts_with)]
+
+    async def list_blob_properties(self, container_name, starts_with=None):
+        """
+        List blobs under a prefix with the properties needed to detect changes.
+
+        Returns:
+            list: One dict per blob with name, etag, last_modified (ISO string) and size.
+        """
+        container_client = self.blobstorage_client.get_container_client(container_name)
+        blobs = []
+        with stage("blob_list"):
+            async for blob in container_client.list_blobs(name_starts_with=starts_with):
+                blobs.append({
+                    "name": blob.name,
+                    "etag": blob.etag,
+                    "last_modified": blob.last_modified.isoformat() if blob.last_modified else None,
+                    "size": blob.size,
+                })
+        return blobs
+
+    async def get_blob_range(self, container_name, blob_name, offset: int, length: int):
+        """
+        Ranged download of length bytes from offset (fewer at the end of the blob).
+
+        Returns:
+            bytes: The range, or None if the blob does not exist.
+        """
+        blob_client = self.blobstorage_client.get_blob_client(container=container_name, blob=blob_name)
+        try:
+            with stage("blob_download"):
+                download_stream = await blob_client.download_blob(offset=offset, length=length)
+                content = await download_stream.readall()
+            BLOB_BYTES.inc(len(content), container=container_name)
+            return content
+        except ResourceNotFoundError:
+            return None
+
+    async def save_minutes_index(self, container_name, blob_name, sections):
+        """
+        Upload a packed minutes index (see src.utils.minutes_format).
+
+        Args:
+            sections (list): (name, text, tokens) per meeting.
+
+        Returns:
+            dict: The uploaded blob's name, etag, last_modified and size.
+        """
+        blob_client = self.blobstorage_client.get_blob_client(container=container_name, blob=blob_name)
+        data = await asyncio.to_thread(encode_minutes_index, sections)
+        result = await blob_client.upload_blob(data, overwrite=True)
+        last_modified = result.get("last_modified")
+        return {
+            "name": blob_name,
+            "etag": result.get("etag"),
+            "last_modified": last_modified.isoformat() if last_modified else None,
+            "size": len(data),
+        }
+
+    async def upload_json(self, container_name, blob_name, data):
+        blob_client = self.blobstorage_client.get_blob_client(container=container_name, blob=blob_name)
+        await blob_client.upload_blob(json.dumps(data), overwrite=True)
+
+    async def delete_blob(self, container_name, blob_name):
+        container_client = self.blobstorage_client.get_container_client(container_name)
+        try:
+            await container_client.delete_blob(blob_name)
+            return True
+        except ResourceNotFoundError:
+            return False
+
+    async def read_all_files(self, container_name, concurrency: int = 32):
+        index_content = {}
+        try:
+            blob_names = await self.list_blob_names(container_name)
+            async for blob_name, content in self.read_many(container_name, blob_names, concurrency):
+                if not content:
+                    continue
+                add_index_entry(index_content, blob_name, content.decode('utf-8'))
+        except ResourceNotFoundError as e:
+            logging.error(f"Container '{container_name}' not found: {e}")
+        except Exception as e:
+            logging.error(f"An unexpected error occurred: {e}")
+        return index_content
+
+    async def get_full_index(self):
+        return await self.read_all_files("test-index")
+
+    async def close(self):
+        if self._service_client is not None:
+            await self._service_client.close()
+            self._service_client = None
@@ -0,0 +1,285 @@
+"""
+Rate-limit-aware dispatch of chat completions.
+
+Every async completion goes through a CompletionDispatcher, which
+
+- estimates the request's token cost with tiktoken (prompt tokens plus
+  max_tokens, which is how Azure OpenAI charges a request against the
+  deployment's tokens-per-minute quota) and waits for that many tokens and
+  one request in token buckets refilled at the TPM and RPM quotas;
+- retries 429s, timeouts, connection errors and 5xx responses with
+  exponential backoff and full jitter, waiting at least as long as the
+  Retry-After header asks; a 429 pauses every caller, not just the one
+  that got it;
+- adapts how many requests are in flight: the limit is halved on a 429
+  and grows back by one after every `limit` successes (AIMD), between
+  min_concurrency and max_concurrency;
+- coalesces identical concurrent requests so they share one call.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import time
+from src.utils.tokenizer import get_tokenizer
+from src.utils.metrics import LLM_REQUESTS, record_usage, stage
+
+
+def retryable_errors():
+    """
+    The openai errors worth retrying. openai is imported here rather than at
+    module load; by the time a call fails the client has imported it anyway.
+    """
+    import openai
+    return (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+
+
+def is_rate_limited(error) -> bool:
+    import openai
+    return isinstance(error, openai.RateLimitError)
+
+
+class TokenBucket:
+    """
+    Continuously refilled bucket of per_minute units. A request for more
+    than the whole capacity waits for a full bucket instead of forever.
+    """
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.available = per_minute
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float):
+        amount = min(amount, self.capacity)
+        # The lock keeps callers in arrival order, so a big request is not starved by small ones
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                await asyncio.sleep((amount - self.available) / self.rate)
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit that backs off on rate limiting (AIMD).
+    """
+    def __init__(self, min_limit: int, max_limit: int) -> None:
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = self.max_limit
+        self.in_flight = 0
+        self._successes = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self, throttled: bool = False):
+        async with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.min_limit, self.limit // 2)
+                self._successes = 0
+            else:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_limit:
+                    self.limit += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+
+def retry_after_seconds(error):
+    """Seconds asked for by the retry-after-ms / Retry-After headers of an API error, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+class CompletionDispatcher:
+    def __init__(
+        self,
+        async_client,
+        deployment_name: str,
+        tokens_per_minute: int = 0,
+        requests_per_minute: int = 0,
+        max_concurrency: int = 8,
+        min_concurrency: int = 1,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        model: str = "gpt-4o-mini",
+    ) -> None:
+        """
+        Args:
+            async_client: An AsyncOpenAI / AsyncAzureOpenAI client; construct it
+                with max_retries=0 so retries are only done here.
+            tokens_per_minute (int): TPM quota of the deployment; 0 disables the budget.
+            requests_per_minute (int): RPM quota of the deployment; 0 disables the budget.
+        """
+        self.async_client = async_client
+        self.deployment_name = deployment_name
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.limiter = AdaptiveLimiter(min_concurrency, max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.tokenizer = get_tokenizer(model)
+        self.paused_until = 0.0
+        self._pending = {}
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0, "coalesced": 0, "failures": 0}
+
+    def estimate_tokens(self, messages, max_tokens: int) -> int:
+        contents = [message["content"] for message in messages if isinstance(message.get("content"), str)]
+        # ~4 tokens of chat framing per message
+        return sum(self.tokenizer.count_batch(contents)) + 4 * len(messages) + (max_tokens or 0)
+
+    def _coalesce_key(self, messages, max_tokens, kwargs):
+        payload = json.dumps([messages, max_tokens, kwargs], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _backoff(self, attempt: int, error) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def _retry_delay(self, attempt: int, error) -> float:
+        """Seconds to wait before retrying after error; re-raises it when out of retries."""
+        if attempt >= self.max_retries:
+            self.stats["failures"] += 1
+            LLM_REQUESTS.inc(outcome="failed")
+            raise error
+        delay = self._backoff(attempt, error)
+        if is_rate_limited(error):
+            self.stats["throttled"] += 1
+            LLM_REQUESTS.inc(outcome="throttled")
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        else:
+            LLM_REQUESTS.inc(outcome="retried_error")
+        self.stats["retries"] += 1
+        print(f'Retrying completion in {delay:.1f}s ({type(error).__name__}, attempt {attempt + 1})')
+        return delay
+
+    async def _admit(self, estimate: int):
+        pause = self.paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        if self.requests is not None:
+            await self.requests.acquire(1)
+        if self.tokens is not None:
+            await self.tokens.acquire(estimate)
+        await self.limiter.acquire()
+
+    async def _attempts(self, estimate: int, call):
+        """
+        Run call() under the budgets, retrying retryable errors. call must
+        return an awaitable that succeeds or raises.
+        """
+        attempt = 0
+        while True:
+            await self._admit(estimate)
+            throttled = False
+            try:
+                self.stats["requests"] += 1
+                with stage("llm_call"):
+                    response = await call()
+                LLM_REQUESTS.inc(outcome="ok")
+                record_usage(getattr(response, "usage", None))
+                return response
+            except retryable_errors() as e:
+                throttled = is_rate_limited(e)
+                delay = self._retry_delay(attempt, e)
+            finally:
+                await self.limiter.release(throttled)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def complete(self, messages, max_tokens: int, **kwargs):
+        """
+        Create a chat completion. Identical requests already in flight are
+        shared instead of sent again.
+        """
+        key = self._coalesce_key(messages, max_tokens, kwargs)
+        task = self._pending.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(task)
+        task = asyncio.create_task(self._complete(messages, max_tokens, kwargs))
+        self._pending[key] = task
+        task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _complete(self, messages, max_tokens, kwargs):
+        estimate = await asyncio.to_thread(self.estimate_tokens, messages, max_tokens)
+        return await self._attempts(estimate, lambda: self.async_client.chat.completions.create(
+            model=self.deployment_name,
+            messages=messages,
+            max_tokens=max_tokens,
+            **kwargs,
+        ))
+
+    async def stream(self, messages, max_tokens: int, **kwargs):
+        """
+        Stream a chat completion. Opening the stream is retried like
+        complete(); once chunks are flowing an error is raised to the caller.
+        The concurrency slot is held until the stream ends or the caller
+        closes the generator.
+        """
+        estimate = await asyncio.to_thread(self.estimate_tokens, messages, max_tokens)
+        attempt = 0
+        while True:
+            await self._admit(estimate)
+            throttled = False
+            try:
+                self.stats["requests"] += 1
+                try:
+                    # For streams the llm_call stage is the time to the first byte
+                    with stage("llm_call"):
+                        stream = await self.async_client.chat.completions.create(
+                            model=self.deployment_name,
+                            messages=messages,
+                            max_tokens=max_tokens,
+                            stream=True,
+                            **kwargs,
+                        )
+                except retryable_errors() as e:
+                    throttled = is_rate_limited(e)
+                    delay = self._retry_delay(attempt, e)
+                else:
+                    try:
+                        async for chunk in stream:
+                            if getattr(chunk, "usage", None) is not None:
+                                record_usage(chunk.usage)
+                            yield chunk
+                    finally:
+                        # Also reached when the consumer stops early; closing
+                        # frees the connection before the slot is released
+                        await stream.close()
+                    LLM_REQUESTS.inc(outcome="ok")
+                    return
+            finally:
+                await self.limiter.release(throttled)
+            attempt += 1
+            await asyncio.sleep(delay)
@@ -1,7 +1,36 @@
+import os
 from abc import ABC, abstractmethod
+from contextlib import aclosing
 import base64
 from mimetypes import guess_type
-from openai import AzureOpenAI
+
+_async_http_client = None
+
+def shared_async_http_client():
+    """
+    Return the process-wide async HTTP client used by every GPT client.
+
+    All completions go through one connection pool so keep-alive
+    connections to Azure OpenAI are reused across requests.
+    """
+    global _async_http_client
+    if _async_http_client is None or _async_http_client.is_closed:
+        import httpx
+        max_connections = int(os.getenv("WJ_OPENAI_MAX_CONNECTIONS", "20"))
+        _async_http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            timeout=httpx.Timeout(float(os.getenv("WJ_OPENAI_TIMEOUT", "600")), connect=10.0),
+        )
+    return _async_http_client
+
+async def close_shared_async_http_client():
+    global _async_http_client
+    if _async_http_client is not None:
+        await _async_http_client.aclose()
+        _async_http_client = None
 
 class BaseGPTClient(ABC):
     @abstractmethod
@@ -12,6 +41,17 @@ class BaseGPTClient(ABC):
     @abstractmethod
     def client(self):
         pass
+
+    @property
+    @abstractmethod
+    def async_client(self):
+        pass
+
+    @property
+    @abstractmethod
+    def dispatcher(self):
+        """CompletionDispatcher that rate limits, retries and coalesces async completions."""
+        pass
    
     @property
     @abstractmethod
@@ -32,4 +72,27 @@ class BaseGPTClient(ABC):
             # if e["error"] is not None:
             #     print("Exception from GPT", e["error"]["message"], e["error"]["param"])
             # else :
-            print("Exception from GPT", e)
\ No newline at end of file
+            print("Exception from GPT", e)
+
+    async def chat_completion_async(self, messages, max_tokens):
+        try :
+            response = await self.dispatcher.complete(messages, max_tokens)
+            if response is None:
+                raise ValueError("Failed to obtain a response!")
+            return response
+        except Exception as e:
+            print("Exception from GPT", e)
+            raise
+
+    async def chat_completion_stream(self, messages, max_tokens):
+        """
+        Yield completion chunks as they arrive. The last chunk carries the
+        usage block. The concurrency slot is held until the stream ends.
+        """
+        try :
+            async with aclosing(self.dispatcher.stream(messages, max_tokens, stream_options={"include_usage": True})) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+        except Exception as e:
+            print("Exception from GPT", e)
+            raise
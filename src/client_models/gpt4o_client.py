@@ -1,8 +1,10 @@
+import asyncio
 import json
+from contextlib import aclosing
 from mimetypes import guess_type
-import tiktoken
-from openai import AzureOpenAI
-from src.client_models.gpt4_clients import BaseGPTClient
+from src.client_models.gpt4_clients import BaseGPTClient, shared_async_http_client
+from src.client_models.dispatcher import CompletionDispatcher
+from src.utils.tokenizer import get_tokenizer
 
 
 
@@ -21,19 +23,119 @@ chat_pdf_prompts = [
 
 json_message = "Please respond in a strictly json object. Do not include any explanation."
 
+pdf_system_message = "You are a Data Analyst working a city municipality. The municipality records minutes of its meetings, that correspond to many different departments such as Planning Commission Zoning Department, Land Use, Community Development,Urban Planning etc"
+
+chat_system_message = "You are an AI assistant analyzing transcripts from city municipality meetings. These transcripts cover various departments such as Planning Commission, Zoning Department, Land Use, Community Development, and Urban Planning. Your task is to understand the content, identify people who spoke and understand what they said, regarding key points, identify important decisions, and answer questions about the meeting content."
+
+chat_table_message = "Make sure your response is strictly a json object that looks like {'data': []}and that I can display in React antd Table component!"
+
+empty_response_message = "I apologize, but I am having difficulty providing a detailed description of this image. The image quality or content may be challenging for me to interpret accurately. Please provide additional guidance or consider uploading a clearer image if possible."
+
+def _row_key(row):
+    normalise = lambda value: ' '.join(str(value or '').lower().split())
+    key = tuple(normalise(row.get(field)) for field in ("address", "party", "status"))
+    if not key[0]:
+        # Rows without an address are only duplicates if the summary matches too
+        key += (normalise(row.get("summary")),)
+    return key
+
+def merge_pdf_data(responses):
+    """
+    Merge the {columns, response} JSON objects produced per chunk by the
+    pdf_prompts extraction. Rows are deduplicated on address, party and
+    status and renumbered; unparseable chunk responses are skipped.
+    """
+    columns = None
+    rows = []
+    seen = set()
+    for response in responses:
+        try:
+            data = json.loads(response)
+        except (json.JSONDecodeError, TypeError):
+            print("Skipping unparseable chunk response")
+            continue
+        if not isinstance(data, dict):
+            continue
+        if columns is None and data.get("columns"):
+            columns = data["columns"]
+        items = data.get("response") or []
+        if isinstance(items, dict):
+            items = [items]
+        for row in items:
+            if not isinstance(row, dict):
+                continue
+            key = _row_key(row)
+            if key in seen:
+                continue
+            seen.add(key)
+            rows.append(row)
+    for i, row in enumerate(rows):
+        row["index"] = i + 1
+    return {"columns": columns or [], "response": rows}
+
 class GPT4OClient(BaseGPTClient):
-    def __init__(self, api_base: str, api_key: str, api_version: str, deployment_name: str) -> None:
+    def __init__(
+        self,
+        api_base: str,
+        api_key: str,
+        api_version: str,
+        deployment_name: str,
+        max_concurrency: int = 8,
+        response_cache = None,
+        tokens_per_minute: int = 0,
+        requests_per_minute: int = 0,
+        min_concurrency: int = 1,
+        max_retries: int = 6,
+    ) -> None:
         super().__init__()
-        self._client = AzureOpenAI(
-            api_key=api_key,
-            api_version=api_version,
-            base_url=f"{api_base}openai/deployments/{deployment_name}",
-        )
+        # The openai clients (and the openai import) are built on first use,
+        # so constructing this at import time costs nothing
+        self._client = None
+        self._async_client = None
+        self._dispatcher = None
+        self.api_base = api_base
+        self.api_key = api_key
+        self.api_version = api_version
+        self.dispatcher_options = {
+            "tokens_per_minute": tokens_per_minute,
+            "requests_per_minute": requests_per_minute,
+            "max_concurrency": max_concurrency,
+            "min_concurrency": min_concurrency,
+            "max_retries": max_retries,
+        }
         self._deployment_name = deployment_name
+        self.response_cache = response_cache
 
     @property
     def client(self):
+        if self._client is None:
+            from openai import AzureOpenAI
+            self._client = AzureOpenAI(
+                api_key=self.api_key,
+                api_version=self.api_version,
+                base_url=f"{self.api_base}openai/deployments/{self.deployment_name}",
+            )
         return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            from openai import AsyncAzureOpenAI
+            self._async_client = AsyncAzureOpenAI(
+                api_key=self.api_key,
+                api_version=self.api_version,
+                base_url=f"{self.api_base}openai/deployments/{self.deployment_name}",
+                http_client=shared_async_http_client(),
+                # Retries and backoff are done by the dispatcher
+                max_retries=0,
+            )
+        return self._async_client
+
+    @property
+    def dispatcher(self):
+        if self._dispatcher is None:
+            self._dispatcher = CompletionDispatcher(self.async_client, self.deployment_name, **self.dispatcher_options)
+        return self._dispatcher
    
     @property
     def deployment_name(self):
@@ -55,11 +157,38 @@ class GPT4OClient(BaseGPTClient):
             print("Exception from GPT", e)
             raise
 
-    def get_pdf_data(self, text) -> str:
-        messages=[
+    async def chat_completion_async(self, messages, max_tokens, response_format):
+        try :
+            return await self.dispatcher.complete(messages, max_tokens, response_format=response_format)
+        except Exception as e:
+            print("Exception from GPT", e)
+            raise
+
+    async def chat_completion_stream(self, messages, max_tokens, response_format):
+        try :
+            # aclosing closes the dispatcher stream (and its connection) when
+            # the caller stops before the end
+            async with aclosing(self.dispatcher.stream(
+                messages,
+                max_tokens,
+                response_format=response_format,
+                stream_options={"include_usage": True},
+            )) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+        except Exception as e:
+            print("Exception from GPT", e)
+            raise
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.close()
+
+    def _pdf_data_messages(self, text):
+        return [
             {
                 "role": "system",
-                "content": "You are a Data Analyst working a city municipality. The municipality records minutes of its meetings, that correspond to many different departments such as Planning Commission Zoning Department, Land Use, Community Development,Urban Planning etc",
+                "content": pdf_system_message,
             },
             {
                 "role": "user",
@@ -70,6 +199,52 @@ class GPT4OClient(BaseGPTClient):
                 "content": text,
             },           
         ]
+
+    def _format_response(self, response, **extra):
+        description = response.choices[0].message.content
+        if description is None or description.strip() == "":
+            description = empty_response_message
+        return {
+            "usage": response.usage,
+            **extra,
+            "response" : description.strip() 
+        }
+
+    def _usage_dict(self, usage, cache_hit=False):
+        usage = usage.model_dump() if hasattr(usage, "model_dump") else dict(usage or {})
+        usage["cache_hit"] = cache_hit
+        return usage
+
+    def _response_cache_key(self, kind, messages, response_format):
+        # The messages carry the system message, the prompt constants, the
+        # input text and the question, so any change to them is a new key.
+        return self.response_cache.make_key(self.deployment_name, kind, messages, response_format)
+
+    async def _cached_completion(self, kind, messages, max_tokens, response_format):
+        """
+        Run a completion through the response cache. Returns
+        (usage dict, response text).
+        """
+        key = None
+        if self.response_cache is not None:
+            key = self._response_cache_key(kind, messages, response_format)
+            cached = await self.response_cache.aget(key)
+            if cached is not None:
+                return self._usage_dict(cached["usage"], cache_hit=True), cached["response"]
+        response = await self.chat_completion_async(
+            messages=messages,
+            max_tokens=max_tokens,
+            response_format=response_format
+        )
+        print(f'Tokens : {response.usage.prompt_tokens}')
+        formatted = self._format_response(response)
+        usage = self._usage_dict(response.usage)
+        if key is not None:
+            await self.response_cache.aset(key, {"usage": usage, "response": formatted["response"]})
+        return usage, formatted["response"]
+
+    def get_pdf_data(self, text) -> str:
+        messages = self._pdf_data_messages(text)
         # print('fetching tokjens')
         # num_tokens = self.num_tokens_from_messages(messages)
   
@@ -84,76 +259,114 @@ class GPT4OClient(BaseGPTClient):
         except Exception as e:
             raise Exception("Error fetching response from GPT") from e
          
-        description = response.choices[0].message.content
-        if description is None or description.strip() == "":
-            description = "I apologize, but I am having difficulty providing a detailed description of this image. The image quality or content may be challenging for me to interpret accurately. Please provide additional guidance or consider uploading a clearer image if possible."
-        response = {
-            "usage": response.usage,
-            "text" : text,
-            "response" : description.strip() 
-        }
-        return response 
-    
-    def num_tokens_content(self, content, model="gpt-4o-mini"):
-        """Return the number of tokens used by a list of messages."""
+        return self._format_response(response, text=text)
+
+    async def get_pdf_data_async(self, text) -> dict:
+        """
+        Async variant of get_pdf_data; awaits the completion instead of
+        blocking the event loop.
+        """
+        messages = self._pdf_data_messages(text)
         try:
-            encoding = tiktoken.encoding_for_model(model)
-        except KeyError:
-            print("Warning: model not found. Using cl100k_base encoding.")
-            encoding = tiktoken.get_encoding("cl100k_base")
-        return len(encoding.encode(content))
+            usage, description = await self._cached_completion(
+                "pdf_data",
+                messages=messages,
+                max_tokens=10000,
+                response_format={"type": "json_object"}
+            )
+        except Exception as e:
+            raise Exception("Error fetching response from GPT") from e
 
-    # find out if the first message_ was intended or can be removed
-    def converse(self, text, question, json_response) -> str:
+        return {
+            "usage": usage,
+            "text": text,
+            "response": description
+        }
+    
+    async def get_pdf_data_chunked(self, text, chunks) -> dict:
         """
-        Converse with the GPT-4O model using the provided text and question.
+        Map-reduce variant of get_pdf_data for minutes that are too long for
+        one completion: every chunk goes through the pdf_prompts extraction
+        concurrently and the row arrays are merged into one
+        {columns, response} object.
 
         Args:
-            text (str): The text to analyze.
-            question (str): The question to ask.
-            json_response (bool): Whether to format the response as JSON.
+            text (str): The full extracted text.
+            chunks (list): The text split into token-bounded chunks.
 
         Returns:
-            dict: The response from the GPT-4O model.
+            dict: Same shape as get_pdf_data_async; usage is summed over the
+            chunks.
         """
-        messages_ =[
-            {
-                "role": "system",
-                "content": "You are a Data Analyst working a city municipality. The municipality records minutes of its meetings, that correspond to many different departments such as Planning Commission Zoning Department, Land Use, Community Development,Urban Planning etc",
-            },
-            {
-                "role": "user",
-                "content": f"{' '.join(chat_pdf_prompts)} {json_message if json_response else ''}",
-            }, 
-            {
-                "role": "user",
-                "content": text,
-            }, 
-            {
-                "role": "user",
-                "content": question,
-            },            
-        ]        
+        results = await asyncio.gather(*[self.get_pdf_data_async(chunk) for chunk in chunks])
+        usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        for result in results:
+            for field in usage:
+                usage[field] += result["usage"].get(field) or 0
+        usage["cache_hit"] = all(result["usage"].get("cache_hit") for result in results)
+        usage["chunks"] = len(chunks)
+        merged = merge_pdf_data([result["response"] for result in results])
+        print(f'Merged {len(merged["response"])} rows from {len(chunks)} chunks')
+        return {
+            "usage": usage,
+            "text": text,
+            "response": json.dumps(merged)
+        }
+
+    def num_tokens_content(self, content, model="gpt-4o-mini"):
+        """Return the number of tokens in a piece of text."""
+        return get_tokenizer(model).count(content)
+
+    def _question_message(self, question, json_response):
+        content = f"{chat_table_message}\n\n{question}" if json_response else question
+        return {"role": "user", "content": content}
+
+    def _converse_messages(self, text, question, json_response, session=None, excerpts=None):
+        # The system message and the transcript come first and never change
+        # within a session, so follow-ups share a cacheable prompt prefix.
+        # Earlier turns follow, then excerpts retrieved for this question
+        # only, and the question always goes last.
         messages = [
             {
             "role": "system",
-            "content": "You are an AI assistant analyzing transcripts from city municipality meetings. These transcripts cover various departments such as Planning Commission, Zoning Department, Land Use, Community Development, and Urban Planning. Your task is to understand the content, identify people who spoke and understand what they said, regarding key points, identify important decisions, and answer questions about the meeting content."
+            "content": chat_system_message
             },
             {
             "role": "user",
             "content": f"Here is a transcript from a recent municipality meeting:\n\n{text}\n\nPlease answer the following question."
             },
         ]
-        if json_response:
+        if session is not None:
+            if session["earlier"]:
+                messages.append({
+                    "role": "user",
+                    "content": "Questions already answered earlier in this conversation:\n"
+                        + '\n'.join(f"- {earlier}" for earlier in session["earlier"]),
+                })
+            for turn in session["turns"]:
+                messages.append(self._question_message(turn["question"], turn["is_table"]))
+                messages.append({"role": "assistant", "content": turn["answer"]})
+        if excerpts:
             messages.append({
                 "role": "user",
-                "content": "Make sure your response is strictly a json object that looks like {'data': []}and that I can display in React antd Table component!",
+                "content": f"More excerpts from the transcript, relevant to the next question:\n\n{excerpts}",
             })
-            messages.append({
-                "role": "user",
-                "content": question,
-            }
-        )
+        messages.append(self._question_message(question, json_response))
+        return messages
+
+    def converse(self, text, question, json_response) -> str:
+        """
+        Converse with the GPT-4O model using the provided text and question.
+
+        Args:
+            text (str): The text to analyze.
+            question (str): The question to ask.
+            json_response (bool): Whether to format the response as JSON.
+
+        Returns:
+            dict: The response from the GPT-4O model.
+        """
+        messages = self._converse_messages(text, question, json_response)
         try:
             if json_response :
                 response = self.chat_completion(
@@ -171,11 +384,86 @@ class GPT4OClient(BaseGPTClient):
         except Exception as e:
             raise Exception("Error fetching response from GPT") from e
          
-        description = response.choices[0].message.content
-        if description is None or description.strip() == "":
-            description = "I apologize, but I am having difficulty providing a detailed description of this image. The image quality or content may be challenging for me to interpret accurately. Please provide additional guidance or consider uploading a clearer image if possible."
-        response = {
-            "usage": response.usage,
-            "response" : description.strip() 
+        return self._format_response(response)
+
+    async def converse_async(self, text, question, json_response, session=None, excerpts=None) -> dict:
+        """
+        Async variant of converse.
+
+        Args:
+            text (str): The text to analyze.
+            question (str): The question to ask.
+            json_response (bool): Whether to format the response as JSON.
+            session (dict): Optional chat session (see src.store.conversations)
+                whose earlier turns are sent before the question.
+            excerpts (str): Transcript chunks retrieved for this question that
+                are not part of text.
+
+        Returns:
+            dict: The response from the GPT-4O model.
+        """
+        messages = self._converse_messages(text, question, json_response, session, excerpts)
+        try:
+            usage, description = await self._cached_completion(
+                "converse",
+                messages=messages,
+                max_tokens=10000,
+                response_format={"type": "json_object" if json_response else "text"}
+            )
+        except Exception as e:
+            raise Exception("Error fetching response from GPT") from e
+
+        return {
+            "usage": usage,
+            "response": description
         }
-        return response 
\ No newline at end of file
+
+    async def converse_stream(self, text, question, json_response, session=None, excerpts=None):
+        """
+        Stream the answer to a question as it is generated.
+
+        Args:
+            text (str): The text to analyze.
+            question (str): The question to ask.
+            json_response (bool): Whether to format the response as JSON.
+            session (dict): Optional chat session, as for converse_async.
+            excerpts (str): Extra transcript chunks, as for converse_async.
+
+        Yields:
+            dict: {"token": str} for every content delta, then a final
+            {"usage": CompletionUsage} once the completion has finished.
+        """
+        messages = self._converse_messages(text, question, json_response, session, excerpts)
+        response_format = {"type": "json_object" if json_response else "text"}
+        key = None
+        if self.response_cache is not None:
+            # Same key as converse_async, so streamed and plain answers share entries
+            key = self._response_cache_key("converse", messages, response_format)
+            cached = await self.response_cache.aget(key)
+            if cached is not None:
+                yield {"token": cached["response"]}
+                yield {"usage": self._usage_dict(cached["usage"], cache_hit=True)}
+                return
+        usage = None
+        tokens = []
+        try:
+            async with aclosing(self.chat_completion_stream(
+                messages=messages,
+                max_tokens=10000,
+                response_format=response_format
+            )) as chunks:
+                async for chunk in chunks:
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        tokens.append(chunk.choices[0].delta.content)
+                        yield {"token": chunk.choices[0].delta.content}
+        except Exception as e:
+            raise Exception("Error fetching response from GPT") from e
+        if usage is not None:
+            print(f'Tokens : {usage.prompt_tokens}')
+            usage = self._usage_dict(usage)
+            description = ''.join(tokens).strip()
+            if key is not None and description:
+                await self.response_cache.aset(key, {"usage": usage, "response": description})
+        yield {"usage": usage}
@@ -1,14 +1,46 @@
 import os
 from src.client_models.gpt4o_client import GPT4OClient
-from src.client_models.blobstorage_client import BlobStorageClient
+from src.client_models.blobstorage_client import BlobStorageClient, AsyncBlobStorageClient
+from src.store.response_cache import ResponseCache
+from src.utils.pdf_extraction import PdfExtractor
+
+# Set WJ_RESPONSE_CACHE_PATH to an empty string to disable the cache
+response_cache_path = os.getenv("WJ_RESPONSE_CACHE_PATH", "data/response_cache.sqlite3")
+response_cache = None
+if response_cache_path:
+    response_cache = ResponseCache(
+        path=response_cache_path,
+        max_bytes=int(os.getenv("WJ_RESPONSE_CACHE_MAX_MB", "512")) * 1024 * 1024,
+        ttl_seconds=int(os.getenv("WJ_RESPONSE_CACHE_TTL", str(60 * 60 * 24 * 30))),
+    )
 
 gpt4omini_client = GPT4OClient(
     api_base=os.getenv("WJ_OPENAI_API_BASE"),
     api_key=os.getenv("WJ_OPENAI_API_KEY"),
     api_version=os.getenv("GPT4oMiniV_API_VERSION"),
     deployment_name=os.getenv("WJ_DEPLOYMENT_NAME_4omini"),
+    max_concurrency=int(os.getenv("WJ_OPENAI_MAX_CONCURRENCY", "8")),
+    response_cache=response_cache,
+    # Deployment quotas; 0 leaves that budget off
+    tokens_per_minute=int(os.getenv("WJ_OPENAI_TPM", "0")),
+    requests_per_minute=int(os.getenv("WJ_OPENAI_RPM", "0")),
+    min_concurrency=int(os.getenv("WJ_OPENAI_MIN_CONCURRENCY", "1")),
+    max_retries=int(os.getenv("WJ_OPENAI_MAX_RETRIES", "6")),
 )
 
+# WJ_BLOB_CONNECTION_STRING overrides the account, e.g. "UseDevelopmentStorage=true" for Azurite
 blobstorage_client = BlobStorageClient(
-    access_key=os.getenv("WJ_BLOB_ACCESS_KEY")
-);
\ No newline at end of file
+    access_key=os.getenv("WJ_BLOB_ACCESS_KEY"),
+    conn_str=os.getenv("WJ_BLOB_CONNECTION_STRING"),
+);
+
+async_blobstorage_client = AsyncBlobStorageClient(
+    access_key=os.getenv("WJ_BLOB_ACCESS_KEY"),
+    max_connections=int(os.getenv("WJ_BLOB_MAX_CONNECTIONS", "64")),
+    conn_str=os.getenv("WJ_BLOB_CONNECTION_STRING"),
+)
+
+pdf_extractor = PdfExtractor(
+    max_workers=int(os.getenv("WJ_PDF_WORKERS", "0")) or None,
+    timeout=float(os.getenv("WJ_PDF_TIMEOUT", "300")),
+)
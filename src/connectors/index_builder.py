@@ -0,0 +1,353 @@
+"""
+Concurrent minutes-index builder.
+
+Source blobs live under `{place}/{department}/{filename}` in wipjar-pdfs,
+where filename starts with the meeting date (`{date}_...`). Every date
+prefix becomes one `{place}/{department}/{date}_{tokens}.txt` blob in
+wipjar-minutes-index, packed with one compressed segment per source
+document (see src.utils.minutes_format). An IndexManifest records the
+source ETags each index was built from, so reruns only touch prefixes that
+changed.
+
+Downloads are bounded by a semaphore, PDF parsing runs on the shared
+process pool and uploads are pipelined: a prefix gives up its slot as soon
+as its text is ready, so the next prefix downloads while this one uploads.
+"""
+import asyncio
+import re
+import time
+from uuid import uuid4
+from src.connectors.index_manifest import IndexManifest
+from src.utils.pdf_extraction import clean_text
+
+SOURCE_CONTAINER = 'wipjar-pdfs'
+INDEX_CONTAINER = 'wipjar-minutes-index'
+
+
+def prefix_date(blob_name: str) -> str:
+    return blob_name.split('/')[2].split('_')[0]
+
+
+class IndexJob:
+    """
+    Progress of one index run: a status per (place, department, date) and
+    running throughput counters. publish, when given, is called with
+    to_dict() as the job progresses (at most once a second, plus on start
+    and finish) so the status can be shared.
+    """
+    def __init__(self, place: str, publish=None, job_id: str = None) -> None:
+        self.id = job_id or str(uuid4())
+        self.place = place
+        self.status = "pending"
+        self.started = None
+        self.finished = None
+        self.tasks = {}
+        self.documents = 0
+        self.bytes_downloaded = 0
+        self.tokens = 0
+        self.uploads = 0
+        self.failures = 0
+        self.skipped = 0
+        self.publish = publish
+        self._published = 0.0
+
+    def start(self):
+        self.status = "running"
+        self.started = time.time()
+        self.changed(force=True)
+
+    def finish(self, status="done"):
+        self.status = status
+        self.finished = time.time()
+        self.changed(force=True)
+
+    def set_task(self, task_id, status, **info):
+        self.tasks[task_id] = {"status": status, **info}
+        self.changed()
+
+    def changed(self, force=False):
+        # Throttled: a city has hundreds of prefixes changing state
+        now = time.monotonic()
+        if self.publish is not None and (force or now - self._published >= 1.0):
+            self._published = now
+            self.publish(self.to_dict())
+
+    def to_dict(self):
+        elapsed = ((self.finished or time.time()) - self.started) if self.started else 0.0
+        return {
+            "job_id": self.id,
+            "type": "index",
+            "place": self.place,
+            "status": self.status,
+            "elapsed_seconds": round(elapsed, 3),
+            "stats": {
+                "prefixes": len(self.tasks),
+                "prefixes_done": sum(1 for task in self.tasks.values() if task["status"] in ("done", "deleted")),
+                "documents": self.documents,
+                "bytes_downloaded": self.bytes_downloaded,
+                "tokens": self.tokens,
+                "uploads": self.uploads,
+                "failures": self.failures,
+                "skipped_unchanged": self.skipped,
+                "documents_per_second": round(self.documents / elapsed, 3) if elapsed else 0.0,
+                "bytes_per_second": round(self.bytes_downloaded / elapsed, 1) if elapsed else 0.0,
+            },
+            "tasks": self.tasks,
+        }
+
+
+class IndexBuilder:
+    def __init__(self, manager, download_concurrency: int = 16, upload_concurrency: int = 4, prefix_concurrency: int = 8) -> None:
+        self.manager = manager
+        self.download_concurrency = download_concurrency
+        self.upload_concurrency = upload_concurrency
+        self.prefix_concurrency = prefix_concurrency
+        self._downloads = None
+        self._uploads = None
+        self._prefixes = None
+        self._manifest_locks = {}
+
+    def _slots(self):
+        # Created lazily so they bind to the server's event loop
+        if self._downloads is None:
+            self._downloads = asyncio.Semaphore(self.download_concurrency)
+            self._uploads = asyncio.Semaphore(self.upload_concurrency)
+            self._prefixes = asyncio.Semaphore(self.prefix_concurrency)
+
+    @property
+    def async_blobstorage_client(self):
+        return self.manager.async_blobstorage_client
+
+    async def _read_section(self, blob_name: str, job: IndexJob = None) -> str:
+        async with self._downloads:
+            content = await self.async_blobstorage_client.get_blob_content(SOURCE_CONTAINER, blob_name)
+        if content is None:
+            raise IOError(f'Blob {blob_name} not found')
+        if job is not None:
+            job.bytes_downloaded += len(content)
+        if blob_name.rsplit('.', 1)[-1] == 'txt':
+            text = content.decode('utf-8')
+        else:
+            text = await self.manager.pdf_extractor.extract_text_async(content)
+        if job is not None:
+            job.documents += 1
+        return f"{blob_name.split('/')[2]} \n" + clean_text(text)
+
+    async def _build_text(self, blob_names, job: IndexJob = None):
+        results = await asyncio.gather(*[self._read_section(name, job) for name in blob_names], return_exceptions=True)
+        sections = []
+        failed = []
+        messages = ''
+        for blob_name, result in zip(blob_names, results):
+            if isinstance(result, Exception):
+                failed.append(blob_name)
+                messages += f'Failed reading the file {blob_name}: {str(result)}'
+                print(messages)
+            else:
+                sections.append((blob_name.split('/')[2], result))
+        counts = await asyncio.to_thread(self.manager.tokenizer.count_batch, [text for _, text in sections])
+        sections = [(name, text, tokens) for (name, text), tokens in zip(sections, counts)]
+        return sections, sum(counts), messages, failed
+
+    async def _upload(self, blob_name: str, sections, job: IndexJob = None):
+        async with self._uploads:
+            blob = await self.async_blobstorage_client.save_minutes_index(INDEX_CONTAINER, blob_name, sections)
+        self.manager.prefix_index.upsert(INDEX_CONTAINER, blob_name, blob["size"], blob["etag"], blob["last_modified"])
+        if job is not None:
+            job.uploads += 1
+        print(f'Saved minutes index for {blob_name}')
+
+    async def _delete_index(self, blob_name: str):
+        await self.async_blobstorage_client.delete_blob(INDEX_CONTAINER, blob_name)
+        self.manager.prefix_index.remove(INDEX_CONTAINER, blob_name)
+
+    async def build_prefix(self, place: str, department: str, date: str, blob_names=None, job: IndexJob = None):
+        """
+        Build and upload the minutes index of one (place, department, date).
+
+        Args:
+            blob_names (list): Source blobs of the prefix, when the caller has
+                already listed them.
+
+        Returns:
+            dict: {"text", "tokens", "blob_name", "message", "failed"};
+            blob_name is None when no source could be read and nothing was
+            uploaded.
+        """
+        self._slots()
+        task_id = f'{place}-{department}-{date}'
+        if job is not None:
+            job.set_task(task_id, "pending")
+        async with self._prefixes:
+            if blob_names is None:
+                blob_names = await self.async_blobstorage_client.list_blob_names(
+                    SOURCE_CONTAINER, f'{place}/{department}/{date}'
+                )
+            if job is not None:
+                job.set_task(task_id, "extracting", documents=len(blob_names))
+            sections, tokens, messages, failed = await self._build_text(blob_names, job)
+        if job is not None:
+            job.failures += len(failed)
+        if not sections:
+            # Nothing could be read: keep whatever index the prefix has
+            if job is not None:
+                job.set_task(task_id, "failed", documents=len(blob_names), message=messages or "No documents")
+            return {"text": "", "tokens": 0, "blob_name": None, "message": messages, "failed": failed}
+        index_blob = f'{place}/{department}/{date}_{tokens}.txt'
+        if job is not None:
+            job.tokens += tokens
+            job.set_task(task_id, "uploading", documents=len(blob_names), tokens=tokens)
+        await self._upload(index_blob, sections, job)
+        if job is not None:
+            job.set_task(task_id, "done", documents=len(blob_names), tokens=tokens, blob_name=index_blob, message=messages)
+        text = '\n'.join(text for _, text, _ in sections)
+        return {"text": text, "tokens": tokens, "blob_name": index_blob, "message": messages, "failed": failed}
+
+    async def _delete_stale_indexes(self, place, department, date, keep):
+        """
+        Delete every `{date}_{tokens}.txt` index blob of a prefix except keep.
+        Used when the manifest has no entry saying which blob the prefix had.
+        """
+        prefix = f'{place}/{department}/{date}_'
+        for name in await self.async_blobstorage_client.list_blob_names(INDEX_CONTAINER, prefix):
+            if name != keep and re.fullmatch(r'\d+\.txt', name[len(prefix):]):
+                await self._delete_index(name)
+                print(f'Deleted stale minutes index {name}')
+
+    async def _rebuild(self, place, department, date, sources, manifest, job=None):
+        """
+        Build one prefix from the given sources, drop the index blob it
+        replaces (its name carries the old token count) and record it.
+        """
+        result = await self.build_prefix(place, department, date, sorted(sources), job)
+        if result["blob_name"] is None:
+            # The manifest keeps the old entry, so the next run retries
+            return result
+        previous = manifest.get(department, date)
+        if previous is None:
+            # First manifest run for this prefix: an index written before the
+            # manifest existed may carry a different token count
+            await self._delete_stale_indexes(place, department, date, result["blob_name"])
+        elif previous["index_blob"] != result["blob_name"]:
+            await self._delete_index(previous["index_blob"])
+        # Sources that failed to read stay out of the manifest so the next run retries them
+        built = {name: etag for name, etag in sources.items() if name not in result["failed"]}
+        manifest.record(department, date, built, result["blob_name"], result["tokens"])
+        return result
+
+    async def _delete_prefix(self, place, department, date, manifest, job=None):
+        previous = manifest.remove(department, date)
+        if previous:
+            await self._delete_index(previous["index_blob"])
+            print(f'Deleted minutes index {previous["index_blob"]}')
+        if job is not None:
+            job.set_task(f'{place}-{department}-{date}', "deleted", blob_name=previous and previous["index_blob"])
+
+    async def _rebuild_for_job(self, place, department, date, sources, manifest, job):
+        try:
+            await self._rebuild(place, department, date, sources, manifest, job)
+        except Exception as e:
+            job.failures += 1
+            job.set_task(f'{place}-{department}-{date}', "failed", message=str(e))
+
+    async def list_departments(self, place: str):
+        """
+        Raises:
+            IOError: The places metadata could not be read.
+            ValueError: The place is not in it.
+        """
+        places, _ = await self.manager.get_places_cached()
+        if places is None:
+            raise IOError("Places metadata could not be read")
+        for entry in places:
+            if entry["name"] == place:
+                return [department["name"] for department in entry["info"]["departments"]]
+        raise ValueError(f"Unknown place {place}")
+
+    async def list_prefixes(self, place: str, departments=None):
+        """
+        Returns:
+            dict: {(department, date): {source blob name: etag}} for a place.
+        """
+        if departments is None:
+            departments = await self.list_departments(place)
+        listings = await asyncio.gather(*[
+            self.async_blobstorage_client.list_blob_properties(SOURCE_CONTAINER, f'{place}/{department}/')
+            for department in departments
+        ])
+        prefixes = {}
+        for department, blobs in zip(departments, listings):
+            for blob in blobs:
+                if '.json' in blob["name"]:
+                    continue
+                prefixes.setdefault((department, prefix_date(blob["name"])), {})[blob["name"]] = blob["etag"]
+        return prefixes
+
+    async def plan_place(self, place: str, force: bool = False):
+        """
+        Work out what a rebuild of a place would do, without doing it.
+        """
+        prefixes = await self.list_prefixes(place)
+        manifest = await IndexManifest.load(self.async_blobstorage_client, place)
+        plan = manifest.plan(prefixes, force)
+        return {
+            action: [{"department": department, "date": date} for department, date in entries]
+            for action, entries in plan.items()
+        }
+
+    async def build_place(self, place: str, job: IndexJob, force: bool = False):
+        """
+        Rebuild only the prefixes of a place whose sources were added,
+        changed or deleted since the manifest was written.
+        """
+        self._slots()
+        job.start()
+        try:
+            prefixes = await self.list_prefixes(place)
+            manifest = await IndexManifest.load(self.async_blobstorage_client, place)
+            if not prefixes and manifest.prefixes and not force:
+                # More likely a failed listing than every source deleted
+                raise IOError(
+                    f"No sources listed for {place} but its manifest has {len(manifest.prefixes)} prefixes;"
+                    " pass force to delete its index"
+                )
+            plan = manifest.plan(prefixes, force)
+            job.skipped = len(plan["unchanged"])
+            await asyncio.gather(
+                *[
+                    self._rebuild_for_job(place, department, date, prefixes[(department, date)], manifest, job)
+                    for department, date in plan["added"] + plan["changed"]
+                ],
+                *[self._delete_prefix(place, department, date, manifest, job) for department, date in plan["deleted"]],
+            )
+            await manifest.save(self.async_blobstorage_client)
+            job.finish("done" if not job.failures else "done_with_failures")
+        except Exception as e:
+            print("Index build failed", e)
+            job.finish("failed")
+        return job
+
+    async def rebuild_prefix(self, place: str, department: str, date: str):
+        """
+        Rebuild a single (place, department, date) and keep the manifest in step.
+        """
+        self._slots()
+        async with self._manifest_lock(place):
+            manifest = await IndexManifest.load(self.async_blobstorage_client, place)
+            blobs = await self.async_blobstorage_client.list_blob_properties(
+                SOURCE_CONTAINER, f'{place}/{department}/{date}'
+            )
+            sources = {blob["name"]: blob["etag"] for blob in blobs if '.json' not in blob["name"]}
+            result = await self._rebuild(place, department, date, sources, manifest)
+            await manifest.save(self.async_blobstorage_client)
+        return result
+
+    def _manifest_lock(self, place):
+        return self._manifest_locks.setdefault(place, asyncio.Lock())
+
+    async def locked_build_place(self, place: str, job: IndexJob, force: bool = False):
+        """
+        build_place, serialised with rebuild_prefix on the place's manifest.
+        """
+        async with self._manifest_lock(place):
+            return await self.build_place(place, job, force)
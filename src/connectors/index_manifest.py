@@ -0,0 +1,95 @@
+"""
+Manifest of what each minutes index was built from.
+
+One manifest per place is kept next to the indexes, at
+`_manifests/{place}.json` in wipjar-minutes-index:
+
+    {"version": 1,
+     "prefixes": {"{department}/{date}": {
+         "sources": {"{source blob}": "{etag}"},
+         "index_blob": "{place}/{department}/{date}_{tokens}.txt",
+         "tokens": 1234,
+         "built": 1718000000.0}}}
+
+Comparing it with the current source listing tells which prefixes were
+added, changed or deleted since the last build.
+"""
+import json
+import time
+
+MANIFEST_CONTAINER = 'wipjar-minutes-index'
+
+
+def manifest_blob_name(place: str) -> str:
+    return f'_manifests/{place}.json'
+
+
+def prefix_key(department: str, date: str) -> str:
+    return f'{department}/{date}'
+
+
+class IndexManifest:
+    def __init__(self, place: str, prefixes: dict = None) -> None:
+        self.place = place
+        self.prefixes = prefixes or {}
+
+    @classmethod
+    async def load(cls, blobstorage_client, place: str):
+        content = await blobstorage_client.get_blob_content(MANIFEST_CONTAINER, manifest_blob_name(place))
+        if content is None:
+            return cls(place)
+        try:
+            data = json.loads(content)
+        except json.JSONDecodeError as e:
+            print(f'Ignoring unreadable manifest for {place}: {e}')
+            return cls(place)
+        return cls(place, data.get("prefixes", {}))
+
+    async def save(self, blobstorage_client):
+        await blobstorage_client.upload_json(
+            MANIFEST_CONTAINER,
+            manifest_blob_name(self.place),
+            {"version": 1, "prefixes": self.prefixes},
+        )
+
+    def plan(self, current: dict, force: bool = False):
+        """
+        Compare the current sources with the manifest.
+
+        Args:
+            current (dict): {(department, date): {source blob name: etag}}.
+            force (bool): Treat every current prefix as changed.
+
+        Returns:
+            dict: Lists of (department, date) under added, changed, deleted
+            and unchanged.
+        """
+        plan = {"added": [], "changed": [], "deleted": [], "unchanged": []}
+        for (department, date), sources in current.items():
+            entry = self.prefixes.get(prefix_key(department, date))
+            if entry is None:
+                plan["added"].append((department, date))
+            elif force or entry["sources"] != sources:
+                plan["changed"].append((department, date))
+            else:
+                plan["unchanged"].append((department, date))
+        current_keys = {prefix_key(department, date) for department, date in current}
+        for key in self.prefixes:
+            if key not in current_keys:
+                department, date = key.rsplit('/', 1)
+                plan["deleted"].append((department, date))
+        return plan
+
+    def get(self, department: str, date: str):
+        return self.prefixes.get(prefix_key(department, date))
+
+    def record(self, department: str, date: str, sources: dict, index_blob: str, tokens: int):
+        self.prefixes[prefix_key(department, date)] = {
+            "sources": sources,
+            "index_blob": index_blob,
+            "tokens": tokens,
+            "built": time.time(),
+        }
+
+    def remove(self, department: str, date: str):
+        return self.prefixes.pop(prefix_key(department, date), None)
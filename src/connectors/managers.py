@@ -1,20 +1,76 @@
-import os
-from src.connectors.clients import gpt4omini_client, blobstorage_client
-from uuid import uuid4
-import tempfile
+from src.connectors.clients import gpt4omini_client, blobstorage_client, async_blobstorage_client, pdf_extractor
+from src.client_models.gpt4_clients import close_shared_async_http_client
+from src.utils.pdf_extraction import clean_text
+from src.utils.tokenizer import get_tokenizer
+from src.utils.chunking import split_pages
+import asyncio
 import json
-from pypdf import PdfReader
+import os
+from src.connectors.index_builder import IndexBuilder
+from src.store.places_cache import PlacesCache
+from src.store.prefix_index import BlobPrefixIndex, tokens_from_name
+from src.utils.minutes_format import (
+    HEAD_BYTES, decode_minutes_index, decode_segment, header_length, is_packed, parse_header, segment_ranges
+)
+from src.utils.retrieval import split_meetings
 
 class AzureManager:
     def __init__(self) -> None:
         self.chat_client = gpt4omini_client
         self.blobstorage_client = blobstorage_client
+        self.async_blobstorage_client = async_blobstorage_client
+        self.read_concurrency = int(os.getenv("WJ_BLOB_READ_CONCURRENCY", "16"))
+        self.prefix_index = BlobPrefixIndex(
+            async_blobstorage_client,
+            ['wipjar-minutes-index'],
+            refresh_seconds=int(os.getenv("WJ_PREFIX_INDEX_REFRESH", "600")),
+        )
+        self.places_cache = PlacesCache(async_blobstorage_client, ttl_seconds=int(os.getenv("WJ_PLACES_TTL", "300")))
+        self.pdf_extractor = pdf_extractor
+        self.tokenizer = get_tokenizer()
+        self.summary_chunk_threshold = int(os.getenv("WJ_SUMMARY_CHUNK_THRESHOLD", "12000"))
+        self.summary_chunk_tokens = int(os.getenv("WJ_SUMMARY_CHUNK_TOKENS", "6000"))
+        self.index_builder = IndexBuilder(
+            self,
+            download_concurrency=int(os.getenv("WJ_INDEX_DOWNLOAD_CONCURRENCY", "16")),
+            upload_concurrency=int(os.getenv("WJ_INDEX_UPLOAD_CONCURRENCY", "4")),
+            prefix_concurrency=int(os.getenv("WJ_INDEX_PREFIX_CONCURRENCY", "8")),
+        )
+
+    async def get_file_summary(self, text: str, pages=None, chunked: bool = None):
+        """
+        Summarize extracted minutes. Text over summary_chunk_threshold tokens
+        (or any text, with chunked=True) is split on page and agenda item
+        boundaries and the chunks are summarized concurrently.
 
-    def get_file_summary(self, text: str):
-        return self.chat_client.get_pdf_data(text)
+        Args:
+            text (str): The extracted text.
+            pages (list): The page texts, when known, to split on page boundaries.
+            chunked (bool): Force (True) or disable (False) chunked mode.
+        """
+        if chunked is None:
+            chunked = await asyncio.to_thread(self.tokenizer.count, text) > self.summary_chunk_threshold
+        if not chunked:
+            return await self.chat_client.get_pdf_data_async(text)
+        chunks = await asyncio.to_thread(split_pages, pages or [text], self.summary_chunk_tokens, self.tokenizer.count_batch)
+        if len(chunks) == 1:
+            return await self.chat_client.get_pdf_data_async(text)
+        return await self.chat_client.get_pdf_data_chunked(text, chunks)
     
+    def warm_up(self):
+        """
+        Import the SDKs, build the clients and load the tokenizer ahead of
+        the first request that needs them. Blocking; run it off the loop.
+        """
+        self.chat_client.dispatcher
+        self.tokenizer.encoding
+        self.blobstorage_client.blobstorage_client
+
     def get_full_index(self):
         return self.blobstorage_client.get_full_index()
+
+    async def get_full_index_async(self):
+        return await self.async_blobstorage_client.get_full_index()
     
     def get_places(self):
         try:
@@ -35,59 +91,137 @@ class AzureManager:
         except Exception as e:
             print("Error parsing blob ", e)
     
+    async def get_places_cached(self):
+        """
+        Returns:
+            tuple: (places, etag) from the places cache; (None, None) if the
+            metadata cannot be read.
+        """
+        try:
+            return await self.places_cache.get()
+        except Exception as e:
+            print("Error parsing blob ", e)
+            return None, None
+
     def read_txt_pdf_blob(self, blob_name, container_name = 'wipjar-pdfs'):
         suffix = blob_name.split('.')[1]
         print('-->', suffix)
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
-            content = self.blobstorage_client.get_blob_content(container_name, blob_name)
-            temp_file.write(content)
-            temp_file_path = temp_file.name
+        content = self.blobstorage_client.get_blob_content(container_name, blob_name)
+        if content is None:
+            raise IOError(f'Blob {blob_name} not found')
         if suffix == "txt":
             text = content.decode('utf-8')
         else : 
-            reader = PdfReader(temp_file_path)
-            # reader = None
-            number_of_pages = len(reader.pages)
-            content = []
-            print(number_of_pages)
-            for page in reader.pages:
-                pgcontent = page.extract_text()
-                content.append(pgcontent)
-            text = '\n'.join(content)
-            # Extract text from the PDF using textract
-            # text = textract.process(temp_file_path, method='pdfminer').decode('utf-8')
-            os.unlink(temp_file_path)
-
-        # Remove the temporary file
-        text = text.replace('\n\n\n', '\n')
-        text = text.replace('\n\n', '\n')
-        text = text.replace('\n \n', '\n')  
-
-        return text
+            text = self.pdf_extractor.extract_text(content)
+
+        return clean_text(text)
+
+    async def extract_upload_pages_async(self, upload, suffix: str):
+        """
+        Extract and clean the page texts of an uploaded .txt or .pdf (a
+        SpooledUpload) without blocking the event loop. A .txt file is a
+        single page; a PDF spooled to disk is read by the workers from its
+        path instead of being copied into memory.
+        """
+        if suffix == ".txt":
+            pages = [await asyncio.to_thread(upload.read_text)]
+        else :
+            pages = await self.pdf_extractor.extract_pages_async(upload.source())
+        return [clean_text(page) for page in pages]
+
+    async def read_minutes_index_selected(self, blob_name, select, container_name = 'wipjar-minutes-index'):
+        """
+        Read only the meetings of a minutes index for which select(segment)
+        is true; segment is a header entry (name, date, tokens, ...).
+
+        Packed indexes are read with range requests: the header, then the
+        selected segments, adjacent ones merged into one request. Older
+        indexes are downloaded whole and filtered by meeting header.
+
+        Returns:
+            str: The selected meetings' text, or None if the blob does not exist.
+        """
+        client = self.async_blobstorage_client
+        head = await client.get_blob_range(container_name, blob_name, 0, HEAD_BYTES)
+        if head is None:
+            return None
+        complete = len(head) < HEAD_BYTES
+        if not is_packed(head):
+            content = head if complete else await client.get_blob_content(container_name, blob_name)
+            if content is None:
+                return None
+            meetings = split_meetings(await asyncio.to_thread(decode_minutes_index, content))
+            return '\n'.join(
+                (f'{name} {body}' if name else body).rstrip('\n')
+                for name, date, body in meetings if select({"name": name, "date": date})
+            )
+        start = header_length(head)
+        if start > len(head) and not complete:
+            rest = await client.get_blob_range(container_name, blob_name, len(head), start - len(head))
+            if rest is None:
+                # Deleted since the first read
+                return None
+            head += rest
+        segments = [segment for segment in parse_header(head) if select(segment)]
+
+        async def fetch(offset, length):
+            if start + offset + length <= len(head):
+                return head[start + offset:start + offset + length]
+            return await client.get_blob_range(container_name, blob_name, start + offset, length)
+
+        groups = segment_ranges(segments, max_gap=4096)
+        datas = await asyncio.gather(*[fetch(offset, length) for offset, length, _ in groups])
+        if any(data is None for data in datas):
+            return None
+        texts = {}
+        for (offset, _, members), data in zip(groups, datas):
+            for segment in members:
+                begin = segment["offset"] - offset
+                texts[segment["offset"]] = decode_segment(data[begin:begin + segment["length"]])
+        return '\n'.join(texts[segment["offset"]] for segment in segments)
+
+    async def read_minutes_indexes(self, blob_names, container_name = 'wipjar-minutes-index', select=None):
+        """
+        Download many minutes indexes concurrently. With select, only the
+        matching meetings are fetched (see read_minutes_index_selected).
+
+        Yields:
+            tuple: (blob_name, text) as each download finishes; missing blobs are skipped.
+        """
+        if select is None:
+            async for blob_name, content in self.async_blobstorage_client.read_many(container_name, blob_names, self.read_concurrency):
+                if content is None:
+                    print(f'Minutes index {blob_name} not found')
+                    continue
+                yield blob_name, await asyncio.to_thread(decode_minutes_index, content)
+            return
+        slots = asyncio.Semaphore(self.read_concurrency)
+
+        async def read(blob_name):
+            async with slots:
+                return blob_name, await self.read_minutes_index_selected(blob_name, select, container_name)
+
+        tasks = [asyncio.create_task(read(blob_name)) for blob_name in blob_names]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                blob_name, text = await next_done
+                if text is None:
+                    print(f'Minutes index {blob_name} not found')
+                    continue
+                yield blob_name, text
+        finally:
+            for task in tasks:
+                task.cancel()
 
     async def write_pdf_as_index(self, place, department, date, task_statuses):
+        task_id = f'{place}-{department}-{date}'
         try:
-            task_id = f'{place}-{department}-{date}'
             task_statuses[task_id] = "Task is pending..."
-            blobs = self.blobstorage_client.read_directories('wipjar-pdfs', starts_with=f'{place}/{department}/{date}')  
-            text = ''
-            tokens = 0
-            messages = ''
-            for blob_name in blobs:
-                date_time = blob_name.split('/')[2]
-                try:
-                    text += f'{date_time} \n' + self.read_txt_pdf_blob(blob_name) 
-                    num_tokens = self.chat_client.num_tokens_content(text) 
-                    print(num_tokens)
-                    tokens += num_tokens
-                except IOError as e:
-                    error_message += f'Failed reading the file {blob_name}: {str(e)}'
-                    messages += error_message    
-                    print(messages)
-            self.blobstorage_client.save_minutes_index('wipjar-minutes-index', f'{place}/{department}/{date}_{tokens}.txt', text)
-            print(f'Saved minutes index for {place}/{department}/{date}')
-            task_statuses[task_id] = f"File has been written. {messages}"
-            return {"text": text, "tokens": tokens}
+            result = await self.index_builder.rebuild_prefix(place, department, date)
+            if result["blob_name"] is None:
+                raise IOError(f"No documents could be read. {result['message']}")
+            task_statuses[task_id] = f"File has been written. {result['message']}"
+            return {"text": result["text"], "tokens": result["tokens"]}
         except Exception as e:
             task_statuses[task_id] = {"failed": True, "message": str(e)} 
             return {"failed": True, "message": str(e)}
@@ -98,7 +232,30 @@ class AzureManager:
 
 
     def get_directories(self, starts_with, container_name = 'wipjar-pdfs'):
+        if self.prefix_index.loaded(container_name):
+            return self.prefix_index.names(container_name, starts_with)
         return self.blobstorage_client.read_directories(container_name, starts_with)
 
-    def get_answer_from_pdf(self, text: str, question: str, json_response: bool):
-        return self.chat_client.converse(text, question, json_response)
\ No newline at end of file
+    def get_index_entries(self, starts_with, container_name = 'wipjar-minutes-index'):
+        """
+        Like get_directories, but returns the prefix index entries (name, size,
+        etag, last_modified, tokens) instead of bare names.
+        """
+        if self.prefix_index.loaded(container_name):
+            return self.prefix_index.query(container_name, starts_with)
+        return [
+            {"name": name, "etag": None, "last_modified": None, "size": None, "tokens": tokens_from_name(name)}
+            for name in self.blobstorage_client.read_directories(container_name, starts_with)
+        ]
+
+    async def get_answer_from_pdf(self, text: str, question: str, json_response: bool, session: dict = None, excerpts: str = None):
+        return await self.chat_client.converse_async(text, question, json_response, session, excerpts)
+
+    def stream_answer_from_pdf(self, text: str, question: str, json_response: bool, session: dict = None, excerpts: str = None):
+        return self.chat_client.converse_stream(text, question, json_response, session, excerpts)
+
+    async def close(self):
+        self.pdf_extractor.shutdown()
+        await self.async_blobstorage_client.close()
+        await self.chat_client.aclose()
+        await close_shared_async_http_client()
\ No newline at end of file
@@ -0,0 +1,240 @@
+"""
+Bounded, prioritised worker pool for long-running work.
+
+Handlers are registered per job type with a default priority (lower runs
+first) and a per-process concurrency cap. Jobs are persisted in a JobStore
+before they run, so they survive restarts: a graceful shutdown puts running
+jobs back in the queue, and a crashed worker's jobs are requeued once their
+heartbeat goes stale. Handlers registered as local run in the process
+that submits the job instead of being claimed from the shared queue.
+"""
+import asyncio
+import os
+import time
+from collections import Counter
+from uuid import uuid4
+from src.jobs.store import FINISHED
+from src.utils.metrics import JOBS_IN_FLIGHT, current_endpoint
+
+
+class JobHandler:
+    def __init__(self, run, priority: int, max_concurrency: int, local: bool = False) -> None:
+        self.run = run
+        self.priority = priority
+        self.max_concurrency = max_concurrency
+        self.local = local
+        # Local jobs skip claiming, so their cap is enforced when they run
+        self.slots = asyncio.Semaphore(max_concurrency) if local else None
+
+
+_NO_PROGRESS = object()
+
+
+class JobContext:
+    """
+    Passed to handlers as their first argument.
+    """
+    def __init__(self, queue, job) -> None:
+        self.queue = queue
+        self.id = job["id"]
+        self.type = job["type"]
+        self._progress = _NO_PROGRESS
+        self._writer = None
+
+    def progress(self, progress):
+        """
+        Record progress (any JSON value) for /task-status. The write runs
+        on a thread; calls made while one is in flight are coalesced, so
+        only the latest value is written next.
+        """
+        self._progress = progress
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_progress())
+
+    async def _write_progress(self):
+        while self._progress is not _NO_PROGRESS:
+            progress, self._progress = self._progress, _NO_PROGRESS
+            await asyncio.to_thread(self.queue.store.set_progress, self.id, progress)
+
+    async def flush(self):
+        """Wait until the latest progress has been written."""
+        if self._writer is not None:
+            await self._writer
+
+
+class JobQueue:
+    def __init__(self, store, workers: int = 4, poll_seconds: float = 2.0, heartbeat_seconds: float = 15.0, max_attempts: int = 3) -> None:
+        self.store = store
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.max_attempts = max_attempts
+        self.worker_id = f'{os.getpid()}-{uuid4().hex[:8]}'
+        self.handlers = {}
+        self.running = {}
+        self.running_types = Counter()
+        self._wake = None
+        self._tasks = []
+        self._stopping = False
+
+    def register(self, job_type: str, run, priority: int = 10, max_concurrency: int = 1, local: bool = False):
+        """
+        Args:
+            job_type (str): Name stored with each job.
+            run (callable): async run(context, **payload) returning a JSON-serialisable result.
+            priority (int): Default priority; lower values are claimed first.
+            max_concurrency (int): Jobs of this type running at once in this process.
+            local (bool): Run jobs of this type in the process that submits
+                them, e.g. when their results go to a process-local cache.
+        """
+        self.handlers[job_type] = JobHandler(run, priority, max_concurrency, local)
+
+    async def submit(self, job_type: str, payload: dict, priority: int = None, job_id: str = None) -> str:
+        if job_type not in self.handlers:
+            raise ValueError(f"Unknown job type {job_type}")
+        handler = self.handlers[job_type]
+        if priority is None:
+            priority = handler.priority
+        if handler.local:
+            job_id = await asyncio.to_thread(self.store.create, job_type, payload, priority, job_id, self.worker_id)
+            self._launch(await asyncio.to_thread(self.store.get, job_id))
+            return job_id
+        job_id = await asyncio.to_thread(self.store.create, job_type, payload, priority, job_id)
+        if self._wake is not None:
+            self._wake.set()
+        return job_id
+
+    async def cancel(self, job_id: str):
+        status = await asyncio.to_thread(self.store.request_cancel, job_id)
+        task = self.running.get(job_id)
+        if task is not None:
+            task.cancel()
+        return status
+
+    async def get(self, job_id: str):
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def list(self, limit: int = 100, status: str = None):
+        return await asyncio.to_thread(self.store.list, limit, status)
+
+    async def wait(self, job_id: str, max_delay: float = 1.0):
+        """
+        Return the job once it has finished. A job running in this process
+        is awaited directly; one in another worker is polled, every 50 ms at
+        first and backing off to max_delay.
+        """
+        delay = 0.05
+        job = await self.get(job_id)
+        while job is not None and job["status"] not in FINISHED:
+            task = self.running.get(job_id)
+            if task is not None:
+                await asyncio.wait({task})
+            else:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, max_delay)
+            job = await self.get(job_id)
+        return job
+
+    async def _recover(self):
+        requeued = await asyncio.to_thread(self.store.recover, 4 * self.heartbeat_seconds, self.max_attempts)
+        if requeued:
+            print(f'Requeued {requeued} interrupted jobs')
+            if self._wake is not None:
+                self._wake.set()
+
+    async def start(self):
+        await self._recover()
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._dispatch()), asyncio.create_task(self._heartbeat())]
+
+    async def stop(self):
+        """
+        Stop claiming, cancel running jobs and put them back in the queue so
+        the next process picks them up.
+        """
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        running = list(self.running.values())
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *running, return_exceptions=True)
+
+    def _claimed(self):
+        # Local jobs are bounded by their own slots, not by workers
+        return len(self.running) - sum(
+            self.running_types[job_type] for job_type, handler in self.handlers.items() if handler.local
+        )
+
+    def _claimable_types(self):
+        return [
+            job_type for job_type, handler in self.handlers.items()
+            if not handler.local and self.running_types[job_type] < handler.max_concurrency
+        ]
+
+    async def _dispatch(self):
+        while True:
+            while self._claimed() < self.workers:
+                job = await asyncio.to_thread(self.store.claim, self._claimable_types(), self.worker_id)
+                if job is None:
+                    break
+                self._launch(job)
+            self._wake.clear()
+            try:
+                # Other workers may enqueue into the shared store, so poll as well
+                await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def _launch(self, job):
+        task = asyncio.create_task(self._run(job))
+        self.running[job["id"]] = task
+        self.running_types[job["type"]] += 1
+        JOBS_IN_FLIGHT.inc(type=job["type"])
+
+    async def _run(self, job):
+        handler = self.handlers[job["type"]]
+        started = time.time()
+        # Runs in the job's own task context; tokens are counted against the job type
+        current_endpoint.set(f'job:{job["type"]}')
+        context = JobContext(self, job)
+        try:
+            if handler.slots is not None:
+                async with handler.slots:
+                    result = await handler.run(context, **job["payload"])
+            else:
+                result = await handler.run(context, **job["payload"])
+            await context.flush()
+            await asyncio.to_thread(self.store.finish, job["id"], "done", result)
+        except asyncio.CancelledError:
+            if self._stopping and job["pinned"]:
+                # No other process can pick it up
+                await asyncio.to_thread(self.store.finish, job["id"], "failed", None, "Worker stopped")
+            elif self._stopping:
+                await asyncio.to_thread(self.store.requeue, job["id"])
+            else:
+                await asyncio.to_thread(self.store.finish, job["id"], "cancelled")
+        except Exception as e:
+            print(f'Job {job["id"]} ({job["type"]}) failed', e)
+            await asyncio.to_thread(self.store.finish, job["id"], "failed", None, str(e))
+        finally:
+            self.running.pop(job["id"], None)
+            self.running_types[job["type"]] -= 1
+            JOBS_IN_FLIGHT.dec(type=job["type"])
+            print(f'Job {job["id"]} ({job["type"]}) finished in {time.time() - started:.1f}s')
+            if self._wake is not None:
+                self._wake.set()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            try:
+                cancelled = await asyncio.to_thread(self.store.heartbeat, list(self.running))
+                for job_id in cancelled:
+                    task = self.running.get(job_id)
+                    if task is not None:
+                        task.cancel()
+                # Jobs of a worker that died while this one keeps running
+                await self._recover()
+            except Exception as e:
+                print("Job heartbeat failed", e)
@@ -0,0 +1,202 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from uuid import uuid4
+
+FINISHED = ("done", "failed", "cancelled")
+
+
+class JobStore:
+    """
+    Durable job records in a local SQLite file (WAL mode).
+
+    Every worker process on the host opens the same file; claiming a job is
+    a single transaction, so a queued job runs in exactly one process.
+    """
+    def __init__(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, type TEXT NOT NULL, priority INTEGER NOT NULL,"
+            " status TEXT NOT NULL, payload TEXT NOT NULL, progress TEXT, result TEXT, error TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, cancel_requested INTEGER NOT NULL DEFAULT 0,"
+            " created REAL NOT NULL, started REAL, finished REAL, heartbeat REAL,"
+            " pinned INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority, created)")
+        try:
+            # Files created before jobs could be pinned
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN pinned INTEGER NOT NULL DEFAULT 0")
+        except sqlite3.OperationalError:
+            # Already there, possibly added by another worker starting at the same time
+            pass
+
+    def _to_dict(self, row):
+        if row is None:
+            return None
+        job = dict(row)
+        for field in ("payload", "progress", "result"):
+            if job[field] is not None:
+                job[field] = json.loads(job[field])
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        job["pinned"] = bool(job["pinned"])
+        return job
+
+    def create(self, job_type: str, payload: dict, priority: int, job_id: str = None, worker: str = None):
+        """
+        Queue a job. With worker, the job is instead created already running
+        in that worker and pinned to it: it is never claimed or requeued by
+        another process.
+        """
+        job_id = job_id or str(uuid4())
+        now = time.time()
+        with self._lock:
+            if worker is None:
+                self._conn.execute(
+                    "INSERT INTO jobs (id, type, priority, status, payload, created) VALUES (?, ?, ?, 'queued', ?, ?)",
+                    (job_id, job_type, priority, json.dumps(payload), now),
+                )
+            else:
+                self._conn.execute(
+                    "INSERT INTO jobs (id, type, priority, status, payload, created, worker, started, heartbeat, attempts, pinned)"
+                    " VALUES (?, ?, ?, 'running', ?, ?, ?, ?, ?, 1, 1)",
+                    (job_id, job_type, priority, json.dumps(payload), now, worker, now, now),
+                )
+        return job_id
+
+    def get(self, job_id: str):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row)
+
+    def list(self, limit: int = 100, status: str = None):
+        query = "SELECT * FROM jobs"
+        params = []
+        if status is not None:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY created DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def claim(self, job_types, worker: str):
+        """
+        Atomically move the most urgent queued job of one of job_types to
+        running. Lower priority values run first.
+        """
+        if not job_types:
+            return None
+        placeholders = ','.join('?' for _ in job_types)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    f"SELECT id FROM jobs WHERE status = 'queued' AND type IN ({placeholders})"
+                    " ORDER BY priority, created LIMIT 1",
+                    list(job_types),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, started = ?, heartbeat = ?,"
+                        " attempts = attempts + 1 WHERE id = ?",
+                        (worker, now, now, row["id"]),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get(row["id"]) if row is not None else None
+
+    def set_progress(self, job_id: str, progress):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET progress = ? WHERE id = ?", (json.dumps(progress), job_id))
+
+    def finish(self, job_id: str, status: str, result=None, error: str = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+            )
+
+    def requeue(self, job_id: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL WHERE id = ? AND status = 'running'", (job_id,)
+            )
+
+    def request_cancel(self, job_id: str):
+        """
+        Cancel a queued job right away, or flag a running one so the process
+        running it cancels it. Returns the job's status afterwards.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status = 'queued'", (now, job_id)
+            )
+            self._conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,)
+            )
+            row = self._conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row["status"] if row else None
+
+    def heartbeat(self, job_ids):
+        """
+        Mark running jobs as alive. Returns the ids whose cancellation was requested.
+        """
+        if not job_ids:
+            return []
+        placeholders = ','.join('?' for _ in job_ids)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET heartbeat = ? WHERE id IN ({placeholders})", [time.time(), *job_ids]
+            )
+            rows = self._conn.execute(
+                f"SELECT id FROM jobs WHERE cancel_requested = 1 AND id IN ({placeholders})", list(job_ids)
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def recover(self, stale_seconds: float, max_attempts: int):
+        """
+        Requeue running jobs whose process stopped sending heartbeats (crash
+        or redeploy); jobs that already used max_attempts, and pinned jobs,
+        are failed instead.
+        """
+        cutoff = time.time() - stale_seconds
+        with self._lock:
+            # Pinned jobs only make sense in the process that created them
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Worker stopped', finished = ?"
+                " WHERE status = 'running' AND heartbeat < ? AND pinned = 1",
+                (time.time(), cutoff),
+            )
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Interrupted too many times', finished = ?"
+                " WHERE status = 'running' AND heartbeat < ? AND attempts >= ?",
+                (time.time(), cutoff, max_attempts),
+            )
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL WHERE status = 'running' AND heartbeat < ?",
+                (cutoff,),
+            )
+        return cursor.rowcount
+
+    def prune(self, older_than_seconds: float):
+        with self._lock:
+            self._conn.execute(
+                f"DELETE FROM jobs WHERE status IN ({','.join('?' for _ in FINISHED)}) AND finished < ?",
+                [*FINISHED, time.time() - older_than_seconds],
+            )
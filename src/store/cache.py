@@ -1,32 +1,55 @@
-import time
+import asyncio
 from pydantic import BaseModel
-
-class CacheItem:
-    def __init__(self, value, expiry):
-        self.value = value
-        self.expiry = expiry
+from src.store.cache_backends import CacheBackend, create_cache_backend
+from src.utils.metrics import CACHE_REQUESTS
 
 class SimpleCache:
-    def __init__(self):
-        self.cache = {}
+    """
+    TTL cache bounded by entry count and total bytes, with LRU eviction.
+
+    Storage is delegated to a CacheBackend. By default the backend comes from
+    WJ_CACHE_BACKEND, so caches that must be visible to every worker get the
+    shared store when it is configured. Pass backend= explicitly for values
+    that only make sense inside this process.
+    """
+    def __init__(self, namespace: str = "default", max_entries: int = None, max_bytes: int = None, backend: CacheBackend = None):
+        self.namespace = namespace
+        self.backend = backend or create_cache_backend(namespace, max_entries, max_bytes)
 
-    def set(self, key: str, value: any, ttl_seconds: int):
-        expiry = time.time() + ttl_seconds
-        self.cache[key] = CacheItem(value, expiry)
+    def set(self, key: str, value: any, ttl_seconds: int, size: int = None):
+        self.backend.set(key, value, ttl_seconds, size)
 
     def get(self, key: str):
-        item = self.cache.get(key)
-        if item and time.time() < item.expiry:
-            return item.value
-        if item:
-            del self.cache[key]
-        return None
+        value = self.backend.get(key)
+        CACHE_REQUESTS.inc(cache=self.namespace, result="miss" if value is None else "hit")
+        return value
+
+    def delete(self, key: str):
+        self.backend.delete(key)
+
+    # For async callers: a blocking backend is called on a thread, so reads,
+    # writes and JSON (de)serialisation of large values stay off the event loop
+
+    async def aget(self, key: str):
+        if not self.backend.blocking:
+            return self.get(key)
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: any, ttl_seconds: int, size: int = None):
+        if not self.backend.blocking:
+            return self.set(key, value, ttl_seconds, size)
+        await asyncio.to_thread(self.set, key, value, ttl_seconds, size)
+
+    async def adelete(self, key: str):
+        if not self.backend.blocking:
+            return self.delete(key)
+        await asyncio.to_thread(self.delete, key)
 
     def clear_expired(self):
-        now = time.time()
-        expired_keys = [k for k, v in self.cache.items() if now > v.expiry]
-        for key in expired_keys:
-            del self.cache[key]
+        self.backend.clear_expired()
+
+    def stats(self):
+        return self.backend.stats()
 
 
 class CacheData(BaseModel):
@@ -35,4 +58,3 @@ class CacheData(BaseModel):
 
 def background_clear_cache(cache: SimpleCache):
     cache.clear_expired()
-
@@ -0,0 +1,289 @@
+"""
+Storage backends behind SimpleCache.
+
+`local` keeps entries in this process only. `sqlite` keeps them in a SQLite
+file in WAL mode, so every uvicorn worker on the host sees the same
+PDF_CACHE entries, batch ids and task statuses.
+"""
+import heapq
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+def estimate_size(value) -> int:
+    """
+    Rough deep size in bytes of a cached value. Good enough to budget the
+    text blobs and JSON-like dicts we keep in the caches.
+    """
+    if isinstance(value, (str, bytes, bytearray)):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+class CacheItem:
+    def __init__(self, value, expiry, size=0):
+        self.value = value
+        self.expiry = expiry
+        self.size = size
+
+
+class CacheBackend(ABC):
+    # Whether calls do I/O; async callers run those on a thread
+    blocking = False
+
+    def __init__(self, max_entries: int = None, max_bytes: int = None) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @abstractmethod
+    def set(self, key: str, value, ttl_seconds: int, size: int = None):
+        pass
+
+    @abstractmethod
+    def get(self, key: str):
+        pass
+
+    @abstractmethod
+    def delete(self, key: str):
+        pass
+
+    @abstractmethod
+    def clear_expired(self):
+        pass
+
+    @abstractmethod
+    def usage(self):
+        """Return (entries, bytes) currently stored."""
+        pass
+
+    def stats(self):
+        entries, size = self.usage()
+        return {
+            "backend": self.name,
+            "entries": entries,
+            "bytes": size,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class LocalCacheBackend(CacheBackend):
+    """
+    Process-local TTL cache bounded by entry count and total bytes.
+
+    Entries are kept in LRU order; when either bound is exceeded the least
+    recently used entries are evicted. Expiry times live in a min-heap so
+    clear_expired only touches entries that are actually due.
+    """
+    name = "local"
+
+    def __init__(self, max_entries: int = None, max_bytes: int = None) -> None:
+        super().__init__(max_entries, max_bytes)
+        self.cache = OrderedDict()
+        self._expiries = []
+        self._lock = threading.RLock()
+        self.bytes = 0
+
+    def set(self, key: str, value, ttl_seconds: int, size: int = None):
+        expiry = time.time() + ttl_seconds
+        if size is None:
+            size = estimate_size(value)
+        with self._lock:
+            self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                # Caching it would evict everything else and then itself
+                print(f'Not caching {key}: {size} bytes is over the cache limit')
+                return
+            self.cache[key] = CacheItem(value, expiry, size)
+            self.bytes += size
+            heapq.heappush(self._expiries, (expiry, key))
+            self._evict()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self.cache.get(key)
+            if item and time.time() < item.expiry:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return item.value
+            if item:
+                self._remove(key)
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def delete(self, key: str):
+        with self._lock:
+            self._remove(key)
+
+    def clear_expired(self):
+        now = time.time()
+        with self._lock:
+            while self._expiries and self._expiries[0][0] <= now:
+                expiry, key = heapq.heappop(self._expiries)
+                item = self.cache.get(key)
+                # Heap entries of overwritten or evicted keys are stale; skip them
+                if item is not None and item.expiry == expiry:
+                    self._remove(key)
+                    self.expirations += 1
+            if len(self._expiries) > 2 * len(self.cache) + 64:
+                self._expiries = [(item.expiry, key) for key, item in self.cache.items()]
+                heapq.heapify(self._expiries)
+
+    def usage(self):
+        with self._lock:
+            return len(self.cache), self.bytes
+
+    def _remove(self, key):
+        item = self.cache.pop(key, None)
+        if item is not None:
+            self.bytes -= item.size
+        return item
+
+    def _evict(self):
+        while self.cache and (
+            (self.max_entries is not None and len(self.cache) > self.max_entries)
+            or (self.max_bytes is not None and self.bytes > self.max_bytes)
+        ):
+            key, item = self.cache.popitem(last=False)
+            self.bytes -= item.size
+            self.evictions += 1
+
+
+class SqliteCacheBackend(CacheBackend):
+    """
+    Host-wide TTL cache in a SQLite file (WAL mode), shared by every worker
+    process that opens the same path. Values must be JSON serialisable.
+    Several caches share one file, separated by namespace.
+
+    Reads refresh an entry's access time for LRU eviction at most once
+    every touch_seconds, so a hot key is not a write on every read.
+    """
+    name = "sqlite"
+    blocking = True
+
+    def __init__(self, path: str, namespace: str, max_entries: int = None, max_bytes: int = None, touch_seconds: float = 60) -> None:
+        super().__init__(max_entries, max_bytes)
+        self.touch_seconds = touch_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, expiry REAL NOT NULL, accessed REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_expiry ON cache (namespace, expiry)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (namespace, accessed)")
+
+    def set(self, key: str, value, ttl_seconds: int, size: int = None):
+        now = time.time()
+        payload = json.dumps(value)
+        size = len(payload)
+        if self.max_bytes is not None and size > self.max_bytes:
+            # Caching it would evict everything else and then itself
+            print(f'Not caching {key}: {size} bytes is over the cache limit')
+            self.delete(key)
+            return
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache (namespace, key, value, size, expiry, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                    (self.namespace, key, payload, size, now + ttl_seconds, now),
+                )
+                self._evict()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expiry, accessed FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key)
+            ).fetchone()
+            if row and now < row[1]:
+                if now - row[2] >= self.touch_seconds:
+                    self._conn.execute(
+                        "UPDATE cache SET accessed = ? WHERE namespace = ? AND key = ?", (now, self.namespace, key)
+                    )
+                self.hits += 1
+                return json.loads(row[0])
+            if row:
+                self._conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+
+    def clear_expired(self):
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND expiry <= ?", (self.namespace, time.time())
+            )
+            self.expirations += max(cursor.rowcount, 0)
+
+    def usage(self):
+        with self._lock:
+            return self._usage()
+
+    def _usage(self):
+        entries, size = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        return entries, size
+
+    def _evict(self):
+        entries, size = self._usage()
+        while entries and (
+            (self.max_entries is not None and entries > self.max_entries)
+            or (self.max_bytes is not None and size > self.max_bytes)
+        ):
+            key, item_size = self._conn.execute(
+                "SELECT key, size FROM cache WHERE namespace = ? ORDER BY accessed LIMIT 1", (self.namespace,)
+            ).fetchone()
+            self._conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+            entries -= 1
+            size -= item_size
+            self.evictions += 1
+
+
+def create_cache_backend(namespace: str, max_entries: int = None, max_bytes: int = None) -> CacheBackend:
+    """
+    Build the backend selected by WJ_CACHE_BACKEND (`local` or `sqlite`).
+    The sqlite file lives at WJ_CACHE_PATH.
+    """
+    backend = os.getenv("WJ_CACHE_BACKEND", "local")
+    if backend == "local":
+        return LocalCacheBackend(max_entries, max_bytes)
+    if backend == "sqlite":
+        return SqliteCacheBackend(os.getenv("WJ_CACHE_PATH", "data/cache.sqlite3"), namespace, max_entries, max_bytes)
+    raise ValueError(f"Unknown cache backend {backend}")
@@ -0,0 +1,91 @@
+"""
+Chat sessions for /chat, one per loaded batch id.
+
+A session pins the context chosen for its first question, so every
+follow-up sends a byte-identical prefix (system message plus transcript)
+and the provider's prompt cache can serve it. Chunks retrieved for a
+follow-up that are not in that context are sent after the prefix. The question and answer of
+every turn are kept after that prefix, bounded by a token budget: once the
+turns exceed it, the oldest are dropped until they fit in half of it, and
+their questions are kept as a short note. Compacting in one step instead of
+a turn at a time keeps the prefix stable for several follow-ups.
+"""
+import asyncio
+from src.store.cache import SimpleCache
+
+MAX_EARLIER_QUESTIONS = 20
+
+
+class ConversationStore:
+    def __init__(self, cache: SimpleCache, count_tokens, history_tokens: int = 4000, ttl_seconds: int = 60 * 60 * 24) -> None:
+        """
+        Args:
+            cache (SimpleCache): Where sessions are kept; values are plain dicts.
+            count_tokens (callable): Returns the token counts of a list of
+                strings, one count per string.
+            history_tokens (int): Budget for the kept question/answer turns.
+            ttl_seconds (int): Session lifetime, renewed on every turn.
+        """
+        self.cache = cache
+        self.count_tokens = count_tokens
+        self.history_tokens = history_tokens
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, key: str):
+        return self.cache.get(key)
+
+    async def aget(self, key: str):
+        return await self.cache.aget(key)
+
+    def start(self, key: str, context: str, positions=None, digest: str = None) -> dict:
+        """
+        Args:
+            context (str): The pinned transcript text.
+            positions (list): Positions of the retrieval chunks it is made
+                of, or None when it is the whole text.
+            digest (str): Hash of the loaded text the session is about; a
+                session whose text has been replaced is not continued.
+        """
+        session = {
+            "key": key,
+            "digest": digest,
+            "context": context,
+            "positions": positions,
+            "turns": [],
+            "earlier": [],
+            "turn_count": 0,
+        }
+        self.cache.set(key, session, self.ttl_seconds)
+        return session
+
+    async def astart(self, key: str, context: str, positions=None, digest: str = None) -> dict:
+        return await asyncio.to_thread(self.start, key, context, positions, digest)
+
+    def delete(self, key: str):
+        self.cache.delete(key)
+
+    async def adelete(self, key: str):
+        await self.cache.adelete(key)
+
+    def append(self, session: dict, question: str, answer: str, is_table: bool = False) -> dict:
+        """
+        Record a finished turn, compact the history if it is over budget and
+        save the session.
+        """
+        tokens = sum(self.count_tokens([question, answer]))
+        session["turns"].append({"question": question, "answer": answer, "is_table": is_table, "tokens": tokens})
+        # Not derived from turns and earlier, which are both trimmed
+        session["turn_count"] += 1
+        if sum(turn["tokens"] for turn in session["turns"]) > self.history_tokens:
+            kept = session["turns"]
+            while kept and sum(turn["tokens"] for turn in kept) > self.history_tokens // 2:
+                session["earlier"].append(kept[0]["question"])
+                kept = kept[1:]
+            session["turns"] = kept
+            session["earlier"] = session["earlier"][-MAX_EARLIER_QUESTIONS:]
+        self.cache.set(session["key"], session, self.ttl_seconds)
+        return session
+
+    async def aappend(self, session: dict, question: str, answer: str, is_table: bool = False) -> dict:
+        return await asyncio.to_thread(self.append, session, question, answer, is_table)
+
@@ -0,0 +1,39 @@
+"""
+Local snapshot of the indexes loaded at startup (the test-index contents
+and the blob prefix index), so a new worker can serve from the last known
+state right away and refresh from blob storage in the background.
+"""
+import json
+import os
+import time
+
+
+def read_snapshot(path: str):
+    """
+    Returns:
+        dict: {saved_at, full_index, prefix_index}, or None when there is no
+        readable snapshot.
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f'Ignoring unreadable index snapshot {path}', e)
+        return None
+    if not isinstance(snapshot, dict) or "full_index" not in snapshot or "prefix_index" not in snapshot:
+        return None
+    return snapshot
+
+
+def write_snapshot(path: str, full_index, prefix_index):
+    # Written next to the target and renamed, so readers (and the other
+    # workers writing their own) never see a partial file
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump({"saved_at": time.time(), "full_index": full_index, "prefix_index": prefix_index}, f)
+    os.replace(temporary, path)
@@ -0,0 +1,75 @@
+import asyncio
+import hashlib
+import json
+import time
+
+PLACES_CONTAINER = 'wipjar-pdfs'
+
+
+class PlacesCache:
+    """
+    In-memory copy of the places metadata (metadata.json plus every
+    {place}/metadata.json in wipjar-pdfs).
+
+    Reads are served from memory. Once the copy is older than ttl_seconds a
+    single background refresh revalidates every file with If-None-Match, so
+    unchanged files cost a 304 and no parsing. On a cold miss the per-place
+    files are fetched concurrently.
+    """
+    def __init__(self, blobstorage_client, ttl_seconds: int = 300) -> None:
+        self.blobstorage_client = blobstorage_client
+        self.ttl_seconds = ttl_seconds
+        self.places = None
+        self.etag = None
+        self.fetched_at = 0.0
+        self._files = {}
+        self._lock = None
+        self._refreshing = None
+
+    async def get(self):
+        """
+        Returns:
+            tuple: (places list or None, ETag of the serialised list).
+        """
+        if self.places is None:
+            await self.refresh()
+        elif time.time() - self.fetched_at > self.ttl_seconds and self._refreshing is None:
+            self._refreshing = asyncio.create_task(self._background_refresh())
+        return self.places, self.etag
+
+    async def _background_refresh(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            print("Error refreshing places metadata ", e)
+        finally:
+            self._refreshing = None
+
+    async def _read(self, blob_name):
+        """
+        Return the parsed content of a metadata file, reusing the cached copy
+        when the blob has not changed.
+        """
+        cached_etag, cached_value = self._files.get(blob_name, (None, None))
+        content, etag = await self.blobstorage_client.get_blob_if_modified(PLACES_CONTAINER, blob_name, cached_etag)
+        if content is None:
+            if etag is None:
+                raise IOError(f"Error reading blob {blob_name}")
+            return cached_value
+        value = json.loads(content)
+        self._files[blob_name] = (etag, value)
+        return value
+
+    async def refresh(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            places_meta = await self._read('metadata.json')
+            names = places_meta["places"]
+            infos = await asyncio.gather(*[self._read(f'{place}/metadata.json') for place in names])
+            places = [{"name": place, "info": info} for place, info in zip(names, infos)]
+            body = json.dumps(places, sort_keys=True).encode('utf-8')
+            self.places = places
+            self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+            self.fetched_at = time.time()
+        return self.places
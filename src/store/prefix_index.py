@@ -0,0 +1,149 @@
+import asyncio
+import bisect
+import re
+import time
+
+INDEX_TOKENS = re.compile(r'_(\d+)\.txt$')
+
+
+def tokens_from_name(blob_name: str):
+    """Token count encoded in a `{date}_{tokens}.txt` minutes index name."""
+    match = INDEX_TOKENS.search(blob_name)
+    return int(match.group(1)) if match else None
+
+
+class BlobPrefixIndex:
+    """
+    Local copy of the blob names of some containers, kept as one sorted list
+    per container so a prefix query is a binary search plus a short scan.
+
+    Each name carries its size, etag, last modified time and, for minutes
+    indexes, its token count. The index is loaded once, patched by the index
+    builder as it writes and deletes, and reloaded every refresh_seconds to
+    pick up changes made elsewhere. Patches made while a reload is listing a
+    container are replayed onto the new listing, which may predate them.
+    """
+    def __init__(self, blobstorage_client, containers, refresh_seconds: int = 600) -> None:
+        self.blobstorage_client = blobstorage_client
+        self.containers = list(containers)
+        self.refresh_seconds = refresh_seconds
+        self._names = {}
+        self._entries = {}
+        # Patches recorded by each load in progress, per container
+        self._pending = {}
+        self.loaded_at = {}
+
+    def loaded(self, container_name) -> bool:
+        return container_name in self._names
+
+    async def load(self, container_name):
+        patches = []
+        self._pending.setdefault(container_name, []).append(patches)
+        try:
+            blobs = await self.blobstorage_client.list_blob_properties(container_name)
+        finally:
+            self._pending[container_name].remove(patches)
+            if not self._pending[container_name]:
+                del self._pending[container_name]
+        entries = {}
+        for blob in blobs:
+            blob["tokens"] = tokens_from_name(blob["name"])
+            entries[blob["name"]] = blob
+        for blob_name, entry in patches:
+            if entry is None:
+                entries.pop(blob_name, None)
+            else:
+                entries[blob_name] = entry
+        # Swap in whole structures so readers never see a half-built index
+        self._entries[container_name] = entries
+        self._names[container_name] = sorted(entries)
+        self.loaded_at[container_name] = time.time()
+        print(f'Prefix index loaded {len(entries)} blobs from {container_name}')
+
+    async def load_all(self) -> bool:
+        """
+        Reload every container. Returns whether all of them loaded.
+        """
+        ok = True
+        for container_name in self.containers:
+            try:
+                await self.load(container_name)
+            except Exception as e:
+                ok = False
+                print(f'Error loading prefix index for {container_name}', e)
+        return ok
+
+    async def run(self, load_first: bool = True):
+        """
+        Load every container, then keep reloading them in the background.
+        """
+        if load_first:
+            await self.load_all()
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            await self.load_all()
+
+    def snapshot(self):
+        """The loaded containers as {container: [entry, ...]}, for restore()."""
+        return {name: list(self._entries[name].values()) for name in self._names}
+
+    def restore(self, snapshot):
+        """
+        Load containers from a snapshot() taken earlier, e.g. by a previous
+        process, until load() replaces them with the live listing.
+        """
+        for container_name, blobs in snapshot.items():
+            if container_name not in self.containers or self.loaded(container_name):
+                continue
+            entries = {blob["name"]: blob for blob in blobs}
+            self._entries[container_name] = entries
+            self._names[container_name] = sorted(entries)
+        print(f'Prefix index restored {sum(len(blobs) for blobs in snapshot.values())} blobs from snapshot')
+
+    def query(self, container_name, prefix: str = ''):
+        """
+        Returns:
+            list: Entry dicts (name, etag, last_modified, size, tokens) of the
+            blobs whose name starts with prefix, sorted by name.
+        """
+        names = self._names.get(container_name, [])
+        entries = self._entries.get(container_name, {})
+        results = []
+        for i in range(bisect.bisect_left(names, prefix), len(names)):
+            if not names[i].startswith(prefix):
+                break
+            results.append(entries[names[i]])
+        return results
+
+    def names(self, container_name, prefix: str = ''):
+        return [entry["name"] for entry in self.query(container_name, prefix)]
+
+    def _record(self, container_name, blob_name, entry):
+        for patches in self._pending.get(container_name, []):
+            patches.append((blob_name, entry))
+
+    def upsert(self, container_name, blob_name, size=None, etag=None, last_modified=None):
+        entry = {
+            "name": blob_name,
+            "etag": etag,
+            "last_modified": last_modified,
+            "size": size,
+            "tokens": tokens_from_name(blob_name),
+        }
+        self._record(container_name, blob_name, entry)
+        if not self.loaded(container_name):
+            return
+        names = self._names[container_name]
+        if blob_name not in self._entries[container_name]:
+            bisect.insort(names, blob_name)
+        self._entries[container_name][blob_name] = entry
+
+    def remove(self, container_name, blob_name):
+        self._record(container_name, blob_name, None)
+        if not self.loaded(container_name):
+            return
+        if self._entries[container_name].pop(blob_name, None) is not None:
+            names = self._names[container_name]
+            i = bisect.bisect_left(names, blob_name)
+            if i < len(names) and names[i] == blob_name:
+                del names[i]
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+ROW_FIELDS = ("address", "city", "state", "zipcode", "party", "status", "remarks", "summary")
+
+
+def rows_from_response(response):
+    """
+    Rows of a get_pdf_data response: the JSON string {columns, response}
+    (or the already parsed object). Anything that is not a row is dropped.
+    """
+    if isinstance(response, str):
+        try:
+            response = json.loads(response)
+        except json.JSONDecodeError:
+            return []
+    items = response.get("response") if isinstance(response, dict) else response
+    if isinstance(items, dict):
+        items = [items]
+    return [item for item in items or [] if isinstance(item, dict)]
+
+
+class RecordsStore:
+    """
+    Extracted minutes rows (address, party, status, ...) in a local SQLite
+    file, so questions like "all DENIED appeals in 94110 this year" are
+    answered from the rows instead of another completion.
+
+    Rows are keyed by their source document, place and department; storing
+    a document again replaces its rows for that place and department only.
+    """
+    def __init__(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            " id INTEGER PRIMARY KEY, source TEXT NOT NULL, place TEXT, department TEXT, meeting_date TEXT,"
+            " row_index INTEGER NOT NULL, address TEXT, city TEXT, state TEXT, zipcode TEXT,"
+            " party TEXT COLLATE NOCASE, status TEXT, remarks TEXT, summary TEXT, created REAL NOT NULL)"
+        )
+        for name, columns in (
+            ("records_source", "source"),
+            ("records_zipcode", "zipcode, meeting_date"),
+            ("records_status", "status, meeting_date"),
+            ("records_party", "party"),
+            ("records_meeting_date", "meeting_date"),
+            ("records_place", "place, department, meeting_date"),
+        ):
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON records ({columns})")
+
+    def replace(self, source: str, rows, place: str = None, department: str = None, meeting_date: str = None) -> int:
+        """
+        Store the rows extracted from one document, replacing earlier ones
+        stored for the same place and department. Documents of different
+        places often share a file name.
+
+        Returns:
+            int: Number of rows stored.
+        """
+        now = time.time()
+        values = []
+        for i, row in enumerate(rows):
+            fields = {field: row.get(field) for field in ROW_FIELDS}
+            fields = {field: str(value).strip() if value is not None else None for field, value in fields.items()}
+            if fields["status"]:
+                fields["status"] = fields["status"].upper()
+            values.append((source, place, department, meeting_date, row.get("index", i + 1), *fields.values(), now))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "DELETE FROM records WHERE source = ? AND place IS ? AND department IS ?",
+                    (source, place, department),
+                )
+                self._conn.executemany(
+                    "INSERT INTO records (source, place, department, meeting_date, row_index,"
+                    f" {', '.join(ROW_FIELDS)}, created) VALUES ({', '.join('?' for _ in range(len(ROW_FIELDS) + 6))})",
+                    values,
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(values)
+
+    def query(self, place: str = None, department: str = None, zipcode: str = None, status: str = None,
+              party: str = None, since: str = None, until: str = None, source: str = None,
+              limit: int = 100, offset: int = 0):
+        """
+        Filter stored rows. party matches a substring, case-insensitively;
+        since and until are inclusive ISO dates or date prefixes ("2024").
+
+        Returns:
+            dict: {"total", "limit", "offset", "records"}, newest meetings first.
+        """
+        clauses = []
+        params = []
+        for column, value in (("place", place), ("department", department), ("zipcode", zipcode), ("source", source)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status.upper())
+        if party is not None:
+            clauses.append("party LIKE ?")
+            params.append(f"%{party}%")
+        if since is not None:
+            clauses.append("meeting_date >= ?")
+            params.append(since)
+        if until is not None:
+            # Prefix bound: "2024" keeps every 2024 date
+            clauses.append("substr(meeting_date, 1, ?) <= ?")
+            params.extend([len(until), until])
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM records{where}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT * FROM records{where} ORDER BY meeting_date DESC, source, row_index LIMIT ? OFFSET ?",
+                [*params, limit, offset],
+            ).fetchall()
+        return {"total": total, "limit": limit, "offset": offset, "records": [dict(row) for row in rows]}
+
+    async def areplace(self, source: str, rows, place: str = None, department: str = None, meeting_date: str = None) -> int:
+        return await asyncio.to_thread(self.replace, source, rows, place, department, meeting_date)
+
+    async def aquery(self, **filters):
+        return await asyncio.to_thread(self.query, **filters)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
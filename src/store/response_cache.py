@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from src.utils.metrics import CACHE_REQUESTS
+
+
+class ResponseCache:
+    """
+    Content-addressed LLM response cache persisted in a local SQLite file.
+
+    Entries are keyed by a hash of everything that determines a completion
+    (deployment, prompt constants, input text, question), expire after
+    ttl_seconds and are evicted least-recently-used once the stored payloads
+    exceed max_bytes.
+    """
+    def __init__(self, path: str, max_bytes: int, ttl_seconds: int) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str):
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                value, created = row
+                if created + self.ttl_seconds < now:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    return None
+                self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            return json.loads(value)
+        except sqlite3.Error as e:
+            print("Response cache read failed", e)
+            return None
+
+    def set(self, key: str, value) -> None:
+        now = time.time()
+        payload = json.dumps(value)
+        size = len(payload.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        try:
+            with self._lock:
+                # Every worker writes this file, so the total is read inside
+                # the write transaction rather than kept in memory
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                        (key, payload, size, now, now),
+                    )
+                    self._evict(now)
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            print("Response cache write failed", e)
+
+    def _evict(self, now: float) -> None:
+        # Expired entries go first, then least recently used ones.
+        self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        while total > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    async def aget(self, key: str):
+        value = await asyncio.to_thread(self.get, key)
+        CACHE_REQUESTS.inc(cache="responses", result="miss" if value is None else "hit")
+        return value
+
+    async def aset(self, key: str, value) -> None:
+        await asyncio.to_thread(self.set, key, value)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
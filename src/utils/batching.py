@@ -0,0 +1,42 @@
+"""
+Packing of minutes indexes into /chat_explore batches under a token budget.
+"""
+from src.utils.meeting_dates import meeting_date_from_name
+
+
+def plan_batches(documents, token_budget: int, chronological: bool = False):
+    """
+    Pack documents into as few batches as possible without exceeding
+    token_budget per batch. A document larger than the budget gets a batch
+    of its own.
+
+    By default this is first-fit decreasing bin packing. With chronological
+    the documents keep meeting-date order and each batch is a contiguous run
+    of meetings; filling each batch greedily is optimal for that case.
+
+    Args:
+        documents (list): Dicts with at least name and tokens.
+        token_budget (int): Maximum tokens per batch.
+        chronological (bool): Keep meetings in date order.
+
+    Returns:
+        list: One {"tokens", "members"} dict per batch, members being names.
+    """
+    batches = []
+    if chronological:
+        for document in sorted(documents, key=lambda document: (meeting_date_from_name(document["name"]) or '', document["name"])):
+            if not batches or batches[-1]["tokens"] + document["tokens"] > token_budget:
+                batches.append({"tokens": 0, "members": []})
+            batches[-1]["tokens"] += document["tokens"]
+            batches[-1]["members"].append(document["name"])
+        return batches
+    for document in sorted(documents, key=lambda document: document["tokens"], reverse=True):
+        for batch in batches:
+            if batch["tokens"] + document["tokens"] <= token_budget:
+                break
+        else:
+            batch = {"tokens": 0, "members": []}
+            batches.append(batch)
+        batch["tokens"] += document["tokens"]
+        batch["members"].append(document["name"])
+    return batches
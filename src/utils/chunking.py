@@ -0,0 +1,76 @@
+"""
+Token-bounded splitting of extracted minutes for chunked summarization.
+
+Pages are packed into chunks of at most max_tokens. A page that is too big
+on its own is cut at agenda item headings, and an item that is still too
+big is cut at line boundaries.
+"""
+import re
+
+# Lines that open an agenda item: "3. ", "B) ", "Item 4", "AGENDA ITEM NO. 12"
+AGENDA_ITEM = re.compile(
+    r'^(?=\s*(?:\d{1,3}[.)]\s|[A-Z][.)]\s|(?i:(?:agenda\s+)?item)\s+(?i:no\.?\s*)?\d+))',
+    re.MULTILINE,
+)
+
+
+def split_agenda_items(text: str):
+    starts = [match.start() for match in AGENDA_ITEM.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    starts.append(len(text))
+    return [text[start:end] for start, end in zip(starts, starts[1:]) if text[start:end].strip()]
+
+
+def _split_oversized(text: str, max_tokens: int, count_tokens):
+    pieces = []
+    for item in split_agenda_items(text):
+        if count_tokens(item) <= max_tokens:
+            pieces.append(item)
+            continue
+        lines = item.split('\n')
+        line_tokens = [count_tokens(line) + 1 for line in lines]
+        current, size = [], 0
+        for line, tokens in zip(lines, line_tokens):
+            if current and size + tokens > max_tokens:
+                pieces.append('\n'.join(current))
+                current, size = [], 0
+            current.append(line)
+            size += tokens
+        if current:
+            pieces.append('\n'.join(current))
+    return pieces
+
+
+def split_pages(pages, max_tokens: int, count_tokens_batch):
+    """
+    Pack pages into chunks of at most max_tokens tokens (a single line longer
+    than that still becomes its own chunk).
+
+    Args:
+        pages (list): Page texts in document order.
+        max_tokens (int): Token budget per chunk.
+        count_tokens_batch (callable): Maps a list of texts to their token counts.
+
+    Returns:
+        list: Chunk texts in document order.
+    """
+    count_tokens = lambda text: count_tokens_batch([text])[0]
+    pieces = []
+    for page, tokens in zip(pages, count_tokens_batch(pages)):
+        if tokens <= max_tokens:
+            pieces.append((page, tokens))
+        else:
+            split = _split_oversized(page, max_tokens, count_tokens)
+            pieces.extend(zip(split, count_tokens_batch(split)))
+    chunks = []
+    current, size = [], 0
+    for piece, tokens in pieces:
+        if current and size + tokens > max_tokens:
+            chunks.append('\n'.join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += tokens
+    if current:
+        chunks.append('\n'.join(current))
+    return chunks
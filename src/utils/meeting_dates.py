@@ -0,0 +1,35 @@
+"""
+Meeting dates of minutes files. Source PDFs and the meetings inside a
+minutes index are named `{date}_...`, with the date as YYYY-MM-DD or
+YYYYMMDD; everything that sorts or filters by meeting date reads it here.
+"""
+import datetime
+import os
+import re
+
+MEETING_DATE = re.compile(r'^(\d{4})-?(\d{2})-?(\d{2})')
+
+
+def meeting_date_from_name(name: str):
+    """ISO date of a `{date}_...` minutes file name, or None."""
+    match = MEETING_DATE.match(os.path.basename(name or ''))
+    return '-'.join(match.groups()) if match else None
+
+
+def normalize_meeting_date(value: str):
+    """
+    A meeting date given as YYYY-MM-DD or YYYYMMDD, as YYYY-MM-DD; None
+    when it is empty.
+
+    Raises:
+        ValueError: It is not a calendar date in either form.
+    """
+    if not value:
+        return None
+    match = MEETING_DATE.match(value.strip())
+    if match and match.end() == len(value.strip()):
+        try:
+            return datetime.date(*map(int, match.groups())).isoformat()
+        except ValueError:
+            pass
+    raise ValueError(f"date must be YYYY-MM-DD, got {value!r}")
@@ -0,0 +1,214 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Metrics are registered once at import time on REGISTRY and rendered by
+/metrics. Every worker process keeps its own values; Prometheus adds the
+`instance` label when it scrapes each of them.
+
+The endpoint that work is done for (an HTTP route, or a job type for
+background jobs) is kept in a context variable, so deep call sites such as
+the completion dispatcher can label token counts without it being passed
+down.
+"""
+import bisect
+import contextvars
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+current_endpoint = contextvars.ContextVar("current_endpoint", default="none")
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for suffix, key, extra, value in self._samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            return [('', key, (), value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def _samples(self):
+        with self._lock:
+            return [('', key, (), value) for key, value in sorted(self._values.items())]
+
+
+class _Timer:
+    def __init__(self, histogram, labels) -> None:
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def time(self, **labels):
+        """Context manager (usable around awaits too) that observes the elapsed seconds."""
+        return _Timer(self, labels)
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    samples.append(('_bucket', key, (("le", _format_value(bound)),), cumulative))
+                samples.append(('_sum', key, (), total))
+                samples.append(('_count', key, (), cumulative))
+        return samples
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "wj_http_request_duration_seconds",
+    "Time to the response start, per route.",
+    ("method", "route", "status"),
+))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "wj_stage_duration_seconds",
+    "Time spent in internal stages: blob_list, blob_download, pdf_parse, tokenize, llm_call.",
+    ("stage",),
+))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "wj_llm_tokens_total",
+    "Prompt and completion tokens used, per endpoint or job type.",
+    ("endpoint", "kind"),
+))
+LLM_REQUESTS = REGISTRY.register(Counter(
+    "wj_llm_requests_total",
+    "Completion attempts by outcome (ok, throttled, retried_error, failed).",
+    ("outcome",),
+))
+BLOB_BYTES = REGISTRY.register(Counter(
+    "wj_blob_bytes_downloaded_total",
+    "Bytes downloaded from Blob Storage, per container.",
+    ("container",),
+))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "wj_cache_requests_total",
+    "Cache lookups by cache and result (hit or miss).",
+    ("cache", "result"),
+))
+JOBS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "wj_jobs_in_flight",
+    "Background jobs running in this process, per job type.",
+    ("type",),
+))
+
+
+def stage(name: str):
+    """Time a block as one of the STAGE_SECONDS stages."""
+    return STAGE_SECONDS.time(stage=name)
+
+
+def record_usage(usage):
+    """Count an OpenAI usage block against the current endpoint."""
+    if usage is None:
+        return
+    endpoint = current_endpoint.get()
+    LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, endpoint=endpoint, kind="prompt")
+    LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, endpoint=endpoint, kind="completion")
+    # Prompt tokens served from the provider's prompt cache
+    details = getattr(usage, "prompt_tokens_details", None)
+    LLM_TOKENS.inc(getattr(details, "cached_tokens", 0) or 0, endpoint=endpoint, kind="cached_prompt")
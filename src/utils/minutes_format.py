@@ -0,0 +1,126 @@
+"""
+On-blob format of the minutes indexes.
+
+A packed index is
+
+    MAGIC | header length (4 bytes, big endian) | JSON header | segments
+
+where every segment is one meeting's `{filename} \n{text}` section,
+zlib-compressed on its own. The header lists the segments:
+
+    {"version": 1, "segments": [{"name", "date", "offset", "length", "raw_length", "tokens"}]}
+
+with offset relative to the first byte after the header. A reader can
+fetch the header with a small range request and then only the segments it
+needs. Indexes written before this format hold json.dumps(text), or plain
+text; decode_minutes_index still reads those.
+"""
+import json
+import struct
+import zlib
+from src.utils.meeting_dates import meeting_date_from_name
+
+MAGIC = b'WJMI\x00\x01'
+PREFIX_LENGTH = len(MAGIC) + 4
+# First range read of a blob; big enough for the header of a typical index
+HEAD_BYTES = 16 * 1024
+
+
+def encode_minutes_index(sections, level: int = 6) -> bytes:
+    """
+    Args:
+        sections (list): (name, text, tokens) per meeting, in index order.
+            text is the whole `{name} \\n{text}` section.
+    """
+    segments = []
+    payloads = []
+    offset = 0
+    for name, text, tokens in sections:
+        raw = text.encode('utf-8')
+        payload = zlib.compress(raw, level)
+        segments.append({
+            "name": name,
+            "date": meeting_date_from_name(name) or '',
+            "offset": offset,
+            "length": len(payload),
+            "raw_length": len(raw),
+            "tokens": tokens,
+        })
+        payloads.append(payload)
+        offset += len(payload)
+    header = json.dumps({"version": 1, "segments": segments}).encode('utf-8')
+    return MAGIC + struct.pack('>I', len(header)) + header + b''.join(payloads)
+
+
+def is_packed(content: bytes) -> bool:
+    return content[:len(MAGIC)] == MAGIC
+
+
+def header_length(content: bytes) -> int:
+    """Bytes up to the end of the header; content must hold at least PREFIX_LENGTH bytes."""
+    return PREFIX_LENGTH + struct.unpack('>I', content[len(MAGIC):PREFIX_LENGTH])[0]
+
+
+def parse_header(content: bytes):
+    """
+    Returns:
+        list: The segment entries; content must hold the whole header.
+    """
+    return json.loads(content[PREFIX_LENGTH:header_length(content)])["segments"]
+
+
+def decode_segment(payload: bytes) -> str:
+    return zlib.decompress(payload).decode('utf-8')
+
+
+def decode_minutes_index(content: bytes) -> str:
+    """
+    Full text of an index blob in any format: packed, json.dumps(text) or
+    plain text.
+    """
+    if is_packed(content):
+        start = header_length(content)
+        return '\n'.join(
+            decode_segment(content[start + segment["offset"]:start + segment["offset"] + segment["length"]])
+            for segment in parse_header(content)
+        )
+    text = content.decode('utf-8')
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return text
+
+
+def segment_ranges(segments, max_gap: int = 0):
+    """
+    Group segments that are adjacent in the blob (or at most max_gap bytes
+    apart) so each group is fetched with one range request.
+
+    Returns:
+        list: (offset, length, segments) per group, in blob order.
+    """
+    groups = []
+    for segment in sorted(segments, key=lambda segment: segment["offset"]):
+        if groups:
+            offset, length, members = groups[-1]
+            if segment["offset"] - (offset + length) <= max_gap:
+                groups[-1] = (offset, segment["offset"] + segment["length"] - offset, members + [segment])
+                continue
+        groups.append((segment["offset"], segment["length"], [segment]))
+    return groups
+
+
+def select_dates(since: str = None, until: str = None):
+    """
+    Segment filter for meetings dated between since and until, inclusive.
+    Either bound may be a prefix ("2024" or "2024-03") of the ISO dates in
+    the meeting file names.
+    """
+    def select(segment):
+        date = segment["date"]
+        if since is not None and date[:len(since)] < since:
+            return False
+        if until is not None and date[:len(until)] > until:
+            return False
+        return True
+    return select
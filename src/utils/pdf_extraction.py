@@ -0,0 +1,165 @@
+"""
+Shared PDF text extraction engine.
+
+Documents are parsed from a file path, and their pages are extracted in
+parallel on a process pool, so a 200 page packet uses every core instead of
+pinning the calling thread (or the event loop). In-memory bytes are written
+to a temporary file first, so they are not pickled into every range task.
+"""
+import asyncio
+import concurrent.futures
+import io
+import math
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures.process import BrokenProcessPool
+from src.utils.metrics import stage
+
+
+def clean_text(text: str) -> str:
+    text = text.replace('\n\n\n', '\n')
+    text = text.replace('\n\n', '\n')
+    text = text.replace('\n \n', '\n')
+    return text
+
+
+def _open(source):
+    # pypdf is only needed in the pool workers, not in the server process
+    from pypdf import PdfReader
+    # A path is opened by each worker, so big files are never pickled into the pool
+    return PdfReader(io.BytesIO(source) if isinstance(source, bytes) else source)
+
+
+def _spill(data):
+    """
+    Returns:
+        tuple: (source for the workers, temporary path to remove or None).
+    """
+    if not isinstance(data, bytes):
+        return data, None
+    fd, path = tempfile.mkstemp(prefix="pdf-", suffix=".pdf")
+    with os.fdopen(fd, "wb") as file:
+        file.write(data)
+    return path, path
+
+
+def _count_pages(source) -> int:
+    return len(_open(source).pages)
+
+
+def _extract_pages(source, start: int, end: int):
+    reader = _open(source)
+    return [reader.pages[i].extract_text() for i in range(start, end)]
+
+
+class PdfExtractor:
+    """
+    Extracts page texts from PDF bytes (or a PDF file path) on a process pool.
+
+    Each document is split into page ranges of at least pages_per_task
+    pages; every worker re-opens the document from the same path and
+    extracts its range. Page texts are returned in document order.
+    A document that takes longer than timeout seconds raises TimeoutError;
+    ranges that have already started still run to completion in the pool.
+    If a worker dies and breaks the pool, the pool is replaced and the
+    document is tried once more.
+    """
+    def __init__(self, max_workers: int = None, timeout: float = 300, pages_per_task: int = 8) -> None:
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.pages_per_task = pages_per_task
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            # spawn keeps the workers free of the server's threads and sockets
+            self._pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    def _discard(self, pool):
+        # Only the broken pool is dropped; a concurrent caller may already have replaced it
+        if self._pool is pool:
+            print("PDF worker pool broke, starting a new one")
+            self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _ranges(self, number_of_pages: int):
+        size = max(self.pages_per_task, math.ceil(number_of_pages / self.max_workers))
+        return [(start, min(start + size, number_of_pages)) for start in range(0, number_of_pages, size)]
+
+    def extract_pages(self, data, timeout: float = None):
+        with stage("pdf_parse"):
+            source, spilled = _spill(data)
+            try:
+                for attempt in range(2):
+                    pool = self.pool
+                    try:
+                        return self._extract_pages_sync(pool, source, timeout)
+                    except BrokenProcessPool:
+                        self._discard(pool)
+                        if attempt:
+                            raise
+            finally:
+                if spilled:
+                    os.remove(spilled)
+
+    def _extract_pages_sync(self, pool, source, timeout: float = None):
+        timeout = timeout or self.timeout
+        deadline = time.monotonic() + timeout
+        number_of_pages = pool.submit(_count_pages, source).result(timeout)
+        futures = [pool.submit(_extract_pages, source, start, end) for start, end in self._ranges(number_of_pages)]
+        done, not_done = concurrent.futures.wait(futures, timeout=max(deadline - time.monotonic(), 0))
+        if not_done:
+            for future in not_done:
+                future.cancel()
+            raise TimeoutError(f"PDF extraction did not finish within {timeout}s")
+        pages = []
+        for future in futures:
+            pages.extend(future.result())
+        return pages
+
+    async def extract_pages_async(self, data, timeout: float = None):
+        timeout = timeout or self.timeout
+        loop = asyncio.get_running_loop()
+
+        async def extract(pool, source):
+            number_of_pages = await loop.run_in_executor(pool, _count_pages, source)
+            results = await asyncio.gather(*[
+                loop.run_in_executor(pool, _extract_pages, source, start, end)
+                for start, end in self._ranges(number_of_pages)
+            ])
+            return [page for pages in results for page in pages]
+
+        with stage("pdf_parse"):
+            source, spilled = await asyncio.to_thread(_spill, data)
+            try:
+                for attempt in range(2):
+                    pool = self.pool
+                    try:
+                        return await asyncio.wait_for(extract(pool, source), timeout)
+                    except asyncio.TimeoutError:
+                        raise TimeoutError(f"PDF extraction did not finish within {timeout}s")
+                    except BrokenProcessPool:
+                        self._discard(pool)
+                        if attempt:
+                            raise
+            finally:
+                if spilled:
+                    await asyncio.to_thread(os.remove, spilled)
+
+    def extract_text(self, data, timeout: float = None) -> str:
+        return '\n'.join(self.extract_pages(data, timeout))
+
+    async def extract_text_async(self, data, timeout: float = None) -> str:
+        return '\n'.join(await self.extract_pages_async(data, timeout))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,168 @@
+"""
+Lexical retrieval over loaded minutes.
+
+A loaded batch is the concatenation of several minutes indexes, and each
+minutes index is a run of `{filename} \n{text}` sections (see
+AzureManager.write_pdf_as_index). We split it back into meetings, cut each
+meeting into paragraph-sized chunks and rank the chunks with BM25 so /chat
+only sends the parts relevant to the question.
+"""
+import math
+import re
+from collections import Counter
+from src.utils.meeting_dates import meeting_date_from_name
+
+MEETING_HEADER = re.compile(r'^(?P<name>[^\s/]+\.(?:pdf|txt)) ?$', re.MULTILINE | re.IGNORECASE)
+WORD = re.compile(r'[a-z0-9]+')
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it of on or that the this to was were what which who will with".split()
+)
+
+def tokenize(text: str):
+    return [word for word in WORD.findall(text.lower()) if word not in STOPWORDS]
+
+
+class Chunk:
+    def __init__(self, position, meeting, date, text):
+        self.position = position
+        self.meeting = meeting
+        self.date = date
+        self.text = text
+        self.tokens = 0
+
+
+def split_meetings(text: str):
+    """
+    Split loaded minutes into (meeting, date, body) tuples. Text before the
+    first header, or text without any header, becomes a single untitled
+    meeting.
+    """
+    meetings = []
+    headers = list(MEETING_HEADER.finditer(text))
+    if not headers or headers[0].start() > 0:
+        end = headers[0].start() if headers else len(text)
+        if text[:end].strip():
+            meetings.append(('', '', text[:end]))
+    for i, header in enumerate(headers):
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(text)
+        name = header.group('name')
+        meetings.append((name, meeting_date_from_name(name) or '', text[header.end():end]))
+    return meetings
+
+
+def split_minutes(text: str, max_chunk_chars: int = 2000):
+    """
+    Split loaded minutes into chunks by meeting and paragraph. Paragraphs
+    (lines, after the extraction clean-up) are packed into chunks of at most
+    max_chunk_chars; a chunk never spans two meetings.
+    """
+    chunks = []
+    for meeting, date, body in split_meetings(text):
+        current = []
+        size = 0
+        for paragraph in body.split('\n'):
+            if not paragraph.strip():
+                continue
+            if current and size + len(paragraph) > max_chunk_chars:
+                chunks.append(Chunk(len(chunks), meeting, date, '\n'.join(current)))
+                current = []
+                size = 0
+            current.append(paragraph)
+            size += len(paragraph) + 1
+        if current:
+            chunks.append(Chunk(len(chunks), meeting, date, '\n'.join(current)))
+    return chunks
+
+
+class BM25Index:
+    """
+    In-memory Okapi BM25 index over minutes chunks.
+    """
+    def __init__(self, chunks, count_tokens_batch=None, k1: float = 1.5, b: float = 0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = []
+        self.doc_freqs = Counter()
+        lengths = []
+        for chunk in chunks:
+            terms = Counter(tokenize(chunk.text))
+            self.term_freqs.append(terms)
+            self.doc_freqs.update(terms.keys())
+            lengths.append(sum(terms.values()))
+        if count_tokens_batch is not None:
+            for chunk, tokens in zip(chunks, count_tokens_batch([chunk.text for chunk in chunks])):
+                chunk.tokens = tokens
+        else:
+            for chunk in chunks:
+                chunk.tokens = len(chunk.text) // 4
+        self.lengths = lengths
+        self.avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+        self.total_tokens = sum(chunk.tokens for chunk in chunks)
+
+    @classmethod
+    def from_text(cls, text: str, count_tokens_batch=None, max_chunk_chars: int = 2000):
+        return cls(split_minutes(text, max_chunk_chars), count_tokens_batch)
+
+    def idf(self, term):
+        n = len(self.chunks)
+        df = self.doc_freqs.get(term, 0)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, top_k: int = 20):
+        """
+        Returns:
+            list: (score, chunk) pairs, best first, only for chunks that share
+            at least one term with the query.
+        """
+        terms = set(tokenize(query))
+        if not terms or not self.chunks:
+            return []
+        idfs = {term: self.idf(term) for term in terms if term in self.doc_freqs}
+        scored = []
+        for i, freqs in enumerate(self.term_freqs):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / (self.avg_length or 1))
+            for term, idf in idfs.items():
+                tf = freqs.get(term)
+                if tf:
+                    score += idf * tf * (self.k1 + 1) / (tf + norm)
+            if score > 0:
+                scored.append((score, self.chunks[i]))
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return scored[:top_k]
+
+    def select(self, question: str, token_budget: int, top_k: int = 20):
+        """
+        Pick the best ranked chunks that fit in token_budget, returned in
+        their original document order. Falls back to the leading chunks
+        when nothing in the question matches the minutes.
+        """
+        ranked = [chunk for _, chunk in self.search(question, top_k)]
+        if not ranked:
+            ranked = self.chunks
+        selected = []
+        used = 0
+        for chunk in ranked:
+            if used + chunk.tokens > token_budget:
+                continue
+            selected.append(chunk)
+            used += chunk.tokens
+        selected.sort(key=lambda chunk: chunk.position)
+        return selected
+
+
+def render_chunks(chunks) -> str:
+    """
+    Join chunks back into minutes text, repeating the meeting header
+    whenever the meeting changes so the model keeps the dates.
+    """
+    parts = []
+    meeting = None
+    for chunk in chunks:
+        if chunk.meeting != meeting:
+            meeting = chunk.meeting
+            if meeting:
+                parts.append(f'{meeting} ')
+        parts.append(chunk.text)
+    return '\n'.join(parts)
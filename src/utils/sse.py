@@ -0,0 +1,19 @@
+import json
+from fastapi.encoders import jsonable_encoder
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+}
+
+def sse_event(data, event: str = None) -> str:
+    """
+    Format one Server-Sent Event. The payload is always JSON encoded so
+    newlines inside tokens never break the `data:` framing.
+    """
+    message = ''
+    if event is not None:
+        message += f'event: {event}\n'
+    message += f'data: {json.dumps(jsonable_encoder(data))}\n\n'
+    return message
@@ -0,0 +1,49 @@
+"""
+Token counting shared by the indexer, the chat context selection and the
+GPT clients. Encoders are built once per model and reused.
+"""
+import functools
+import os
+from src.utils.metrics import stage
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model: str = "gpt-4o-mini"):
+    # Imported (and the BPE ranks loaded) on first count, not at startup
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        print("Warning: model not found. Using cl100k_base encoding.")
+        return tiktoken.get_encoding("cl100k_base")
+
+
+class Tokenizer:
+    def __init__(self, model: str = "gpt-4o-mini", num_threads: int = None) -> None:
+        self.model = model
+        self.num_threads = num_threads or int(os.getenv("WJ_TOKENIZER_THREADS", "8"))
+
+    @property
+    def encoding(self):
+        return get_encoding(self.model)
+
+    def count(self, text: str) -> int:
+        # encode_ordinary: minutes text may contain things that look like
+        # special tokens, which encode() would reject
+        with stage("tokenize"):
+            return len(self.encoding.encode_ordinary(text))
+
+    def count_batch(self, texts) -> list:
+        """
+        Count tokens of many documents at once; tiktoken spreads the batch
+        over num_threads threads (the encoder releases the GIL).
+        """
+        if not texts:
+            return []
+        with stage("tokenize"):
+            return [len(tokens) for tokens in self.encoding.encode_ordinary_batch(list(texts), num_threads=self.num_threads)]
+
+
+@functools.lru_cache(maxsize=None)
+def get_tokenizer(model: str = "gpt-4o-mini") -> Tokenizer:
+    return Tokenizer(model)
@@ -0,0 +1,205 @@
+"""
+Bounded-memory multipart upload ingestion.
+
+The request body is parsed as it arrives and every file part is written to
+a SpooledUpload: bytes stay in memory up to spool_bytes, then move to a
+named temporary file that the PDF workers open by path. With several files
+the spool_bytes budget is shared, so a request never holds more than
+spool_bytes of its files in memory. Files larger than max_bytes, and
+requests larger than max_total_bytes, are rejected as soon as the limit is
+crossed (or straight away when Content-Length already says so). Plain form
+fields sent with the files are kept on every upload's `fields`, up to
+MAX_FIELD_BYTES each.
+"""
+import asyncio
+import io
+import os
+import tempfile
+from multipart.multipart import MultipartParser, parse_options_header
+
+MAX_FIELD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, max_bytes: int) -> None:
+        super().__init__(f"Upload exceeds the limit of {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+class SpooledUpload:
+    def __init__(self, filename: str, spool_bytes: int, max_bytes: int, directory: str = None) -> None:
+        self.filename = filename
+        self.spool_bytes = spool_bytes
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.size = 0
+        self.fields = {}
+        self.path = None
+        self._buffer = io.BytesIO()
+        self._file = None
+
+    @property
+    def on_disk(self) -> bool:
+        return self._file is not None
+
+    def spill(self):
+        """Move the bytes received so far to a temporary file."""
+        if self._file is None:
+            self._file = tempfile.NamedTemporaryFile(prefix="upload-", dir=self.directory, delete=False)
+            self.path = self._file.name
+            self._file.write(self._buffer.getbuffer())
+            self._buffer = None
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(self.max_bytes)
+        if self._file is None and self.size > self.spool_bytes:
+            self.spill()
+        if self._file is not None:
+            self._file.write(data)
+        else:
+            self._buffer.write(data)
+
+    def finish(self):
+        if self._file is not None:
+            self._file.close()
+
+    def source(self):
+        """
+        The upload as PdfExtractor accepts it: bytes while it is small, the
+        temporary file's path once it was spooled to disk.
+        """
+        return self.path if self.on_disk else self._buffer.getvalue()
+
+    def read_text(self) -> str:
+        if self.on_disk:
+            with open(self.path, encoding='utf-8') as f:
+                return f.read()
+        return self._buffer.getvalue().decode('utf-8')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            os.unlink(self.path)
+            self._file = None
+            self.path = None
+        self._buffer = None
+
+
+async def receive_upload(request, field: str, spool_bytes: int, max_bytes: int, directory: str = None) -> SpooledUpload:
+    """
+    Stream the `field` file part of a multipart/form-data request into a
+    SpooledUpload. Other file parts are ignored; plain fields end up in
+    the upload's `fields`.
+
+    Raises:
+        UploadTooLarge: Content-Length or the bytes received exceed max_bytes.
+        ValueError: The request is not multipart, has no or several `field`
+            parts, or a plain field over MAX_FIELD_BYTES.
+    """
+    uploads = await receive_uploads(request, field, spool_bytes, max_bytes, directory=directory, max_files=1)
+    return uploads[0]
+
+
+async def receive_uploads(request, field: str, spool_bytes: int, max_bytes: int, max_total_bytes: int = None, max_files: int = None, directory: str = None) -> list:
+    """
+    Stream every `field` file part of a multipart/form-data request into a
+    SpooledUpload, in the order they were sent.
+
+    Args:
+        spool_bytes (int): Memory budget shared by all the files.
+        max_bytes (int): Limit per file.
+        max_total_bytes (int): Limit for the whole request; defaults to max_bytes.
+        max_files (int): Most `field` parts accepted.
+
+    Raises:
+        UploadTooLarge: Content-Length or the bytes received exceed a limit.
+        ValueError: The request is not multipart, has no `field` part, more
+            than max_files of them or a plain field over MAX_FIELD_BYTES.
+    """
+    max_total_bytes = max_total_bytes or max_bytes
+    content_length = request.headers.get("content-length")
+    if content_length is not None and content_length.isdigit() and int(content_length) > max_total_bytes:
+        raise UploadTooLarge(max_total_bytes)
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise ValueError("Expected a multipart/form-data upload")
+
+    state = {"header_field": b"", "header_value": b"", "headers": {}, "current": None, "field": None}
+    uploads = []
+    pending = []
+    fields = {}
+
+    def on_header_field(data, start, end):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["header_field"].lower()] = state["header_value"]
+        state["header_field"] = b""
+        state["header_value"] = b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        state["headers"] = {}
+        state["current"] = None
+        state["field"] = None
+        name = options.get(b"name", b"").decode("utf-8")
+        if b"filename" not in options:
+            state["field"] = name
+            fields[name] = b""
+        elif name == field:
+            if max_files is not None and len(uploads) >= max_files:
+                raise ValueError(f"At most {max_files} '{field}' files per upload")
+            state["current"] = SpooledUpload(options[b"filename"].decode("utf-8"), spool_bytes, max_bytes, directory)
+            uploads.append(state["current"])
+
+    def on_part_data(data, start, end):
+        if state["current"] is not None:
+            pending.append((state["current"], data[start:end]))
+        elif state["field"] is not None:
+            fields[state["field"]] += data[start:end]
+            if len(fields[state["field"]]) > MAX_FIELD_BYTES:
+                raise ValueError(f"Form field '{state['field']}' is too large")
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+    })
+    received = 0
+    in_memory = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_total_bytes:
+                raise UploadTooLarge(max_total_bytes)
+            parser.write(chunk)
+            for upload, data in pending:
+                if not upload.on_disk and in_memory + len(data) > spool_bytes:
+                    # Over the shared budget: this file continues on disk
+                    in_memory -= upload.size
+                    await asyncio.to_thread(upload.spill)
+                if upload.on_disk:
+                    await asyncio.to_thread(upload.write, data)
+                else:
+                    upload.write(data)
+                    in_memory += len(data)
+            pending.clear()
+        parser.finalize()
+    except BaseException:
+        for upload in uploads:
+            upload.close()
+        raise
+    if not uploads:
+        raise ValueError(f"Missing file field '{field}'")
+    fields = {name: value.decode("utf-8") for name, value in fields.items()}
+    for upload in uploads:
+        upload.finish()
+        upload.fields = fields
+    return uploads
@@ -0,0 +1,31 @@
+from src.utils.batching import plan_batches
+
+
+def documents(*tokens):
+    return [{"name": f"place/dept/2024-01-{day:02d}_{count}.txt", "tokens": count} for day, count in enumerate(tokens, 1)]
+
+
+def test_first_fit_decreasing_fills_batches():
+    batches = plan_batches(documents(60, 50, 40, 30, 20), 100)
+    assert [batch["tokens"] for batch in batches] == [100, 100]
+    assert all(batch["tokens"] <= 100 for batch in batches)
+    assert sorted(name for batch in batches for name in batch["members"]) == sorted(d["name"] for d in documents(60, 50, 40, 30, 20))
+
+
+def test_oversized_document_gets_its_own_batch():
+    batches = plan_batches(documents(150, 10), 100)
+    assert [batch["tokens"] for batch in batches] == [150, 10]
+
+
+def test_chronological_batches_are_contiguous_runs():
+    docs = documents(60, 50, 40, 30, 20)
+    batches = plan_batches(list(reversed(docs)), 100, chronological=True)
+    assert [batch["members"] for batch in batches] == [
+        [docs[0]["name"]],
+        [docs[1]["name"], docs[2]["name"]],
+        [docs[3]["name"], docs[4]["name"]],
+    ]
+
+
+def test_no_documents():
+    assert plan_batches([], 100) == []
@@ -0,0 +1,70 @@
+import pytest
+from src.store.cache_backends import LocalCacheBackend, SqliteCacheBackend
+
+
+@pytest.fixture(params=["local", "sqlite"])
+def make_backend(request, tmp_path):
+    def make(**limits):
+        if request.param == "local":
+            return LocalCacheBackend(**limits)
+        return SqliteCacheBackend(str(tmp_path / "cache.sqlite3"), "test", **limits)
+    return make
+
+
+def test_entry_cap_evicts_oldest(make_backend):
+    backend = make_backend(max_entries=2)
+    for key in ("a", "b", "c"):
+        backend.set(key, key, 60)
+    assert backend.get("a") is None
+    assert backend.get("b") == "b" and backend.get("c") == "c"
+    assert backend.usage()[0] == 2
+    assert backend.evictions == 1
+
+
+def test_byte_cap_evicts_until_under(make_backend):
+    backend = make_backend(max_bytes=600)
+    for key in ("a", "b", "c"):
+        backend.set(key, "x" * 200, 60, size=250)
+    entries, size = backend.usage()
+    assert size <= 600
+    assert backend.get("a") is None
+    assert backend.get("c") is not None
+
+
+def test_value_over_byte_cap_is_not_cached(make_backend):
+    backend = make_backend(max_bytes=600)
+    backend.set("small", "x" * 100, 60, size=100)
+    backend.set("small", "x" * 1000, 60, size=1000)
+    backend.set("big", "x" * 1000, 60, size=1000)
+    # The oversized value replaces nothing: the stale one is dropped too
+    assert backend.get("small") is None
+    assert backend.get("big") is None
+    assert backend.evictions == 0
+
+
+def test_expired_entries_are_misses(make_backend):
+    backend = make_backend()
+    backend.set("a", "a", -1)
+    assert backend.get("a") is None
+    assert backend.expirations == 1
+
+
+def test_local_eviction_is_least_recently_used():
+    backend = LocalCacheBackend(max_entries=2)
+    backend.set("a", "a", 60)
+    backend.set("b", "b", 60)
+    backend.get("a")
+    backend.set("c", "c", 60)
+    assert backend.get("b") is None
+    assert backend.get("a") == "a"
+
+
+def test_sqlite_reads_refresh_access_time_at_most_once_per_interval(tmp_path):
+    backend = SqliteCacheBackend(str(tmp_path / "cache.sqlite3"), "test", max_entries=2, touch_seconds=3600)
+    backend.set("a", "a", 60)
+    backend.set("b", "b", 60)
+    # Too soon after the write to count as a use, so "a" is still the oldest
+    backend.get("a")
+    backend.set("c", "c", 60)
+    assert backend.get("a") is None
+    assert backend.get("b") == "b"
@@ -0,0 +1,90 @@
+"""
+Retry and backoff of CompletionDispatcher against a stub client. The openai
+error classes are replaced by local ones, so openai need not be installed.
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+import pytest
+from src.client_models import dispatcher as dispatcher_module
+from src.client_models.dispatcher import CompletionDispatcher
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after_ms=None) -> None:
+        super().__init__("429")
+        headers = {"retry-after-ms": str(retry_after_ms)} if retry_after_ms is not None else {}
+        self.response = SimpleNamespace(headers=headers)
+
+
+class Unavailable(Exception):
+    response = None
+
+
+class StubCompletions:
+    def __init__(self, errors) -> None:
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return SimpleNamespace(usage=None, content="ok")
+
+
+@pytest.fixture(autouse=True)
+def stub_errors(monkeypatch):
+    monkeypatch.setattr(dispatcher_module, "retryable_errors", lambda: (RateLimited, Unavailable))
+    monkeypatch.setattr(dispatcher_module, "is_rate_limited", lambda error: isinstance(error, RateLimited))
+
+
+def make_dispatcher(errors, **options):
+    completions = StubCompletions(errors)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    dispatcher = CompletionDispatcher(client, "gpt-4o-mini", base_delay=0.001, max_delay=0.01, **options)
+    # Keeps tiktoken out of the test
+    dispatcher.estimate_tokens = lambda messages, max_tokens: 1
+    return dispatcher, completions
+
+
+def complete(dispatcher):
+    return asyncio.run(dispatcher.complete([{"role": "user", "content": "hi"}], 10))
+
+
+def test_rate_limit_is_retried_after_retry_after():
+    dispatcher, completions = make_dispatcher([RateLimited(retry_after_ms=50)], max_concurrency=8)
+    started = time.monotonic()
+    response = complete(dispatcher)
+    assert response.content == "ok"
+    assert completions.calls == 2
+    assert time.monotonic() - started >= 0.05
+    assert dispatcher.stats["throttled"] == 1
+    assert dispatcher.stats["retries"] == 1
+    # AIMD: the 429 halved the concurrency limit
+    assert dispatcher.limiter.limit == 4
+    assert dispatcher.limiter.in_flight == 0
+
+
+def test_server_errors_are_retried_without_throttling():
+    dispatcher, completions = make_dispatcher([Unavailable(), Unavailable()], max_concurrency=8)
+    complete(dispatcher)
+    assert completions.calls == 3
+    assert dispatcher.stats["throttled"] == 0
+    assert dispatcher.limiter.limit == 8
+
+
+def test_gives_up_after_max_retries():
+    dispatcher, completions = make_dispatcher([RateLimited()] * 3, max_retries=2)
+    with pytest.raises(RateLimited):
+        complete(dispatcher)
+    assert completions.calls == 3
+    assert dispatcher.stats["failures"] == 1
+    assert dispatcher.limiter.in_flight == 0
+
+
+def test_other_errors_are_not_retried():
+    dispatcher, completions = make_dispatcher([ValueError("bad request")])
+    with pytest.raises(ValueError):
+        complete(dispatcher)
+    assert completions.calls == 1
@@ -0,0 +1,42 @@
+from src.connectors.index_manifest import IndexManifest
+
+
+def manifest():
+    index = IndexManifest("springfield")
+    index.record("planning", "2024-01-10", {"planning/2024-01-10_a.pdf": "1"}, "springfield/planning/2024-01-10_100.txt", 100)
+    index.record("planning", "2024-02-14", {"planning/2024-02-14_a.pdf": "1"}, "springfield/planning/2024-02-14_100.txt", 100)
+    index.record("zoning", "2024-01-10", {"zoning/2024-01-10_a.pdf": "1"}, "springfield/zoning/2024-01-10_100.txt", 100)
+    return index
+
+
+def test_plan_sorts_prefixes_by_change():
+    current = {
+        ("planning", "2024-01-10"): {"planning/2024-01-10_a.pdf": "1"},
+        ("planning", "2024-02-14"): {"planning/2024-02-14_a.pdf": "2"},
+        ("planning", "2024-03-13"): {"planning/2024-03-13_a.pdf": "1"},
+    }
+    assert manifest().plan(current) == {
+        "added": [("planning", "2024-03-13")],
+        "changed": [("planning", "2024-02-14")],
+        "deleted": [("zoning", "2024-01-10")],
+        "unchanged": [("planning", "2024-01-10")],
+    }
+
+
+def test_added_source_changes_prefix():
+    current = {("planning", "2024-01-10"): {"planning/2024-01-10_a.pdf": "1", "planning/2024-01-10_b.pdf": "1"}}
+    assert manifest().plan(current)["changed"] == [("planning", "2024-01-10")]
+
+
+def test_force_rebuilds_every_current_prefix():
+    current = {("planning", "2024-01-10"): {"planning/2024-01-10_a.pdf": "1"}}
+    plan = manifest().plan(current, force=True)
+    assert plan["changed"] == [("planning", "2024-01-10")]
+    assert plan["unchanged"] == []
+
+
+def test_record_and_remove():
+    index = manifest()
+    assert index.get("zoning", "2024-01-10")["tokens"] == 100
+    index.remove("zoning", "2024-01-10")
+    assert index.get("zoning", "2024-01-10") is None
@@ -0,0 +1,17 @@
+import pytest
+from src.utils.meeting_dates import meeting_date_from_name, normalize_meeting_date
+
+
+def test_normalize_meeting_date():
+    assert normalize_meeting_date("2024-03-13") == "2024-03-13"
+    assert normalize_meeting_date("20240313") == "2024-03-13"
+    assert normalize_meeting_date("") is None
+    assert normalize_meeting_date(None) is None
+    for value in ("03/13/2024", "2024-13-01", "2024-03-13T10:00", "2024"):
+        with pytest.raises(ValueError):
+            normalize_meeting_date(value)
+
+
+def test_meeting_date_from_name():
+    assert meeting_date_from_name("springfield/planning/20240313_agenda.pdf") == "2024-03-13"
+    assert meeting_date_from_name("agenda.pdf") is None
@@ -0,0 +1,67 @@
+import json
+from src.utils.minutes_format import (
+    HEAD_BYTES,
+    decode_minutes_index,
+    decode_segment,
+    encode_minutes_index,
+    header_length,
+    is_packed,
+    parse_header,
+    segment_ranges,
+    select_dates,
+)
+
+SECTIONS = [
+    ("2024-01-10_council.pdf", "2024-01-10_council.pdf \nBudget approved.", 5),
+    ("2024-02-14_council.pdf", "2024-02-14_council.pdf \nAppeal denied.", 4),
+    ("2024-03-13_council.pdf", "2024-03-13_council.pdf \nNo quorum.", 3),
+]
+
+
+def test_packed_index_round_trip():
+    content = encode_minutes_index(SECTIONS)
+    assert is_packed(content)
+    assert header_length(content) < HEAD_BYTES
+    segments = parse_header(content)
+    assert [segment["date"] for segment in segments] == ["2024-01-10", "2024-02-14", "2024-03-13"]
+    assert [segment["tokens"] for segment in segments] == [5, 4, 3]
+    assert decode_minutes_index(content) == '\n'.join(text for _, text, _ in SECTIONS)
+
+
+def test_segments_decode_from_their_byte_range():
+    content = encode_minutes_index(SECTIONS)
+    start = header_length(content)
+    for segment, (_, text, _) in zip(parse_header(content), SECTIONS):
+        payload = content[start + segment["offset"]:start + segment["offset"] + segment["length"]]
+        assert decode_segment(payload) == text
+
+
+def test_older_formats_still_decode():
+    assert decode_minutes_index(json.dumps("a\nb").encode('utf-8')) == "a\nb"
+    assert decode_minutes_index(b"plain text") == "plain text"
+
+
+def test_adjacent_segments_share_a_range():
+    segments = parse_header(encode_minutes_index(SECTIONS))
+    ranges = segment_ranges([segments[2], segments[0], segments[1]])
+    assert len(ranges) == 1
+    offset, length, members = ranges[0]
+    assert (offset, length) == (0, sum(segment["length"] for segment in segments))
+    assert members == segments
+    gapped = segment_ranges([segments[0], segments[2]])
+    assert [members for _, _, members in gapped] == [[segments[0]], [segments[2]]]
+    assert len(segment_ranges([segments[0], segments[2]], max_gap=segments[1]["length"])) == 1
+
+
+def test_select_dates_accepts_prefixes():
+    segments = parse_header(encode_minutes_index(SECTIONS))
+    select = select_dates(since="2024-02", until="2024-03-01")
+    assert [segment["date"] for segment in segments if select(segment)] == ["2024-02-14"]
+    assert all(select_dates()(segment) for segment in segments)
+    assert [segment["date"] for segment in segments if select_dates(until="2024-01")(segment)] == ["2024-01-10"]
+
+
+def test_header_dates_are_iso():
+    content = encode_minutes_index([("20240313_council.pdf", "20240313_council.pdf \nNo quorum.", 3)])
+    assert parse_header(content)[0]["date"] == "2024-03-13"
+    assert select_dates(since="2024-03")(parse_header(content)[0])
@@ -0,0 +1,42 @@
+import asyncio
+from src.store.prefix_index import BlobPrefixIndex
+
+
+class SlowListing:
+    """Lists a fixed set of blobs, pausing until released."""
+    def __init__(self, names) -> None:
+        self.names = names
+        self.release = None
+
+    async def list_blob_properties(self, container_name):
+        names = list(self.names)
+        if self.release is not None:
+            await self.release.wait()
+        return [{"name": name, "etag": None, "last_modified": None, "size": None} for name in names]
+
+
+def test_patches_during_a_load_survive_the_swap():
+    async def scenario():
+        client = SlowListing(["p/d/2024-01-10_100.txt", "p/d/2024-02-14_200.txt"])
+        index = BlobPrefixIndex(client, ["minutes"])
+        await index.load("minutes")
+        client.release = asyncio.Event()
+        reload = asyncio.create_task(index.load("minutes"))
+        await asyncio.sleep(0)
+        # Written and deleted after the reload took its listing
+        index.upsert("minutes", "p/d/2024-03-13_300.txt")
+        index.remove("minutes", "p/d/2024-01-10_100.txt")
+        client.release.set()
+        await reload
+        return index
+
+    index = asyncio.run(scenario())
+    assert index.names("minutes", "p/d/") == ["p/d/2024-02-14_200.txt", "p/d/2024-03-13_300.txt"]
+    assert index.query("minutes", "p/d/2024-03")[0]["tokens"] == 300
+
+
+def test_prefix_query():
+    index = BlobPrefixIndex(SlowListing(["a/x_1.txt", "a/y_2.txt", "b/z_3.txt"]), ["minutes"])
+    asyncio.run(index.load("minutes"))
+    assert index.names("minutes", "a/") == ["a/x_1.txt", "a/y_2.txt"]
+    assert index.names("minutes", "c/") == []
@@ -0,0 +1,18 @@
+import pytest
+from src.store.records import RecordsStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    records = RecordsStore(str(tmp_path / "records.sqlite3"))
+    yield records
+    records.close()
+
+
+def test_replace_is_scoped_to_place_and_department(store):
+    store.replace("2024-03-13_agenda.pdf", [{"status": "denied"}], "springfield", "planning", "2024-03-13")
+    store.replace("2024-03-13_agenda.pdf", [{"status": "approved"}], "shelbyville", "planning", "2024-03-13")
+    store.replace("2024-03-13_agenda.pdf", [{"status": "approved"}, {"status": "approved"}], "springfield", "planning", "2024-03-13")
+    assert store.query(place="springfield")["total"] == 2
+    assert store.query(place="shelbyville")["total"] == 1
+    assert store.query(status="denied")["total"] == 0
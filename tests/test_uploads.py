@@ -0,0 +1,78 @@
+"""
+Request validation of the upload endpoints. Nothing here reaches Azure:
+the requests are rejected before any extraction starts.
+"""
+import importlib
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    data = tmp_path_factory.mktemp("data")
+    # monkeypatch is function scoped; this undoes the variables after the module
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        # Read by src.api.main at import time
+        for name, value in {
+            "WJ_UPLOAD_MAX_MB": "1",
+            "WJ_UPLOAD_SPOOL_MB": "1",
+            "WJ_CACHE_BACKEND": "local",
+            "WJ_RESPONSE_CACHE_PATH": "",
+            "WJ_JOBS_PATH": str(data / "jobs.sqlite3"),
+            "WJ_RECORDS_PATH": str(data / "records.sqlite3"),
+        }.items():
+            monkeypatch.setenv(name, value)
+        main = importlib.import_module("src.api.main")
+        # Not used as a context manager, so startup (index loading) does not run
+        yield TestClient(main.app)
+
+
+def test_extract_text_rejects_large_content_length(client):
+    response = client.post(
+        "/extract_text",
+        files={"file": ("minutes.pdf", b"x" * (2 * 1024 * 1024), "application/pdf")},
+    )
+    assert response.status_code == 413
+
+
+def test_extract_text_rejects_large_streamed_body(client):
+    def body():
+        yield b"--XX\r\nContent-Disposition: form-data; name=\"file\"; filename=\"minutes.pdf\"\r\n\r\n"
+        for _ in range(32):
+            yield b"x" * (64 * 1024)
+        yield b"\r\n--XX--\r\n"
+
+    # No Content-Length: the limit is enforced while streaming
+    response = client.post(
+        "/extract_text",
+        content=body(),
+        headers={"Content-Type": "multipart/form-data; boundary=XX"},
+    )
+    assert response.status_code == 413
+
+
+def test_extract_text_rejects_non_multipart(client):
+    response = client.post("/extract_text", json={"file": "minutes.pdf"})
+    assert response.status_code == 400
+
+
+def test_extract_text_requires_file_field(client):
+    response = client.post("/extract_text", files={"other": ("minutes.pdf", b"%PDF-1.4", "application/pdf")})
+    assert response.status_code == 400
+
+
+def test_batch_rejects_too_many_files(client, monkeypatch):
+    main = importlib.import_module("src.api.main")
+    monkeypatch.setattr(main, "UPLOAD_BATCH_MAX_FILES", 2)
+    files = [("files", (f"{i}.pdf", b"%PDF-1.4", "application/pdf")) for i in range(3)]
+    response = client.post("/extract_text/batch", files=files)
+    assert response.status_code == 400
+
+
+def test_extract_text_rejects_invalid_date(client):
+    response = client.post(
+        "/extract_text",
+        files={"file": ("minutes.pdf", b"%PDF-1.4", "application/pdf")},
+        data={"date": "03/13/2024"},
+    )
+    assert response.status_code == 400